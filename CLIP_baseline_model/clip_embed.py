@@ -1,22 +1,42 @@
 import os
+import argparse
+import hashlib
+import json
+import logging
+from time import perf_counter
 import pandas as pd
 import torch
 from torch.utils.data import Dataset, DataLoader
-from torchvision import transforms
 from transformers import CLIPProcessor, CLIPModel, pipeline
 from PIL import Image
 import pymysql
+from dbutils.pooled_db import PooledDB
 from dotenv import load_dotenv
-import json
 
-torch_dtype = torch.float16
+IMAGE_PATH = os.getenv("IMG_FOLDER_PATH", r"C:\Users\admin\Desktop\　\development\Resource\imgs")
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-clip = CLIPModel.from_pretrained("openai/clip-vit-large-patch14").to(device)
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
-summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6", device=0 if torch.cuda.is_available() else -1)
-tokenizer = clip_processor.tokenizer
+torch_dtype = torch.float16 if device.type == "cuda" else torch.float32
+
+# Models are loaded in main(), DataLoader workers only need the processor (passed through collate_fn).
+clip = None
+clip_processor = None
+summarizer = None
+tokenizer = None
 
 
+def load_models(quantize=False):
+    """
+    Load CLIP (fp16 on GPU) and the summarizer. With `quantize` on CPU, the Linear layers of CLIP are
+    dynamically quantized to int8, which is where most of the CPU inference time goes.
+    """
+    global clip, clip_processor, summarizer, tokenizer
+    clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
+    tokenizer = clip_processor.tokenizer
+    clip = CLIPModel.from_pretrained("openai/clip-vit-large-patch14", torch_dtype=torch_dtype).to(device).eval()
+    if quantize and device.type == "cpu":
+        clip = torch.ao.quantization.quantize_dynamic(clip, {torch.nn.Linear}, dtype=torch.qint8)
+    summarizer = pipeline("summarization", model="sshleifer/distilbart-cnn-12-6", device=0 if torch.cuda.is_available() else -1)
+
 
 # TODO: Change the print to logger.
 
@@ -91,61 +111,205 @@ def close_connection(connection):
         print(f"Error closing the connection: {e}")
 
 
-def summarize_text(text, summarizer):
-    summary = summarizer(text, max_length=64, min_length=32, do_sample=False)
-    return summary[0]['summary_text']
+def create_pool(max_connections=4):
+    load_dotenv()
+    return PooledDB(
+        creator=pymysql,
+        maxconnections=max_connections,
+        blocking=True,
+        ping=1,
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+        port=int(os.getenv("DB_PORT", 3306)),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def write_embeddings(pool, rows):
+    """
+    rows: [(item_id, image_feature, text_feature, similarity), ...] with features as float16 bytes.
+    One executemany per batch instead of one connection and INSERT per row.
+    """
+    sql = ("INSERT INTO clip_embeddings(item_id, image_feature, text_feature, similarity) VALUES (%s, %s, %s, %s) "
+           "ON DUPLICATE KEY UPDATE image_feature = VALUES(image_feature), text_feature = VALUES(text_feature), "
+           "similarity = VALUES(similarity)")
+    connection = pool.connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        logging.exception(f"Error inserting {len(rows)} CLIP embeddings (items {rows[0][0]}..{rows[-1][0]})")
+        raise
+    finally:
+        connection.close()
+
+
+def load_summary_cache(path):
+    """description hash -> summary, from the append-only JSONL written by summarize_long_descriptions."""
+    cache = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:  # a run interrupted mid-write leaves a partial last line
+                    continue
+                cache[entry["hash"]] = entry["summary"]
+    return cache
+
+
+def summarize_long_descriptions(df, cache_path="summary_cache.jsonl", batch_size=32, max_tokens=64):
+    """
+    Replace descriptions longer than CLIP's `max_tokens` with a summary.
+    All descriptions are tokenized in one batch call to find the long ones. Unseen texts are summarized in
+    buckets of similar token length (little padding per batch), and every bucket is appended to the cache
+    keyed by the SHA-256 of the description, so re-runs and duplicate descriptions skip the summarizer.
+    """
+    descriptions = df['description'].fillna("").astype(str).tolist()
+    lengths = [len(ids) for ids in tokenizer(descriptions, truncation=False)["input_ids"]]
+    long_texts = {hashlib.sha256(text.encode("utf-8")).hexdigest(): (text, length)
+                  for text, length in zip(descriptions, lengths) if length > max_tokens}
+
+    cache = load_summary_cache(cache_path)
+    pending = sorted(((key, text, length) for key, (text, length) in long_texts.items() if key not in cache),
+                     key=lambda entry: entry[2])
+    print(f"{len(long_texts)} long descriptions, {len(long_texts) - len(pending)} cached, {len(pending)} to summarize")
+
+    started = perf_counter()
+    for i in range(0, len(pending), batch_size):
+        bucket = pending[i:i + batch_size]
+        summaries = summarizer([text for _, text, _ in bucket], max_length=64, min_length=32, do_sample=False,
+                               truncation=True, batch_size=batch_size)
+        with open(cache_path, "a", encoding="utf-8") as f:
+            for (key, _, _), summary in zip(bucket, summaries):
+                cache[key] = summary['summary_text']
+                f.write(json.dumps({"hash": key, "summary": cache[key]}, ensure_ascii=False) + "\n")
+    if pending:
+        print(f"Summarized {len(pending)} descriptions in {perf_counter() - started:.1f}s")
 
-sql = 'SELECT item_id, description FROM item_info LIMIT 10'
-conn = connect_to_db()
-id_description = get_data_from_db_using_sql(conn, sql)
-df = pd.DataFrame(id_description)
+    df['description'] = [cache.get(hashlib.sha256(text.encode("utf-8")).hexdigest(), text) if length > max_tokens
+                         else text for text, length in zip(descriptions, lengths)]
+    return df
 
-for index, row in df.iterrows():
-    tokens = None
-    description = row['description']
-    tokens = tokenizer(description, truncation=False, return_tensors="pt")
-    if tokens.input_ids.shape[1] > 64:
-        summarized_description = summarize_text(description, summarizer)
-        df.at[index, 'description'] = summarized_description
 
 class EmbeddingsDataset(Dataset):
-    def __init__(self, df, transform=None):
-        self.data = df
-        self.transform = transform
-        self.IMAGE_PATH  = r"C:\Users\admin\Desktop\　\development\Resource\imgs"
+    """Only opens and decodes images, so the expensive part runs in the DataLoader workers."""
+
+    def __init__(self, df, image_path=IMAGE_PATH):
+        self.item_ids = df['item_id'].tolist()
+        self.descriptions = df['description'].tolist()
+        self.IMAGE_PATH = image_path
 
     def __len__(self):
-        return len(self.data)
+        return len(self.item_ids)
 
     def __getitem__(self, idx):
-        item = self.data.iloc[idx]
-        item_id = item['item_id']
-        description = item['description']
+        item_id = self.item_ids[idx]
         image_path = os.path.join(self.IMAGE_PATH, f"{item_id}.jpg")
-        image = Image.open(image_path)
-        if self.transform:
-            image = self.transform(image)  
-        description = tokenizer(description, return_tensors="pt", truncation=True, padding='max_length').to(device)
-        image = clip_processor(images=image, return_tensors="pt").to(device)      
-        return item_id, image, description
-
-dataset = EmbeddingsDataset(df, transform=transforms.ToTensor())
-dataloader = DataLoader(dataset, batch_size=64, shuffle=False)
-
-
-clip.eval()
-with torch.no_grad():
-    for item_id, images, descriptions in dataloader:
-        image_features = clip.get_image_features(images)
-        text_features = clip.get_text_features(descriptions)
-        similarities = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-        similarities = similarities.cpu().numpy().astype(float).round(3)
-        for i in range(len(item_id)):
-            image_feature_json = json.dumps(image_features[i].cpu().numpy().tolist())
-            text_feature_json = json.dumps(text_features[i].cpu().numpy().tolist())
-            similarity = similarities[i]
-            sql = f"INSERT INTO clip_embeddings(item_id, image_feature, text_feature, similarity) VALUES ({item_id[i]}, '{image_feature_json}', '{text_feature_json}', '{similarity}')"
-            connect = connect_to_db()
-            update_data_in_db_using_sql(connect, sql)
-            close_connection(connect)
-        
+        image = Image.open(image_path).convert("RGB")
+        return item_id, image, self.descriptions[idx]
+
+
+class ClipCollate:
+    """Batched preprocessing: one tokenizer call and one image-processor call per batch (runs in the workers)."""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __call__(self, batch):
+        item_ids, images, descriptions = zip(*batch)
+        text = self.processor.tokenizer(list(descriptions), return_tensors="pt", truncation=True, padding=True)
+        pixels = self.processor(images=list(images), return_tensors="pt")
+        return list(item_ids), pixels["pixel_values"], text
+
+
+def embed(dataloader, pool=None, limit=None):
+    """Run CLIP over the dataloader, write float16 features in binary, returns (items, seconds)."""
+    items = 0
+    started = perf_counter()
+    with torch.inference_mode():
+        for item_ids, pixel_values, text in dataloader:
+            pixel_values = pixel_values.to(device, dtype=torch_dtype, non_blocking=True)
+            text = {k: v.to(device, non_blocking=True) for k, v in text.items()}
+            image_features = clip.get_image_features(pixel_values=pixel_values)
+            text_features = clip.get_text_features(**text)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            # Cosine similarity of each image with its own description
+            similarities = (image_features * text_features).sum(dim=-1)
+
+            image_features = image_features.to(torch.float16).cpu().numpy()
+            text_features = text_features.to(torch.float16).cpu().numpy()
+            similarities = similarities.float().cpu().numpy().round(3)
+            if pool is not None:
+                rows = [(int(item_ids[i]), image_features[i].tobytes(), text_features[i].tobytes(), float(similarities[i]))
+                        for i in range(len(item_ids))]
+                write_embeddings(pool, rows)
+            items += len(item_ids)
+            if limit and items >= limit:
+                break
+    return items, perf_counter() - started
+
+
+def benchmark(df, batch_size, num_workers):
+    """Images/sec of decoding + preprocessing alone, and of the full embedding loop (no DB writes)."""
+    dataloader = make_dataloader(df, batch_size, num_workers)
+    started = perf_counter()
+    decoded = sum(len(batch[0]) for batch in dataloader)
+    decode_seconds = perf_counter() - started
+    items, seconds = embed(make_dataloader(df, batch_size, num_workers))
+    print(f"device={device.type} dtype={torch_dtype} batch_size={batch_size} workers={num_workers}")
+    print(f"decode+preprocess: {decoded / decode_seconds:.1f} images/s")
+    print(f"end-to-end:        {items / seconds:.1f} images/s ({items} images in {seconds:.1f}s)")
+
+
+def make_dataloader(df, batch_size, num_workers):
+    return DataLoader(EmbeddingsDataset(df), batch_size=batch_size, shuffle=False, num_workers=num_workers,
+                      collate_fn=ClipCollate(clip_processor), pin_memory=device.type == "cuda",
+                      persistent_workers=False, prefetch_factor=4 if num_workers else None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed catalog images and descriptions with CLIP.")
+    parser.add_argument("--limit", type=int, default=10, help="Items to read from item_info (0 = all)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count() or 2, help="Image decoding workers")
+    parser.add_argument("--quantize", action="store_true", help="Dynamic int8 quantization of CLIP (CPU only)")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads on CPU")
+    parser.add_argument("--summary-cache", default="summary_cache.jsonl", help="Summaries keyed by description hash")
+    parser.add_argument("--summary-batch-size", type=int, default=32)
+    parser.add_argument("--benchmark", action="store_true", help="Measure images/sec without writing to the DB")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    load_models(quantize=args.quantize)
+
+    sql = 'SELECT item_id, description FROM item_info'
+    if args.limit:
+        sql += f' LIMIT {int(args.limit)}'
+    conn = connect_to_db()
+    id_description = get_data_from_db_using_sql(conn, sql)
+    close_connection(conn)
+    df = pd.DataFrame(id_description)
+    df = summarize_long_descriptions(df, cache_path=args.summary_cache, batch_size=args.summary_batch_size)
+
+    if args.benchmark:
+        benchmark(df, args.batch_size, args.num_workers)
+        return
+
+    pool = create_pool()
+    items, seconds = embed(make_dataloader(df, args.batch_size, args.num_workers), pool=pool)
+    print(f"Embedded {items} items in {seconds:.1f}s ({items / max(seconds, 1e-9):.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Export the CLIP image features of `clip_embeddings` into a memory-mappable matrix for the app's rerank stage.
+
+Writes `item_ids.npy` (sorted int64) and `image_features.npy` (float16, one L2-normalized row per item, same
+order) into a new generation directory `<output>/<timestamp>_<random>/`. The app memory-maps the matrix
+(CLIP_RERANK_PATH=<output>), so only the candidate rows of a request are read. Rows are streamed from MySQL.
+Once the generation is complete, `<output>/CURRENT` is atomically replaced with its name, so a worker opening
+the features during an export sees either the previous generation or the new one, never a missing or
+half-written matrix. The previous generation is kept for workers that still have it mapped.
+Features are stored as little-endian float16 bytes (db_initialize/clip_embeddings.sql), rows written before
+that format hold JSON arrays and are decoded as well.
+
+Example:
+    python export_image_features.py --output clip_features
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pymysql
+from dotenv import load_dotenv
+from numpy.lib.format import open_memmap
+
+FEATURE_DIM = 768  # CLIP ViT-L/14 projection dimension
+POINTER = "CURRENT"  # file naming the published generation, read by app/src/services/generation.py
+GENERATION_NAME = re.compile(r"\d{14}(_[0-9a-f]{8})?")  # new_generation_name(), older exports had no suffix
+
+
+def connect_to_db():
+    # Same connection as clip_embed.py, without importing torch/transformers
+    load_dotenv()
+    return pymysql.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        db=os.getenv("DB_NAME"),
+        port=int(os.getenv("DB_PORT", 3306)),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def count_rows(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM clip_embeddings WHERE image_feature IS NOT NULL")
+        return cursor.fetchone()["n"]
+
+
+def decode_features(values, dim):
+    """
+    # *@param values: image_feature column values, float16 bytes or legacy JSON arrays
+    # *@return: (len(values), dim) float32 block
+    """
+    if all(isinstance(value, (bytes, bytearray)) and value[:1] != b"[" for value in values):
+        wrong = [len(value) for value in values if len(value) != 2 * dim]
+        if wrong:
+            raise ValueError(f"image_feature of {len(wrong)} rows is {wrong[0]} bytes, expected {2 * dim} "
+                             f"(float16 x {dim}), check --dim")
+        return np.frombuffer(b"".join(values), dtype="<f2").reshape(len(values), dim).astype(np.float32)
+    block = np.zeros((len(values), dim), dtype=np.float32)
+    for i, value in enumerate(values):
+        if isinstance(value, (bytes, bytearray)) and value[:1] != b"[":
+            block[i] = np.frombuffer(value, dtype="<f2")
+            continue
+        try:
+            block[i] = json.loads(value)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"image_feature row {i} of the chunk is neither float16 x {dim} nor a JSON array "
+                             f"of {dim} floats: {e}") from e
+    return block
+
+
+def new_generation_name():
+    """Timestamp (sorts by age) plus a random suffix, so two exports started in the same second never collide."""
+    return f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def publish(output, generation, keep=2):
+    """Atomically point `<output>/CURRENT` at `generation`, then remove all but the `keep` newest generations."""
+    pointer = os.path.join(output, POINTER)
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{pointer}.tmp", pointer)
+    generations = sorted((name for name in os.listdir(output)
+                          if name != generation and GENERATION_NAME.fullmatch(name)
+                          and os.path.isdir(os.path.join(output, name))),
+                         key=lambda name: (name[:14], os.path.getmtime(os.path.join(output, name))))
+    for name in generations[:max(0, len(generations) - (keep - 1))]:
+        shutil.rmtree(os.path.join(output, name), ignore_errors=True)
+
+
+def export(connection, output, dim=FEATURE_DIM, chunk_size=10000):
+    n = count_rows(connection)
+    generation = new_generation_name()
+    tmp = os.path.join(output, f"{generation}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    item_ids = np.zeros(n, dtype=np.int64)
+    features = open_memmap(os.path.join(tmp, "image_features.npy"), mode="w+", dtype=np.float16, shape=(n, dim))
+
+    written = 0
+    with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+        cursor.execute("SELECT item_id, image_feature FROM clip_embeddings "
+                       "WHERE image_feature IS NOT NULL ORDER BY item_id")
+        while written < n:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            block = decode_features([row[1] for row in rows], dim)
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            features[written:written + len(rows)] = block / np.where(norms > 0, norms, 1)
+            item_ids[written:written + len(rows)] = [row[0] for row in rows]
+            written += len(rows)
+            print(f"Exported {written}/{n} image features")
+    features.flush()
+    del features
+
+    if written < n:  # rows deleted during the export
+        matrix = np.load(os.path.join(tmp, "image_features.npy"))[:written]
+        np.save(os.path.join(tmp, "image_features.npy"), matrix)
+    np.save(os.path.join(tmp, "item_ids.npy"), item_ids[:written])
+
+    os.replace(tmp, os.path.join(output, generation))
+    publish(output, generation)
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export CLIP image features to a memory-mappable matrix.")
+    parser.add_argument("--output", default="clip_features")
+    parser.add_argument("--dim", type=int, default=FEATURE_DIM)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    connection = connect_to_db()
+    try:
+        written = export(connection, args.output, dim=args.dim, chunk_size=args.chunk_size)
+    finally:
+        connection.close()
+    print(f"{written} image features written to {args.output}, set CLIP_RERANK_PATH={os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,56 @@
-from flask import Flask, render_template, request, flash, redirect, url_for
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, make_response
 from src.extensions.milvus_connection import init_milvus
-from src.services.consulting_service import consulting_main
+from src.services.consulting_service import consulting_main, prompt_cache_stats
+from src.services.item_metadata import get_item_metadata
+from src.services.micro_batcher import batcher_stats
+from src.services.speculation import speculation_stats
+from src.services.admission import get_admission
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 
+# Reverse proxies in front of the app that append to X-Forwarded-For (0: clients connect directly).
+# Only that many entries, counted from the right, are trusted, anything a client sends itself is ignored.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
 
-def create_app():
+
+def client_id() -> str:
+    # Peer address, already rewritten by ProxyFix to the address the trusted proxies saw
+    return request.remote_addr or 'unknown'
+
+
+def safe_link(link) -> str:
+    """Template filter: the catalog link when it is an http(s) URL, else '' (no javascript: or data: hrefs)."""
+    link = str(link or '').strip()
+    return link if link.lower().startswith(('http://', 'https://')) else ''
+
+
+def busy_response(rejection):
+    if rejection.status == 429:
+        message = f"You are sending requests too quickly, please retry in {rejection.retry_after} seconds."
+    else:
+        message = f"Our consultant is busy right now, please retry in {rejection.retry_after} seconds."
+    response = make_response(message, rejection.status)
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
+
+def create_app(connect: bool = True):
+    """
+    connect=False leaves every connection to the worker processes (wsgi.py / gunicorn.conf.py post_fork).
+    """
     app = Flask(__name__)
     app.secret_key = 'YOUR_SECRET_KEY'  # Replace with something secure in production
+    app.add_template_filter(safe_link)
+    if TRUSTED_PROXY_HOPS > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
     
     # Initialize extensions
-    init_milvus()
+    if connect:
+        init_milvus()
+        # Optionally create every client now instead of on the first request
+        if os.getenv("WARM_UP_ON_START", "0") == "1":
+            from src.extensions.warmup import warm_up
+            warm_up()
     
     @app.route('/', methods=['GET', 'POST'])
     def index():
@@ -33,12 +74,25 @@ def create_app():
             # Get seasons (multiple selection)
             seasons = request.form.getlist('seasons')
             additional_info = {'gender': gender_val, 'season': seasons}
-            greeting, res_dict = consulting_main(user_input, additional_info)
+            # Admission control: bounded in-flight consultations, short queue, per-client rate limit
+            with get_admission().admit(client_id()) as rejection:
+                if rejection:
+                    return busy_response(rejection)
+                greeting, res_dict = consulting_main(user_input, additional_info)
 
             
+            # Details of every retrieved item in one query (or none, when cached)
+            try:
+                metadata = get_item_metadata(item_id for value in res_dict.values() for item_id in value)
+            except Exception as e:
+                # The images are already retrieved, render them without names and prices
+                print(f"Error fetching item metadata: {e}")
+                metadata = {}
+
             desc_pic_pairs = []
             for key, value in res_dict.items():
-                desc_pic_pairs.append((f"For {key} part", os.path.join('static/imgs', f"{value[0]}.jpg"))) 
+                desc_pic_pairs.append((f"For {key} part", os.path.join('static/imgs', f"{value[0]}.jpg"),
+                                       metadata.get(value[0])))
 
             return render_template('response.html',
                                 greeting=greeting,
@@ -54,6 +108,13 @@ def create_app():
         return "Please submit from the index page."
 
 
+    @app.route("/metrics")
+    def metrics():
+        # Per-process serving metrics (each Gunicorn worker reports its own)
+        return jsonify({"micro_batching": batcher_stats(), "admission": get_admission().stats(),
+                        "prompt_cache": prompt_cache_stats(), "speculation": speculation_stats()})
+
+
     @app.route("/login")
     def login():
         return render_template('login.html')
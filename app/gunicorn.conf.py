@@ -0,0 +1,32 @@
+"""Gunicorn settings for the consulting app, loaded with `gunicorn -c gunicorn.conf.py wsgi:app`.
+
+The app is preloaded in the master (wsgi.py) and every worker sets up its own Milvus connection, MySQL pool
+and HTTP clients in `post_fork`, so no socket or gRPC channel is shared between processes.
+
+Sizing (see "Deployment" in the README): a request spends most of its wall time waiting on OpenAI, Gemini
+and Milvus, so each worker runs threads. Set the numbers from a measurement, not from these defaults:
+    GUNICORN_WORKERS  processes, bounded by CPU cores and by memory per worker
+    GUNICORN_THREADS  wall time / CPU time of one request, measured under load
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+preload_app = True
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# A consulting request chains a chat completion and several embedding/search calls
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth, jittered so they do not restart together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    from src.extensions.warmup import init_worker
+    init_worker(warm=os.getenv("WARM_UP_ON_START", "1") == "1")
+    server.log.info(f"Worker {worker.pid} initialized its connections")
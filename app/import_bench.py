@@ -0,0 +1,101 @@
+"""Import-time / cold-start guard for the web app.
+
+Runs `python -X importtime -c "import app"` in fresh interpreters and reports the median total import time
+and the heaviest modules. It exits non-zero when
+    - the median import time is over the budget (--budget-ms, or IMPORT_BUDGET_MS), or
+    - a module that must only load on first use (clients, image/notebook libraries) was imported.
+With --create-app the time to `create_app()` is measured as well (needs Milvus to be reachable).
+
+Example (from app/, e.g. as a CI step):
+    python import_bench.py --runs 5 --budget-ms 800
+The same checks run with the tests (tests/test_import_time.py).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Heavy dependencies that serving code must import lazily (see src/extensions/*, src/extensions/warmup.py)
+LAZY_MODULES = ["openai", "google.generativeai", "pymilvus", "dbutils", "pymysql", "PIL", "IPython",
+                "torch", "transformers"]
+# Median import time allowed, set it from a baseline measured on the deployment image
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 1000))
+
+
+def parse_importtime(stderr: str):
+    """
+    # *@param stderr: Output of `-X importtime`
+    # *@return: (total microseconds of the top-level imports, {module: cumulative microseconds})
+    """
+    total, modules = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules[name] = int(cumulative_us)
+        if depth == 0:
+            total += int(cumulative_us)
+    return total, modules
+
+
+def measure_import(module: str, cwd: str):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"`import {module}` failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def measure_create_app(cwd: str) -> float:
+    code = ("import time; started = time.perf_counter(); import app; app.create_app(); "
+            "print(time.perf_counter() - started)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"create_app() failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def lazy_violations(modules: dict, lazy_modules=LAZY_MODULES):
+    return sorted(lazy for lazy in lazy_modules if any(name == lazy or name.startswith(lazy + ".") for name in modules))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Guard the import time of the web app.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="Median import time allowed")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest modules to list")
+    parser.add_argument("--create-app", action="store_true", help="Also measure create_app() (connects to Milvus)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = [measure_import(args.module, cwd) for _ in range(args.runs)]
+    median_ms = statistics.median(total for total, _ in runs) / 1000
+    modules = runs[-1][1]
+
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:9.1f} ms  {name}")
+
+    failed = False
+    violations = lazy_violations(modules)
+    if violations:
+        print(f"FAIL: imported at module load, should load on first use: {', '.join(violations)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: import time {median_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if args.create_app:
+        print(f"create_app(): {measure_create_app(cwd) * 1000:.1f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
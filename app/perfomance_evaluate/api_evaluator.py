@@ -1,71 +1,201 @@
-from src.extensions.chatgpt_client import client
+from src.extensions.chatgpt_client import get_client
+from src.extensions.milvus_connection import init_milvus
 from evaluator_prompt import evaluator_beta_v0
 from prompt_generator import sythetic_prompts
 from src.services.consulting_service import consulting_main
 import os
 import json
-import multiprocessing as mp
+import base64
+import hashlib
+import argparse
+import asyncio
+from time import perf_counter
+import numpy as np
 
+EVALUATOR_MODEL = os.getenv("EVALUATOR_MODEL", "gpt-4o-mini")  # the judge has to accept images
+SCORE_FIELDS = list(evaluator_beta_v0["parameters"]["properties"])
+# Same tools / tool_choice request shape as the app's analysis call (consulting_service.py)
+_evaluator_tools = [{"type": "function", "function": {key: evaluator_beta_v0[key]
+                                                      for key in ("name", "description", "parameters")}}]
+_evaluator_tool_choice = {"type": "function", "function": {"name": evaluator_beta_v0["name"]}}
 
-def prompt_iterator(prompt_list: list):
-    """
-    # *@param prompt_list: A list of prompts to be iterated.
-    # *@return: A dictionary containing the prompt and the response.
-    # *Description:
-    #   This function takes a list of prompts and iterates through them, generating a response for each.
-    """
-    score = []
-    for prompt in prompt_list:
-        _, result= consulting_main(prompt)
-        img_list = []
-        for _, value in result.items():
-                img_list.append(os.path.join('static/imgs', f"{value[0]}.jpg"))
-        score.append(recommendation_evaluator(prompt, img_list))
-    
-    return score
-
-def recommendation_evaluator(origin_prompt: str, images: list) -> dict:
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def image_content(image_path: str) -> dict:
+    with open(image_path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("ascii")
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded}"}}
+
+
+def recommendation_evaluator(origin_prompt: str, images: dict) -> dict:
     """
-    # TODO: Complete and verify this function.
     # *@param origin_prompt: The user's question or request about clothing parts.
-    # *@param images: The recommended images for the user.
+    # *@param images: The recommended image of each part, {part: image path}.
     # *@return score: A dictionary containing the score of the recommendation.
     # *Description:
     #   This function take the origin prompt and the recommended images, and send them to the OpenAI API to evaluate the recommendation.
     #   It uses function calling to ensure the response includes the desired information.
     """
-    
+    content = [{"type": "text", "text": f"Customer's request: {origin_prompt}"}]
+    for part, image_path in images.items():
+        content.append({"type": "text", "text": f"Recommendation for {part} part:"})
+        content.append(image_content(image_path))
+
     messages = [{
         "role": "user",
-        "content": (
-            f"{origin_prompt}"
-        )
+        "content": content
     }]
-    
-    response = client.chat.completions.create(
-        model="text-davinci-003",  
+
+    response = get_client().chat.completions.create(
+        model=EVALUATOR_MODEL,
         messages=messages,
-        functions=[evaluator_beta_v0],
-        function_call={"name": "prompt_handler"}  # Force the model to call this specific function
+        tools=_evaluator_tools,
+        tool_choice=_evaluator_tool_choice  # Force the model to call this specific function
     )
-    
-    arguments = response.choices[0].message.function_call.arguments
+
+    arguments = response.choices[0].message.tool_calls[0].function.arguments
     parsed_arguments = json.loads(arguments)
-    
+
     return parsed_arguments
 
 
-# run the prompt_iterator function parrallelly(multi-process) in the background
-def run_prompt_iterator():
+class ResultStore:
+    """
+    # *Description:
+    #   Append-only JSONL of evaluated prompts, one record per line, flushed after every record.
+    #   Prompts with a successful record are skipped when an interrupted run is resumed,
+    #   failed ones are evaluated again (the latest record of a prompt wins).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:  # partial last line of an interrupted run
+                        continue
+                    self.records[record["key"]] = record
+        self.file = open(path, "a", encoding="utf-8")
+
+    def done(self, prompt: str) -> bool:
+        record = self.records.get(prompt_key(prompt))
+        return record is not None and record.get("error") is None
+
+    def append(self, record: dict):
+        self.records[record["key"]] = record
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class EvaluationRunner:
+    """
+    # *Description:
+    #   Fans prompts out with bounded concurrency. The consulting call and the judge call are limited
+    #   separately, so judging earlier prompts overlaps with consulting later ones.
+    """
+
+    def __init__(self, store: ResultStore, consulting_concurrency: int = 4, judge_concurrency: int = 4, additional_info: dict = None):
+        self.store = store
+        self.consulting_slots = asyncio.Semaphore(consulting_concurrency)
+        self.judge_slots = asyncio.Semaphore(judge_concurrency)
+        self.additional_info = additional_info
+        self.image_folder = os.getenv("IMG_FOLDER_PATH", "static/imgs")
+
+    async def evaluate(self, prompt: str) -> dict:
+        record = {"key": prompt_key(prompt), "prompt": prompt, "recommendation": None, "scores": None,
+                  "timing": {}, "error": None}
+        started = perf_counter()
+        try:
+            async with self.consulting_slots:
+                t0 = perf_counter()
+                _, result = await asyncio.to_thread(consulting_main, prompt, self.additional_info)
+                record["timing"]["consulting_s"] = round(perf_counter() - t0, 3)
+            record["recommendation"] = {part: ids[0] for part, ids in result.items() if ids}
+            images = {part: os.path.join(self.image_folder, f"{item_id}.jpg")
+                      for part, item_id in record["recommendation"].items()}
+            async with self.judge_slots:
+                t0 = perf_counter()
+                record["scores"] = await asyncio.to_thread(recommendation_evaluator, prompt, images)
+                record["timing"]["judge_s"] = round(perf_counter() - t0, 3)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["timing"]["total_s"] = round(perf_counter() - started, 3)
+        self.store.append(record)
+        status = "failed" if record["error"] else "done"
+        print(f"[{len(self.store.records)}] {status} in {record['timing']['total_s']:.1f}s: {prompt[:60]}")
+        return record
+
+    async def run(self, prompt_list: list) -> list:
+        pending = [prompt for prompt in dict.fromkeys(prompt_list) if not self.store.done(prompt)]
+        print(f"{len(prompt_list)} prompts, {len(prompt_list) - len(pending)} already evaluated, {len(pending)} to run")
+        return await asyncio.gather(*(self.evaluate(prompt) for prompt in pending))
+
+
+def aggregate(records: list) -> dict:
     """
-    # *@param prompt_list: A list of prompts to be iterated.
-    # *@return: A dictionary containing the prompt and the response.
+    # *@param records: Evaluation records (ResultStore.records values)
+    # *@return: Per-attribute mean/count, and timing percentiles of the successful prompts.
     # *Description:
-    #   This function takes a list of prompts and iterates through them, generating a response for each.
+    #   The judge only scores attributes mentioned in the prompt, so every attribute is averaged over the
+    #   prompts that received a score for it.
     """
-    prompt_list=sythetic_prompts
-    pool = mp.Pool(mp.cpu_count())
-    results = pool.map(prompt_iterator, [prompt_list])
-    pool.close()
-    # Combine the results
-    return results
+    succeeded = [r for r in records if r.get("error") is None and r.get("scores")]
+    attributes = {}
+    for field in SCORE_FIELDS:
+        values = [float(r["scores"][field]) for r in succeeded if isinstance(r["scores"].get(field), (int, float))]
+        if values:
+            attributes[field] = {"mean": round(float(np.mean(values)), 3), "count": len(values)}
+    timing = {}
+    for name in ("consulting_s", "judge_s", "total_s"):
+        values = [r["timing"][name] for r in succeeded if name in r["timing"]]
+        if values:
+            timing[name] = {"p50": round(float(np.percentile(values, 50)), 3),
+                            "p95": round(float(np.percentile(values, 95)), 3),
+                            "mean": round(float(np.mean(values)), 3)}
+    return {"prompts": len(records), "succeeded": len(succeeded), "failed": len(records) - len(succeeded),
+            "attributes": attributes, "timing": timing}
+
+
+def run_prompt_iterator(output: str = "evaluation_results.jsonl", consulting_concurrency: int = 4,
+                        judge_concurrency: int = 4, limit: int = None) -> dict:
+    """
+    # *@param output: Append-only JSONL store of the results, re-running resumes from it.
+    # *@return: The aggregated report over all records in the store.
+    # *Description:
+    #   Evaluates every synthetic prompt (consulting + judge) in parallel and aggregates the scores.
+    """
+    prompt_list = sythetic_prompts["synthetic_prompts_list"][:limit]
+    init_milvus()
+    store = ResultStore(output)
+    started = perf_counter()
+    try:
+        runner = EvaluationRunner(store, consulting_concurrency, judge_concurrency)
+        asyncio.run(runner.run(prompt_list))
+    finally:
+        store.close()
+    report = aggregate(list(store.records.values()))
+    report["wall_s"] = round(perf_counter() - started, 1)
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the consulting service on the synthetic prompts.")
+    parser.add_argument("--output", default="evaluation_results.jsonl", help="Append-only results, re-run to resume")
+    parser.add_argument("--consulting-concurrency", type=int, default=4)
+    parser.add_argument("--judge-concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=None, help="Only the first N prompts")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(json.dumps(run_prompt_iterator(args.output, args.consulting_concurrency, args.judge_concurrency, args.limit), indent=2))
@@ -12,43 +12,43 @@ evaluator_beta_v0 = {
         "type": "object",
         "properties": {
             "part_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the part of clothing the customer wants included in the recommendation.  "
             },
             "color_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the color of the clothing of recommendations aligned with the customer's request."
             },
             "occasion_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the occasion of the clothing of recommendations fit the customer's request."
             },
             "style_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the style of the clothing of recommendations fit the customer's request."
             },
             "seasonality_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the seasonality of the clothing of recommendations fit the customer's request."
             },
             "unique_design_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the unique design of the clothing of recommendations fit the customer's request."
             },
             "pattern_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the pattern of the clothing of recommendations fit the customer's request."
             },
             "material_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "How well the recommended item’s fabric matches user’s preference (e.g., cotton, linen, leather)."
             },
             "fit_score" : {
-                "type": "float",
+                "type": "number",
                 "description": "Is the fit of the clothing of recommendations fit the customer's request."
             },
             "overall_compatibility_score": {
-                "type": "float",
+                "type": "number",
                 "description" : "An average or weighted sum of all relevant scores for a quick read."}
             
         },
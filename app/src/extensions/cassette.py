@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# off:    always call the live APIs (default)
+# record: call the live APIs and store every response
+# replay: answer from the cassette only, a request that was never recorded raises CassetteMiss
+# auto:   replay when recorded, otherwise call the live API and record
+CASSETTE_MODE = os.getenv("API_CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("API_CASSETTE_PATH", "api_cassette.sqlite")
+# Replay latency: "recorded" sleeps as long as the live call took, a number is a fixed delay in seconds,
+# 0 replays immediately (isolates our own overhead).
+CASSETTE_LATENCY = os.getenv("API_CASSETTE_LATENCY", "0")
+
+
+class CassetteMiss(KeyError):
+    """A request was not found in the cassette in replay mode."""
+
+
+def _canonical(value):
+    """JSON-able form of a request, binary payloads (images, blobs) are reduced to their digest."""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "tobytes") and hasattr(value, "mode"):  # PIL image
+        return {"image": value.mode, "size": list(value.size), "sha256": hashlib.sha256(value.tobytes()).hexdigest()}
+    if hasattr(value, "model_dump"):
+        return _canonical(value.model_dump())
+    return repr(value)
+
+
+def fingerprint(kind: str, request: dict) -> str:
+    payload = json.dumps({"kind": kind, "request": _canonical(request)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    # Description:
+        On-disk store of API responses keyed by request fingerprint (SQLite, primary-key index,
+        zlib-compressed JSON bodies), shared by all threads of the process.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE, latency: str = CASSETTE_LATENCY):
+        self.mode = mode
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                               fingerprint TEXT PRIMARY KEY,
+                               kind TEXT NOT NULL,
+                               latency REAL NOT NULL,
+                               body BLOB NOT NULL,
+                               recorded_at REAL NOT NULL)""")
+        self.db.commit()
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.db.execute("SELECT latency, body FROM responses WHERE fingerprint = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(zlib.decompress(row[1]))
+
+    def put(self, key: str, kind: str, latency: float, body):
+        blob = zlib.compress(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                            (key, kind, latency, blob, time.time()))
+            self.db.commit()
+        self.stats["recorded"] += 1
+
+    def simulated_delay(self, recorded_latency: float) -> float:
+        if self.latency == "recorded":
+            return recorded_latency
+        return float(self.latency)
+
+    def call(self, kind: str, request: dict, live, dump, load):
+        """
+        #* @param kind: Name of the wrapped API call, part of the fingerprint
+        #* @param request: Arguments of the call (model name included)
+        #* @param live: Zero-argument function calling the live API
+        #* @param dump: Response -> JSON-able body
+        #* @param load: Body -> response object the caller expects
+        """
+        key = fingerprint(kind, request)
+        if self.mode in ("replay", "auto"):
+            entry = self.get(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                delay = self.simulated_delay(entry[0])
+                if delay > 0:
+                    time.sleep(delay)
+                return load(entry[1])
+            self.stats["misses"] += 1
+            if self.mode == "replay":
+                raise CassetteMiss(f"{kind} request {key[:12]} is not in the cassette")
+
+        started = time.perf_counter()
+        response = live()
+        self.put(key, kind, time.perf_counter() - started, dump(response))
+        return response
+
+    def call_stream(self, kind: str, request: dict, live, dump, load):
+        """
+        # Description:
+            Like `call` for a streamed response: yields the chunks of `live()` and records them with their
+            arrival offsets once the stream was read to the end, replay yields them at the recorded pace
+            (scaled to the configured latency).
+        """
+        key = fingerprint(kind, request)
+        if self.mode in ("replay", "auto"):
+            entry = self.get(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                latency, body = entry
+                scale = self.simulated_delay(latency) / latency if latency > 0 else 0.0
+                started = time.perf_counter()
+                for offset, chunk in zip(body["offsets"], body["chunks"]):
+                    delay = offset * scale - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                    yield load(chunk)
+                return
+            self.stats["misses"] += 1
+            if self.mode == "replay":
+                raise CassetteMiss(f"{kind} request {key[:12]} is not in the cassette")
+
+        started = time.perf_counter()
+        chunks, offsets = [], []
+        for chunk in live():
+            offsets.append(time.perf_counter() - started)
+            chunks.append(dump(chunk))
+            yield chunk
+        self.put(key, kind, time.perf_counter() - started, {"chunks": chunks, "offsets": offsets})
+
+
+_cassette = None
+
+
+def get_cassette():
+    """
+    #* @return: The process-wide Cassette, or None when API_CASSETTE_MODE is off
+    """
+    global _cassette
+    if _cassette is None and CASSETTE_MODE != "off":
+        _cassette = Cassette()
+    return _cassette
+
+
+def reset_cassette():
+    """Forget the SQLite connection inherited from the parent after a fork, the next call opens a new one."""
+    global _cassette
+    _cassette = None
+
+
+# ----------------- OpenAI -----------------
+
+class _RecordedCompletions:
+    def __init__(self, completions, cassette):
+        self._completions = completions
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        if kwargs.get("stream"):
+            from openai.types.chat import ChatCompletionChunk
+            return self._cassette.call_stream("openai.chat.completions.stream", kwargs,
+                                              live=lambda: self._completions.create(**kwargs),
+                                              dump=lambda chunk: chunk.model_dump(mode="json"),
+                                              load=ChatCompletionChunk.model_validate)
+        from openai.types.chat import ChatCompletion
+        return self._cassette.call("openai.chat.completions", kwargs,
+                                   live=lambda: self._completions.create(**kwargs),
+                                   dump=lambda response: response.model_dump(mode="json"),
+                                   load=ChatCompletion.model_validate)
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+
+class _RecordedChat:
+    def __init__(self, chat, cassette):
+        self.completions = _RecordedCompletions(chat.completions, cassette)
+        self._chat = chat
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class RecordedOpenAI:
+    """
+    # Description:
+        Wraps an OpenAI client, `chat.completions.create` (streamed or not) goes through the cassette,
+        anything else is passed through.
+    """
+
+    def __init__(self, client, cassette):
+        self.chat = _RecordedChat(client.chat, cassette)
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# ----------------- Gemini -----------------
+
+def _dump_generate(response):
+    return type(response._result).to_dict(response._result)
+
+
+def _load_generate(body):
+    from google.generativeai import protos
+    from google.generativeai.types import GenerateContentResponse
+    return GenerateContentResponse.from_response(protos.GenerateContentResponse(body))
+
+
+class RecordedGenerativeModel:
+    """
+    # Description:
+        Wraps genai.GenerativeModel, `generate_content` goes through the cassette.
+    """
+
+    def __init__(self, model, cassette):
+        self._model = model
+        self._cassette = cassette
+
+    def generate_content(self, contents, **kwargs):
+        if kwargs.get("stream"):
+            return self._model.generate_content(contents, **kwargs)
+        request = {"model": self._model.model_name, "generation_config": repr(self._model._generation_config),
+                   "system_instruction": repr(self._model._system_instruction), "contents": contents, **kwargs}
+        return self._cassette.call("gemini.generate_content", request,
+                                   live=lambda: self._model.generate_content(contents, **kwargs),
+                                   dump=_dump_generate, load=_load_generate)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+class RecordedGenai:
+    """
+    # Description:
+        Stands in for the `google.generativeai` module: `embed_content` and `GenerativeModel(...).generate_content`
+        go through the cassette, every other attribute is the module's own.
+    """
+
+    def __init__(self, module, cassette):
+        self._module = module
+        self._cassette = cassette
+
+    def embed_content(self, *args, **kwargs):
+        return self._cassette.call("gemini.embed_content", {"args": args, **kwargs},
+                                   live=lambda: self._module.embed_content(*args, **kwargs),
+                                   dump=dict, load=dict)
+
+    def GenerativeModel(self, *args, **kwargs):
+        return RecordedGenerativeModel(self._module.GenerativeModel(*args, **kwargs), self._cassette)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
@@ -1,12 +1,44 @@
-from openai import OpenAI
 from dotenv import load_dotenv
+import threading
 import os
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
 
+_client = None
+_lock = threading.Lock()
 
-    
 
+def get_client():
+    """
+    #* @return: The process-wide OpenAI client, created (and wrapped by the cassette) on first use
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from openai import OpenAI
+                from src.extensions.cassette import get_cassette, RecordedOpenAI
+                client = OpenAI(api_key=OPENAI_API_KEY)
+                # Record/replay chat completions when API_CASSETTE_MODE is set (see cassette.py)
+                if get_cassette():
+                    client = RecordedOpenAI(client, get_cassette())
+                _client = client
+    return _client
 
+
+def reset_client():
+    """
+    Forget the OpenAI client (its HTTP connections) inherited from the parent after a fork, without closing it:
+    closing would also shut the parent's connections. The next call creates a fresh one.
+    """
+    global _client, _lock
+    _client = None
+    _lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `from src.extensions.chatgpt_client import client` still works, at the cost of creating it right away
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,44 @@
-import google.generativeai as genai
 from dotenv import load_dotenv
+import threading
 import os
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
\ No newline at end of file
+
+_genai = None
+_lock = threading.Lock()
+
+
+def get_genai():
+    """
+    #* @return: The configured `google.generativeai` module (wrapped by the cassette), imported on first use
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                from src.extensions.cassette import get_cassette, RecordedGenai
+                genai.configure(api_key=GOOGLE_API_KEY)
+                # Record/replay embed_content / generate_content when API_CASSETTE_MODE is set (see cassette.py)
+                if get_cassette():
+                    genai = RecordedGenai(genai, get_cassette())
+                _genai = genai
+    return _genai
+
+
+def reset_genai():
+    """
+    Forget the Gemini configuration (its gRPC/HTTP clients) inherited from the parent after a fork, without closing it:
+    closing would also shut the parent's connections. The next call creates a fresh one.
+    """
+    global _genai, _lock
+    _genai = None
+    _lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `from src.extensions.gemini_client import genai` still works, at the cost of importing it right away
+    if name == "genai":
+        return get_genai()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,9 @@
-from pymilvus import connections
 from dotenv import load_dotenv
 import os
 
 def init_milvus():
     """Connect Milvus to the Flask app using env."""
+    from pymilvus import connections
     load_dotenv()
     host = os.getenv("MILVUS_HOST")
     port = os.getenv("MILVUS_PORT")
@@ -12,4 +12,3 @@ def init_milvus():
         host=host,
         port=port
     )
-
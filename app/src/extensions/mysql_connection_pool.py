@@ -1,35 +1,67 @@
-from dbutils.pooled_db import PooledDB
-import pymysql
+import threading
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
-# Configuration for the connection pool
-POOL = PooledDB(
-    creator=pymysql,                  # The database module to use
-    maxconnections=10,                # Maximum number of connections allowed
-    mincached=2,                      # Minimum number of idle connections
-    maxcached=10,                      # Maximum number of idle connections
-    maxshared=3,                      # Maximum number of shared connections
-    blocking=True,                    # Block when no connection is available
-    maxusage=None,                    # Unlimited reuse of a single connection
-    setsession=[],                    # List of SQL commands to prepare the session
-    ping=1,                           # Check if connection is alive (1: whenever possible)
-    host=os.getenv('DB_HOST'),
-    user=os.getenv('DB_USER'),
-    password=os.getenv('DB_PASSWORD'),
-    database=os.getenv('DB_NAME'),
-    port=int(os.getenv('DB_PORT', 3306)),
-    charset='utf8mb4',
-    cursorclass=pymysql.cursors.DictCursor  # Optional: Return results as dictionaries
-)
+
+_pool = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Create the connection pool on first use (no connection is opened at import time).
+    """
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                from dbutils.pooled_db import PooledDB
+                import pymysql
+                # Configuration for the connection pool
+                _pool = PooledDB(
+                    creator=pymysql,                  # The database module to use
+                    maxconnections=10,                # Maximum number of connections allowed
+                    mincached=2,                      # Minimum number of idle connections
+                    maxcached=10,                      # Maximum number of idle connections
+                    maxshared=3,                      # Maximum number of shared connections
+                    blocking=True,                    # Block when no connection is available
+                    maxusage=None,                    # Unlimited reuse of a single connection
+                    setsession=[],                    # List of SQL commands to prepare the session
+                    ping=1,                           # Check if connection is alive (1: whenever possible)
+                    host=os.getenv('DB_HOST'),
+                    user=os.getenv('DB_USER'),
+                    password=os.getenv('DB_PASSWORD'),
+                    database=os.getenv('DB_NAME'),
+                    port=int(os.getenv('DB_PORT', 3306)),
+                    charset='utf8mb4',
+                    cursorclass=pymysql.cursors.DictCursor  # Optional: Return results as dictionaries
+                )
+    return _pool
+
+
+def reset_pool():
+    """
+    Forget the pool (its MySQL sockets) inherited from the parent after a fork, without closing it:
+    closing would also shut the parent's connections. The next call creates a fresh one.
+    """
+    global _pool, _lock
+    _pool = None
+    _lock = threading.Lock()
+
+
+def __getattr__(name):
+    # Backwards compatible `POOL` attribute
+    if name == "POOL":
+        return get_pool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_connection():
     """
     Retrieve a connection from the pool.
     """
-    return POOL.connection()
+    return get_pool().connection()
 
 def execute_query(query:str, params=None) -> dict:
     """
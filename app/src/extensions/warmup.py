@@ -0,0 +1,89 @@
+import os
+from time import perf_counter
+
+PART_COLLECTIONS = ["tops", "pants", "outerwear", "dress_skirt"]
+
+
+def warm_up(collections=PART_COLLECTIONS) -> dict:
+    """
+    # * @param collections: Milvus collections searched by the retriever
+    # * @return: Seconds spent per step
+    # Description:
+        Imports the heavy dependencies and creates every client ahead of the first request:
+        OpenAI and Gemini clients, the MySQL pool (one connection opened), the Milvus connection,
+        search params per collection, and the optional projection / CLIP rerank / lexical index files.
+        Call it once per worker process, after any fork (see gunicorn.conf.py), or leave it to the first request.
+    """
+    from src.extensions.chatgpt_client import get_client
+    from src.extensions.gemini_client import get_genai
+    from src.extensions.mysql_connection_pool import get_pool
+    from src.extensions.milvus_connection import init_milvus
+    from src.services.consulting_service import search_params_for
+    from src.services.projection import get_projection
+    from src.services.clip_rerank import get_reranker
+    from src.services.lexical_index import get_lexical_index
+
+    timings = {}
+
+    def step(name, function):
+        started = perf_counter()
+        try:
+            function()
+        except Exception as e:
+            print(f"Warm-up step '{name}' failed: {e}")
+        timings[name] = round(perf_counter() - started, 3)
+
+    def milvus():
+        from pymilvus import Collection
+        init_milvus()
+        for name in collections:
+            search_params_for(Collection(name=name))
+
+    step("openai", get_client)
+    step("gemini", get_genai)
+    step("mysql", lambda: get_pool().connection().close())
+    step("milvus", milvus)
+    step("projection", get_projection)
+    step("clip_rerank", get_reranker)
+    step("lexical_index", get_lexical_index)
+    print(f"Warm-up finished in {sum(timings.values()):.2f}s (pid {os.getpid()}): {timings}")
+    return timings
+
+
+def preload():
+    """
+    # Description:
+        Runs once in the pre-forking master (gunicorn `preload_app`, see wsgi.py): imports the serving code and
+        memory-maps the projection / CLIP rerank / lexical index files, so workers share those pages copy-on-write.
+        It must not open any socket or channel, those would be shared by every forked worker.
+    """
+    import src.services.consulting_service  # noqa: F401
+    from src.services.projection import get_projection
+    from src.services.clip_rerank import get_reranker
+    from src.services.lexical_index import get_lexical_index
+    get_projection()
+    get_reranker()
+    get_lexical_index()
+
+
+def init_worker(warm: bool = True) -> None:
+    """
+    # * @param warm: Create every client now (warm_up) instead of on the first request
+    # Description:
+        Post-fork hook of a worker process. Drops whatever client state was inherited from the master
+        (HTTP clients, Gemini configuration, MySQL pool, cassette file), then connects Milvus for this process.
+    """
+    from src.extensions.chatgpt_client import reset_client
+    from src.extensions.gemini_client import reset_genai
+    from src.extensions.mysql_connection_pool import reset_pool
+    from src.extensions.cassette import reset_cassette
+    from src.extensions.milvus_connection import init_milvus
+
+    reset_client()
+    reset_genai()
+    reset_pool()
+    reset_cassette()
+    if warm:
+        warm_up()
+    else:
+        init_milvus()
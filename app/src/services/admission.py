@@ -0,0 +1,163 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+# Worker threads are shared by every route: in-flight + queued consultations are kept below the thread count,
+# so lightweight routes (/login, static pages, /metrics) always find a free thread.
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", 8))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", 2))                      # requests allowed to wait for a slot
+ADMISSION_QUEUE_WAIT = float(os.getenv("ADMISSION_QUEUE_WAIT", 2.0))        # seconds a queued request waits at most
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", max(1, WORKER_THREADS - ADMISSION_QUEUE - 2)))
+ADMISSION_MIN_INFLIGHT = int(os.getenv("ADMISSION_MIN_INFLIGHT", 1))
+CLIENT_RATE_PER_MIN = float(os.getenv("ADMISSION_CLIENT_RPM", 20))         # consultations per client per minute
+CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", 5))
+LATENCY_TOLERANCE = 1.5
+
+
+class Rejection:
+    def __init__(self, status: int, reason: str, retry_after: int):
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    # Description:
+        Guards the consulting route:
+        - an in-flight limit adapted to the observed latency of admitted requests (gradient method: the limit
+          shrinks when the short-term latency rises well above the long-term baseline, e.g. when OpenAI
+          slows down, and grows back by ~sqrt(limit) per request while latency is near its baseline),
+        - a short wait queue, a request that finds it full or waits too long is rejected with 503 at once,
+        - a token bucket per client (429 when empty).
+    """
+
+    def __init__(self, min_limit: int = ADMISSION_MIN_INFLIGHT, max_limit: int = ADMISSION_MAX_INFLIGHT,
+                 queue_size: int = ADMISSION_QUEUE, queue_wait: float = ADMISSION_QUEUE_WAIT,
+                 client_rate_per_min: float = CLIENT_RATE_PER_MIN, client_burst: float = CLIENT_BURST,
+                 max_clients: int = 10000):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(self.max_limit)
+        self.queue_size = queue_size
+        self.queue_wait = queue_wait
+        self.client_rate = client_rate_per_min / 60.0
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.short_latency = None
+        self.long_latency = None
+        self.buckets = OrderedDict()
+        self.counters = {"admitted": 0, "waited": 0, "rejected_queue_full": 0, "rejected_wait": 0, "rate_limited": 0}
+
+    def _take_token(self, client: str) -> Optional[float]:
+        """Caller holds the condition. Returns None when a token was taken, else seconds until the next one."""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(client, (self.client_burst, now))
+        tokens = min(self.client_burst, tokens + (now - updated) * self.client_rate)
+        if tokens >= 1:
+            self.buckets[client] = (tokens - 1, now)
+            wait = None
+        else:
+            self.buckets[client] = (tokens, now)
+            wait = (1 - tokens) / self.client_rate if self.client_rate > 0 else 60.0
+        while len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return wait
+
+    def _retry_after(self) -> int:
+        latency = self.short_latency or 1.0
+        return max(1, math.ceil(latency * (self.queued + 1) / max(int(self.limit), 1)))
+
+    def acquire(self, client: str) -> Optional[Rejection]:
+        with self.condition:
+            wait = self._take_token(client)
+            if wait is not None:
+                self.counters["rate_limited"] += 1
+                return Rejection(429, "Too many consultations from this client", max(1, math.ceil(wait)))
+            if self.in_flight < int(self.limit) and self.queued == 0:
+                self.in_flight += 1
+                self.counters["admitted"] += 1
+                return None
+            if self.queued >= self.queue_size:
+                self.counters["rejected_queue_full"] += 1
+                return Rejection(503, "busy", self._retry_after())
+
+            self.queued += 1
+            self.counters["waited"] += 1
+            deadline = time.monotonic() + self.queue_wait
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters["rejected_wait"] += 1
+                        return Rejection(503, "busy", self._retry_after())
+                    self.condition.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return None
+
+    def release(self, latency: float):
+        with self.condition:
+            self.in_flight -= 1
+            self._update_limit(latency)
+            self.condition.notify()
+
+    def _update_limit(self, latency: float):
+        """Caller holds the condition."""
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+            return
+        self.short_latency = 0.8 * self.short_latency + 0.2 * latency
+        self.long_latency = 0.98 * self.long_latency + 0.02 * latency
+        if self.long_latency > 2 * self.short_latency:  # the baseline recovers quickly after a slow period
+            self.long_latency = 0.9 * self.long_latency + 0.1 * self.short_latency
+        # Latency may rise by LATENCY_TOLERANCE before the limit shrinks, it only grows back below that
+        gradient = max(0.5, min(1.0, LATENCY_TOLERANCE * self.long_latency / self.short_latency))
+        target = self.limit * gradient + (math.sqrt(self.limit) if gradient >= 1.0 else 0.0)
+        self.limit = max(self.min_limit, min(self.max_limit, 0.8 * self.limit + 0.2 * target))
+
+    @contextmanager
+    def admit(self, client: str):
+        """
+        #* @param client: Client identifier for the per-client bucket
+        # Description:
+            Yields None when admitted (the latency of the block feeds the limit), or the Rejection to answer with.
+        """
+        rejection = self.acquire(client)
+        if rejection:
+            yield rejection
+            return
+        started = time.monotonic()
+        try:
+            yield None
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {**self.counters, "in_flight": self.in_flight, "queued": self.queued,
+                    "limit": round(self.limit, 2), "max_limit": self.max_limit, "queue_size": self.queue_size,
+                    "latency_short_s": round(self.short_latency or 0.0, 3),
+                    "latency_long_s": round(self.long_latency or 0.0, 3)}
+
+
+_controller = None
+_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        with _lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,96 @@
+import os
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.services.generation import current_generation
+
+load_dotenv()
+
+# Directory written by CLIP_baseline_model/export_image_features.py (its CURRENT generation is loaded).
+# The rerank stage is off when it is not set.
+RERANK_PATH = os.getenv("CLIP_RERANK_PATH")
+RERANK_WEIGHT = float(os.getenv("CLIP_RERANK_WEIGHT", 0.3))   # share of the CLIP score in the blended score
+RERANK_POOL = int(os.getenv("CLIP_RERANK_POOL", 50))          # candidates fetched from Milvus before reranking
+CLIP_MODEL = os.getenv("CLIP_MODEL", "openai/clip-vit-large-patch14")
+
+
+class ClipReranker:
+    """
+    # Description:
+        Reorders Milvus candidates by blending their text-embedding similarity with the CLIP similarity
+        between the part summary and the item image.
+        The image features are a float16 matrix memory-mapped from disk, row i belongs to item_ids[i]
+        (sorted), so a request only touches the rows of its candidates.
+        torch/transformers are only needed when the stage is enabled, for the CLIP text tower.
+    """
+
+    def __init__(self, path: str, weight: float = RERANK_WEIGHT, model_name: str = CLIP_MODEL):
+        path = current_generation(path)
+        self.item_ids = np.load(os.path.join(path, "item_ids.npy"))
+        self.features = np.load(os.path.join(path, "image_features.npy"), mmap_mode="r")
+        self.weight = weight
+        self.model_name = model_name
+        self._model = None
+        self._tokenizer = None
+        self._model_lock = threading.Lock()
+
+    def encode_text(self, text: str) -> np.ndarray:
+        """
+        #* @param text: Part summary
+        #* @return: L2-normalized CLIP text feature (float32)
+        """
+        import torch
+        from transformers import CLIPTextModelWithProjection, CLIPTokenizerFast
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:  # concurrent first requests load the model once
+                    self._tokenizer = CLIPTokenizerFast.from_pretrained(self.model_name)
+                    self._model = CLIPTextModelWithProjection.from_pretrained(self.model_name).eval()
+        with torch.inference_mode():
+            tokens = self._tokenizer([text], truncation=True, padding=True, return_tensors="pt")
+            feature = self._model(**tokens).text_embeds[0].float().numpy()
+        norm = np.linalg.norm(feature)
+        return feature / norm if norm > 0 else feature
+
+    def rerank(self, text: str, ids: List[int], scores: List[float], limit: int = 5) -> Tuple[List[int], np.ndarray]:
+        """
+        #* @param text: Part summary the candidates were retrieved for
+        #* @param ids: Candidate item ids from Milvus
+        #* @param scores: Their similarity to the query (COSINE/IP, higher is better)
+        #* @param limit: Number of ids to return
+        #* @return: Item ids ordered by the blended score, and their blended scores (0..1)
+        # Description:
+            Both scores are min-max scaled within the candidate pool before blending, since CLIP cosine
+            similarities live in a much narrower range than the text-embedding ones.
+            Candidates without an image feature get a neutral CLIP score (0.5).
+        """
+        if not ids:
+            return [], np.zeros(0, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        text_scores = np.asarray(scores, dtype=np.float32)
+        rows = np.clip(np.searchsorted(self.item_ids, ids), 0, len(self.item_ids) - 1)
+        known = self.item_ids[rows] == ids
+        clip_scores = np.where(known, self.features[rows].astype(np.float32) @ self.encode_text(text), 0.0)
+
+        def scaled(values, mask):
+            low, high = values[mask].min(initial=np.inf), values[mask].max(initial=-np.inf)
+            return (values - low) / (high - low) if high > low else np.zeros_like(values)
+
+        clip_scaled = np.where(known, scaled(clip_scores, known), 0.5)
+        blended = (1 - self.weight) * scaled(text_scores, np.ones_like(known)) + self.weight * clip_scaled
+        order = np.argsort(-blended, kind="stable")[:limit]
+        return ids[order].tolist(), blended[order].astype(np.float32)
+
+
+_reranker = None
+
+
+def get_reranker() -> Optional[ClipReranker]:
+    """
+    #* @return: The configured ClipReranker, or None when CLIP_RERANK_PATH is not set
+    """
+    global _reranker
+    if _reranker is None and RERANK_PATH:
+        _reranker = ClipReranker(RERANK_PATH)
+    return _reranker
@@ -1,18 +1,62 @@
 import json
 import os
-from typing import List
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
 from dotenv import load_dotenv
 import numpy as np
-from PIL import Image
-from pymilvus import Collection
-from IPython.display import display
 from src.services import handlers
-from src.extensions.gemini_client import genai
-from src.extensions.chatgpt_client import client
+from src.services.projection import get_projection
+from src.services.clip_rerank import get_reranker, RERANK_POOL
+from src.services.micro_batcher import get_batcher
+from src.services.outfit import OUTFIT_SELECTION, OUTFIT_POOL, decode_vector, arrange_outfit, scaled_relevance
+from src.services.stream_parser import AnalysisStreamParser
+from src.services.speculation import SPECULATIVE_RETRIEVAL, Speculation
+from src.services.lexical_index import get_lexical_index, reciprocal_rank_fusion, LEXICAL_POOL
+from src.services.item_metadata import catalog_version
+# Clients and pymilvus are imported on first use (or by src.warmup), keeping worker boot fast
+from src.extensions.gemini_client import get_genai
+from src.extensions.chatgpt_client import get_client
 # from src.extensions.milvus_connection import init_milvus
 
 load_dotenv()
 
+# The analysis request starts with the same system message and tool schema for every user, so the provider's
+# prompt cache can reuse that prefix (it has to stay byte-identical: bump the handler version to change it).
+ANALYSIS_HANDLER_VERSION = os.getenv("ANALYSIS_HANDLER_VERSION", "beta_v2")
+_analysis_tools = [{"type": "function", "function": handlers.HANDLER_VERSIONS[ANALYSIS_HANDLER_VERSION]}]
+_analysis_tool_choice = {"type": "function", "function": {"name": "prompt_handler"}}
+_analysis_system_message = {"role": "system", "content": handlers.analysis_system_prompt}
+_prompt_cache_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+_prompt_cache_lock = threading.Lock()
+# Stream the analysis call and retrieve every part as soon as it is complete (0: wait for the whole response)
+ANALYSIS_STREAMING = os.getenv("ANALYSIS_STREAMING", "1") == "1"
+STREAMING_PART_WORKERS = 4
+
+
+def prompt_cache_stats() -> dict:
+    """Prompt and cached prompt token totals of the analysis calls in this process."""
+    with _prompt_cache_lock:
+        stats = dict(_prompt_cache_stats)
+    stats["handler_version"] = ANALYSIS_HANDLER_VERSION
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+def record_prompt_usage(usage) -> None:
+    """Logs and accumulates the cached prompt tokens reported in a response's usage."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    with _prompt_cache_lock:
+        _prompt_cache_stats["requests"] += 1
+        _prompt_cache_stats["prompt_tokens"] += usage.prompt_tokens
+        _prompt_cache_stats["cached_tokens"] += cached
+    print(f"Analysis call ({ANALYSIS_HANDLER_VERSION}): {usage.prompt_tokens} prompt tokens, {cached} cached")
+
+
 def openai_consulting_response(prompt: str) -> dict:
 
     """
@@ -26,48 +70,104 @@ def openai_consulting_response(prompt: str) -> dict:
     # *Description:
     #   This function sends a prompt to the OpenAI API to analyze the type of clothing parts the customer wants.
     #   It uses function calling to ensure the response includes the desired information.
+    #   Static content (system instructions with few-shot examples, tool schema) comes first and the user's
+    #   text last, so the request prefix is cached by the provider across users.
     """
     model_openai = os.getenv("OPEN_AI_MODEL")
 
-    function_prompt_handler = handlers.handler_beta_v1
-
-    messages = [{
-        "role": "user",
-        "content": (
-            "Analyze what type of clothing the customer(top, pants, outwear, dress, or "
-            "two or three of them) through the user's question, use function calling. \n"
-            f"{prompt}"
-            "The output should indicate which part the customer want, and what kind of clothing item does customer want for each part."
-        )
-    }]
-    
-    
-    response = client.chat.completions.create(
-        model=model_openai,  
+    messages = [
+        _analysis_system_message,
+        {"role": "user", "content": prompt}
+    ]
+
+    response = get_client().chat.completions.create(
+        model=model_openai,
         messages=messages,
-        functions=[function_prompt_handler],
-        function_call={"name": "prompt_handler"}  # Force the model to call this specific function
+        tools=_analysis_tools,
+        tool_choice=_analysis_tool_choice  # Force the model to call this specific function
     )
+    record_prompt_usage(response.usage)
 
-    arguments = response.choices[0].message.function_call.arguments
+    arguments = response.choices[0].message.tool_calls[0].function.arguments
     parsed_arguments = json.loads(arguments)
     
     return parsed_arguments
 
+def openai_consulting_stream(prompt: str, on_part: Callable[[dict], None]) -> dict:
+    """
+    # *@param prompt: The user's question or request about clothing parts.
+    # *@param on_part: Called with every {'part': ..., 'summary': ...} object as soon as it has been streamed
+    # *@return parsed_arguments: Same as openai_consulting_response
+    # *Description:
+    #   Streaming variant of openai_consulting_response (same request prefix), the function call arguments
+    #   are parsed incrementally while they arrive.
+    """
+    model_openai = os.getenv("OPEN_AI_MODEL")
+
+    messages = [
+        _analysis_system_message,
+        {"role": "user", "content": prompt}
+    ]
+
+    stream = get_client().chat.completions.create(
+        model=model_openai,
+        messages=messages,
+        tools=_analysis_tools,
+        tool_choice=_analysis_tool_choice,  # Force the model to call this specific function
+        stream=True,
+        stream_options={"include_usage": True}  # the last chunk carries the usage
+    )
+
+    parser = AnalysisStreamParser()
+    for chunk in stream:
+        if chunk.usage:
+            record_prompt_usage(chunk.usage)
+        if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+            continue
+        for tool_call in chunk.choices[0].delta.tool_calls:
+            if tool_call.function and tool_call.function.arguments:
+                for part in parser.feed(tool_call.function.arguments):
+                    on_part(part)
+
+    return parser.result()
+
+def _embed_batch(options_key: tuple, texts: List[str]) -> List[list]:
+    """One embed_content call for the texts of concurrent requests (micro-batcher handler)."""
+    result = get_genai().embed_content(
+                    model="models/text-embedding-004",
+                    content=texts,
+                    **dict(options_key))
+    return result['embedding']
+
+
 def embedding_gemini(user_input: str) -> np.ndarray:
     """
     #* @param user_input: Text input
     #* @return: text_feature: Embedding tensor of the text
     # Description:
         This function takes in text input and returns the embedding of the text
+        With a configured projection (EMBEDDING_PROJECTION_PATH) the vector is reduced like the catalog vectors.
+        With MICRO_BATCH_WINDOW_MS > 0 the text is embedded together with those of concurrent requests.
     """
+    projection = get_projection()
+    options = {}
+    if projection and projection.output_dimensionality():
+        options['output_dimensionality'] = projection.output_dimensionality()
+
+    batcher = get_batcher("embed", _embed_batch)
+    if batcher:
+        embedding = batcher.submit(user_input, key=tuple(sorted(options.items())))
+    else:
+        result = get_genai().embed_content(
+                        model="models/text-embedding-004",
+                        content=user_input,
+                        **options)
+        embedding = result['embedding']
+    vector = np.array(embedding, dtype=np.float32)
+    if projection:
+        vector = projection.apply(vector)
 
-    result = genai.embed_content(
-                    model="models/text-embedding-004",
-                    content=user_input)
-    vector = np.array(result['embedding'], dtype=np.float16)
-
-    return vector
+    return vector.astype(np.float16)
 
 
 def milvus_retrieve(collection_name: str, query_vector: np.ndarray) -> List[int]:
@@ -79,6 +179,7 @@ def milvus_retrieve(collection_name: str, query_vector: np.ndarray) -> List[int]
         This function retrieves the embeddings from Milvus and returns the ids of the retrieved embeddings
     """
     # connections.connect(host='localhost', port='19530')
+    from pymilvus import Collection
     collection = Collection(name=collection_name)
     search_params = {"metric_type": "COSINE", "params": {"nprobe": 16}}
     results = collection.search(data=[query_vector], anns_field='embedding', param=search_params, limit=5)
@@ -86,50 +187,263 @@ def milvus_retrieve(collection_name: str, query_vector: np.ndarray) -> List[int]
     return results
 
 
-def milvus_retrieve_filter(collection_name: str, query_vector: np.ndarray, filter_expr: str) -> List[int]:
+# Search params per collection, derived from the collection's index. An entry is derived again after
+# SEARCH_PARAMS_TTL seconds, when the catalog version changed (rebuild.py bumps it right after an alias swap,
+# checked every CATALOG_VERSION_POLL seconds), and after a failed search, so a generation with another metric
+# or index type behind the same alias is picked up without a restart.
+SEARCH_PARAMS_TTL = 300
+_search_params_cache = {}
+
+
+def search_params_for(collection) -> dict:
+    """
+    #* @param collection: Milvus collection (or alias)
+    #* @return: Search params matching the collection's index, e.g. {"metric_type": "COSINE", "params": {"ef": 16}}
+    # Description:
+        HNSW variants are searched with `ef`, IVF variants with `nprobe`, and the metric follows the index.
+    """
+    version = catalog_version()
+    cached = _search_params_cache.get(collection.name)
+    if cached and cached[1] == version and time.monotonic() - cached[0] < SEARCH_PARAMS_TTL:
+        return cached[2]
+    try:
+        index_params = collection.index().params
+        metric_type = index_params.get("metric_type", "COSINE")
+        index_type = index_params.get("index_type", "HNSW")
+    except Exception as e:
+        print(f"Error reading index of '{collection.name}': {e}")
+        metric_type, index_type = "COSINE", "HNSW"
+    params = {"nprobe": 16} if index_type.startswith("IVF") else {"ef": 16}
+    search_params = {"metric_type": metric_type, "params": params}
+    _search_params_cache[collection.name] = (time.monotonic(), version, search_params)
+    return search_params
+
+
+def forget_search_params(collection_name: str) -> None:
+    _search_params_cache.pop(collection_name, None)
+
+
+def search_collection(collection_name: str, query_vectors: List[np.ndarray], filter_expr: str, limit: int,
+                      output_fields: tuple = ()):
+    """
+    #* @return: Milvus search results, one hit list per query vector
+    # Description:
+        IP indexes are built on unit-length vectors, so the queries are normalized for them as well.
+        A failed search is retried once with params read again from the index: the alias may point at a
+        generation with another metric since they were cached.
+    """
+    from pymilvus import Collection
+    collection = Collection(name=collection_name)
+    for attempt in range(2):
+        search_params = search_params_for(collection)
+        data = query_vectors
+        if search_params["metric_type"] == "IP":
+            data = []
+            for query_vector in query_vectors:
+                norm = np.linalg.norm(query_vector.astype(np.float32))
+                data.append((query_vector.astype(np.float32) / norm).astype(np.float16) if norm > 0 else query_vector)
+        try:
+            return collection.search(data=data, anns_field='embedding', param=search_params, limit=limit,
+                                     expr=filter_expr, output_fields=list(output_fields))
+        except Exception as e:
+            if attempt:
+                raise
+            print(f"Search on '{collection_name}' failed ({e}), retrying with fresh search params")
+            forget_search_params(collection_name)
+
+
+def milvus_retrieve_filter(collection_name: str, query_vector: np.ndarray, filter_expr: str, limit: int = 5,
+                           output_fields: tuple = ()) -> List[int]:
     """
     #* @param collection_name: Name of the collection in Milvus
     #* @param embedding: Embedding tensor of the text
+    #* @param limit: Number of results, wider when the results are reranked afterwards
+    #* @param output_fields: Fields returned with every hit, e.g. ('embedding',) for the outfit selection
     #* @return: List of ids of the retrieved embeddings
     # Description:
         This function retrieves the embeddings from Milvus and returns the ids of the retrieved embeddings
     """
     # connections.connect(host='localhost', port='19530')
-    collection = Collection(name=collection_name)
-    # search_params = {"metric_type": "COSINE", "params": {"nprobe": 16}}
-    search_params = {"metric_type": "COSINE", "params": {"efSearch": 16}}
-    results = collection.search(data=[query_vector], anns_field='embedding', param=search_params, limit=5, expr=filter_expr)
+    batcher = get_batcher("search", _search_batch)
+    if batcher:
+        # Same (collection, expr, limit, output fields) searches of concurrent requests share one nq>1 search
+        return [batcher.submit(query_vector, key=(collection_name, filter_expr, limit, tuple(output_fields)))]
+    results = search_collection(collection_name, [query_vector], filter_expr, limit, output_fields)
 
     return results
 
 
-def retriever(arguments: dict) -> dict:
+def _search_batch(key: tuple, query_vectors: List[np.ndarray]) -> list:
+    """One search with nq = len(query_vectors) (micro-batcher handler), returns the hits of every query."""
+    collection_name, filter_expr, limit, output_fields = key
+    results = search_collection(collection_name, query_vectors, filter_expr, limit, output_fields)
+    return [results[i] for i in range(len(query_vectors))]
+
+
+def fetch_vectors(collection_name: str, item_ids: List[int], query_vector: np.ndarray) -> dict:
+    """
+    #* @return: {item id: (cosine to the query, item vector)} of items the vector search did not return
+    """
+    from pymilvus import Collection
+    collection = Collection(name=collection_name)
+    rows = collection.query(expr=f"item_id in {list(item_ids)}", output_fields=['item_id', 'embedding'])
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+    fetched = {}
+    for row in rows:
+        item_vector = decode_vector(row['embedding'])
+        fetched[row['item_id']] = (float(query @ item_vector / (np.linalg.norm(item_vector) or 1.0)), item_vector)
+    return fetched
+
+
+def retrieve_part(part: dict, filter_dict: dict, return_candidates: bool = False, vector: np.ndarray = None):
+    """
+    # * @param part: One analysis object, {'part': 'tops', 'summary': 'black sweater'}
+    # * @param filter_dict: User's gender and season, {'gender': '3', 'season': ['spring','summer']}
+    # * @param vector: Query vector when already embedded, otherwise the summary is embedded
+    # * @return: (image ids, (ids, relevance, vectors) for the outfit selection or None)
+    # Description:
+        With a lexical index (LEXICAL_INDEX_PATH) the vector ranking is fused with the BM25 ranking of the
+        summary over the item descriptions, so exact brand or character names are not lost.
+    """
+    pool_size = max(5, OUTFIT_POOL) if return_candidates else 5
+    output_fields = ('embedding',) if return_candidates else ()
+    lexical_index = get_lexical_index()
+    depth = max(pool_size, LEXICAL_POOL) if lexical_index else pool_size
+
+    part_name = part['part']
+    summary = part['summary']
+    filter_expr = build_filter_expr(filter_dict)
+    if vector is None:
+        vector = embedding_gemini(summary)
+    reranker = get_reranker()
+    if reranker:
+        # Wider candidate pool from Milvus, reordered by CLIP text-to-image similarity
+        results = milvus_retrieve_filter(part_name, vector, filter_expr, limit=max(RERANK_POOL, depth),
+                                         output_fields=output_fields)
+        hits = results[0]
+        img_ids, scores = reranker.rerank(summary, [item.id for item in hits], [item.distance for item in hits],
+                                          limit=depth)
+        ranking_scores = dict(zip(img_ids, scores.tolist()))
+    else:
+        results = milvus_retrieve_filter(part_name, vector, filter_expr, limit=depth, output_fields=output_fields)
+
+        # results = milvus_retrieve(part_name, vector)
+        hits = results[0]
+        img_ids = [item.id for item in hits]
+        ranking_scores = None  # the vector similarity is the final ranking
+    if lexical_index:
+        lexical_ids, _ = lexical_index.search(part_name, summary, filter_dict, limit=LEXICAL_POOL)
+        # A lexical-only hit keeps its fused score, its vector similarity (fetched below) is not used to rank it
+        img_ids, fused = reciprocal_rank_fusion([img_ids, lexical_ids])
+        ranking_scores = dict(zip(img_ids, fused))
+    img_ids = img_ids[:pool_size]
+
+    candidates = None
+    if return_candidates and img_ids:
+        by_id = {item.id: (item.distance, decode_vector(item.entity.get('embedding'))) for item in hits}
+        missing = [i for i in img_ids if i not in by_id]
+        if missing:  # found by the lexical side only
+            by_id.update(fetch_vectors(part_name, missing, vector))
+        img_ids = [i for i in img_ids if i in by_id]
+        # Relevance follows the final ranking of the part (rerank / fusion), not the raw vector similarity
+        if ranking_scores is None:
+            relevance = np.array([by_id[i][0] for i in img_ids], dtype=np.float32)
+        else:
+            relevance = scaled_relevance([ranking_scores[i] for i in img_ids])
+        candidates = (img_ids, relevance, np.stack([by_id[i][1] for i in img_ids]))
+    return img_ids, candidates
+
+
+def start_speculation(prompt: str, additional_info: dict = None, return_candidates: bool = False):
+    """
+    # * @return: Speculation searching every category with the raw prompt, None when SPECULATIVE_RETRIEVAL is off
+    # Description:
+        Runs while the LLM analyses the prompt, under the same gender/season filter as the real retrieval.
+    """
+    if not SPECULATIVE_RETRIEVAL:
+        return None
+    task_package = addition_info_append({}, additional_info)
+    filter_dict = {'gender': task_package['gender'], 'season': task_package['season']}
+    return Speculation(prompt, embed=embedding_gemini,
+                       search=lambda category, vector: retrieve_part({'part': category, 'summary': prompt},
+                                                                     filter_dict, return_candidates, vector=vector))
+
+
+def retrieve_part_speculated(part: dict, filter_dict: dict, return_candidates: bool = False, speculation=None):
+    """
+    # * @return: retrieve_part result, taken from the speculative search when the summary is close to the prompt
+    """
+    speculated = speculation.take(part) if speculation else None
+    if speculated is not None:
+        try:
+            return speculated.result()
+        except Exception as e:
+            print(f"Speculative retrieval of {part['part']} failed, retrieving it again: {e}")
+    return retrieve_part(part, filter_dict, return_candidates)
+
+
+def collect_parts(part_results: list, return_candidates: bool = False):
+    """
+    # * @param part_results: [(part name, retrieve_part result)] in analysis order
+    # * @return: Dictionary of {part :image ids} (and {part: candidates} with return_candidates)
+    """
+    part_img_ids = {}
+    candidates = {}
+    for part_name, (img_ids, part_candidates) in part_results:
+        part_img_ids[part_name] = img_ids
+        if part_candidates is not None:
+            candidates[part_name] = part_candidates
+    if return_candidates:
+        return part_img_ids, candidates
+    return part_img_ids
+
+
+def retriever(arguments: dict, return_candidates: bool = False, speculation=None):
     """
     # * @param arguments: List of retrieve objects
+    # * @param return_candidates: Also return {part: (ids, relevance, vectors)} for the outfit selection
+    # * @param speculation: Speculative search on the raw prompt (start_speculation), used where close enough
     # * @return: Dictionary of {part :image ids}
     # Description:
         This function retrieves the similar image ids based on the prompts and clothing parts
-    # TODO: Parallelize the retrieval process
     """
     filter_dict = {
         'gender': arguments['gender'],
         'season': arguments['season']
     }
 
+    part_results = [(part['part'], retrieve_part_speculated(part, filter_dict, return_candidates, speculation))
+                    for part in arguments['analysis']]
+    return collect_parts(part_results, return_candidates)
 
-    part_img_ids = {}
-    for part in arguments['analysis']:
-        part_name = part['part']
-        summary = part['summary']
-        vector = embedding_gemini(summary)
-        filter_expr = build_filter_expr(filter_dict)
-        results = milvus_retrieve_filter(part_name, vector, filter_expr)
 
-        # results = milvus_retrieve(part_name, vector)
-        img_ids = [item.id for item in results[0]]
-        part_img_ids[part_name] = img_ids
+def streaming_retriever(prompt: str, additional_info: dict = None, return_candidates: bool = False):
+    """
+    # * @param prompt: User's prompt
+    # * @param additional_info: User's gender, season.
+    # * @return: (analysis response, retriever result)
+    # Description:
+        Streams the analysis call and starts embedding + search of each part in a worker thread as soon as
+        its {part, summary} object is complete, so retrieval overlaps with the generation of the next parts.
+    """
+    task_package = addition_info_append({}, additional_info)
+    filter_dict = {'gender': task_package['gender'], 'season': task_package['season']}
 
-    return part_img_ids
+    speculation = start_speculation(prompt, additional_info, return_candidates)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=STREAMING_PART_WORKERS) as pool:
+        def start_part(part: dict):
+            futures.append((part['part'], pool.submit(retrieve_part_speculated, part, filter_dict,
+                                                      return_candidates, speculation)))
+
+        response = openai_consulting_stream(prompt, start_part)
+        part_results = [(part_name, future.result()) for part_name, future in futures]
+
+    response['gender'] = task_package['gender']
+    response['season'] = task_package['season']
+    return response, collect_parts(part_results, return_candidates)
 
 def build_filter_expr(filter_dict: dict) -> str:
     """
@@ -187,6 +501,9 @@ def build_filter_expr(filter_dict: dict) -> str:
         return ""
 
 def display_image(img_id_list) -> None:
+    # Notebook helper only, never used while serving
+    from PIL import Image
+    from IPython.display import display
     image_folder = os.getenv("IMG_FOLDER_PATH")
     for item in img_id_list[0]:
         print(f"Item ID: {item.id}")
@@ -230,13 +547,23 @@ def consulting_main(prompt: str, additional_info: dict = None):
     # init_milvus()
     # connections.connect(alias="default",host='localhost',port='19530')
 
-    response = openai_consulting_response(prompt)
+    if ANALYSIS_STREAMING:
+        response, retrieved = streaming_retriever(prompt, additional_info, return_candidates=OUTFIT_SELECTION)
+    else:
+        speculation = start_speculation(prompt, additional_info, return_candidates=OUTFIT_SELECTION)
+        response = openai_consulting_response(prompt)
+        task_package = addition_info_append(response, additional_info)
+        retrieved = retriever(task_package, return_candidates=OUTFIT_SELECTION, speculation=speculation)
     # If greeting is not present, give a default greeting('Hi there, how can I help you today?')
     if 'polite_reply' not in response:
         response['polite_reply'] = "Hi there, how can I help you today?"
     greeting = response['polite_reply']
-    task_package = addition_info_append(response, additional_info)
-    res_dict = retriever(task_package)
+    if OUTFIT_SELECTION:
+        # Pick the items of all parts together so they go with each other, the pick is value[0] of every part
+        res_dict, candidates = retrieved
+        res_dict = arrange_outfit(res_dict, candidates)
+    else:
+        res_dict = retrieved
 
     return greeting, res_dict
 
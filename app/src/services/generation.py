@@ -0,0 +1,19 @@
+import os
+
+POINTER = "CURRENT"
+
+
+def current_generation(path: str) -> str:
+    """
+    #* @param path: Output directory of an offline export (CLIP features, lexical index)
+    #* @return: Directory of the generation `<path>/CURRENT` points at, or `path` itself for an unversioned export
+    # Description:
+        The exporters write every generation to its own directory and then atomically replace CURRENT,
+        so reading the pointer once and loading from the directory it names never sees a partial export.
+    """
+    pointer = os.path.join(path, POINTER)
+    try:
+        with open(pointer, encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    except FileNotFoundError:
+        return path
@@ -82,5 +82,95 @@ handler_beta_v1 = {
     }
 
 
+# beta_v1 with the `required` constraints inside the JSON schema: a top-level "required" is not part of a
+# function definition, so with tools=[...] it was an unknown field and nothing was actually enforced.
+handler_beta_v2 = {
+    "name": "prompt_handler",
+    "description": (
+        "Context: A dedicated fashion consulting system. "
+        "Input : The customer's prompt describing desired outfit. "
+        "Output: Greeting first(mandatory), then clothing parts the customer wants, along with feature descriptions. "
+        "Usage: This summary should focus solely on the features to facilitate item retrieval. "
+        "Workflow: "
+        "Step0(Initiation): Greet the user(Mandatory, what ever the input is.). "
+        "Step1(Analysis): Analyze the customer's prompt. "
+        "Step2(Classify): Identify the types of clothing parts the customer wants. "
+        "Step3(Reasoning): Figure out the color, material, sleeve length, neckline, style, fit, occasion, seasonality, patterns or prints, and unique design details."
+        "Step4(Conclusion): Finally speculate and give a concise summary for each clothing part according to the analysis result."
+        "In Addition, if the customer's prompt is irrelevant, randomly give feedback."
+    ),
+    "parameters" : {
+        "type": "object",
+        "properties": {
+            "polite_reply" : {
+                "type": "string",
+                "description": "Act like a consulting chatbot, greeting to user. "
+            },
+            "analysis" : {
+                "type": "array",
+                "items" : {
+                    "type" : "object",
+                    "properties" :{
+                        "part" : {"type" : "string",
+                                  "enum" : ["tops", "pants", "outerwear", "dress_skirt"],
+                                  "description" : "Identifier of desired clothing parts(one or more)."},
+                        "summary" : {"type" : "string",
+                                     "description" : "Concise feature description of the clothing part."}
+                    },
+                    "required": ["part", "summary"]
+                },
+                "description": "Analyze the customer's request, identify the part of clothing the customer wants, give the list of the part and corresponding summary."
+            },
+        },
+        "required": ["polite_reply", "analysis"],
+        "description": "Response MUST contain polite reply and analysis of the customer's request."
+        },
+    }
+
+
+# Published handler schemas. A schema is never edited in place: a change is a new version, so the cached
+# prompt prefix (system message + tool schema) of the running version stays byte-identical between requests.
+HANDLER_VERSIONS = {
+    "beta_v0": handler_beta_v0,
+    "beta_v1": handler_beta_v1,
+    "beta_v2": handler_beta_v2,
+}
 
 
+# Static instructions and few-shot examples of the analysis call, sent before the user's text
+analysis_system_prompt = (
+    "You are the analysis step of a dedicated fashion consulting system. "
+    "Analyze what type of clothing the customer wants (tops, pants, outerwear, dress_skirt, or two or three of them) "
+    "from the customer's message, and always answer by calling the prompt_handler function. "
+    "The output should indicate which part the customer wants, and what kind of clothing item the customer wants "
+    "for each part. Every summary describes only the features of the item (color, material, sleeve length, "
+    "neckline, style, fit, occasion, seasonality, patterns or prints, unique design details), it is used for "
+    "similar item retrieval, so never use phrases like 'is requested' or 'are needed'.\n"
+    "\n"
+    "Examples:\n"
+    "Customer: I need something warm for hiking in the mountains next month.\n"
+    'prompt_handler: {"polite_reply": "Hi! Let\'s get you ready for the mountains.", "analysis": ['
+    '{"part": "tops", "summary": "thermal long-sleeve base layer, moisture-wicking, slim fit, outdoor"}, '
+    '{"part": "outerwear", "summary": "waterproof insulated hooded jacket, windproof, technical outdoor style"}, '
+    '{"part": "pants", "summary": "durable water-resistant hiking pants, stretch fabric, regular fit"}]}\n'
+    "Customer: A dress for a summer wedding, nothing too flashy.\n"
+    'prompt_handler: {"polite_reply": "Hello! A summer wedding sounds lovely.", "analysis": ['
+    '{"part": "dress_skirt", "summary": "light chiffon midi dress, pastel color, short sleeves, elegant and '
+    'understated, formal occasion"}]}\n'
+    "Customer: black sweater with a denim jacket\n"
+    'prompt_handler: {"polite_reply": "Hi there! A classic combination.", "analysis": ['
+    '{"part": "tops", "summary": "black knit crew-neck sweater, long sleeves, casual"}, '
+    '{"part": "outerwear", "summary": "blue denim trucker jacket, button front, casual"}]}\n'
+    "Customer: Office outfit for winter, I like muted colors and wide-leg trousers.\n"
+    'prompt_handler: {"polite_reply": "Good day! Let\'s put together a polished winter look.", "analysis": ['
+    '{"part": "tops", "summary": "cream merino wool turtleneck, long sleeves, fitted, business casual"}, '
+    '{"part": "pants", "summary": "charcoal wool-blend wide-leg trousers, high waist, pleated front, office"}, '
+    '{"part": "outerwear", "summary": "camel double-breasted wool coat, knee length, tailored, winter"}]}\n'
+    "Customer: Something sporty for the gym, my old leggings are worn out.\n"
+    'prompt_handler: {"polite_reply": "Hey! Let\'s find you some fresh gym wear.", "analysis": ['
+    '{"part": "pants", "summary": "black high-waisted compression leggings, stretchy, squat-proof, athletic"}, '
+    '{"part": "tops", "summary": "breathable quick-dry tank top, racerback, athletic fit, sportswear"}]}\n'
+    "Customer: what is the weather today?\n"
+    'prompt_handler: {"polite_reply": "Hi! I can\'t check the weather, but I can help you dress for it.", '
+    '"analysis": [{"part": "tops", "summary": "versatile cotton t-shirt, neutral color, regular fit, casual"}]}'
+)
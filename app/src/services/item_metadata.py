@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable
+from src.extensions.mysql_connection_pool import execute_query
+
+METADATA_CACHE_SIZE = int(os.getenv("ITEM_METADATA_CACHE_SIZE", 20000))
+# How long a cached catalog version is trusted before the next page re-reads its items (and the version).
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", 30))
+
+METADATA_COLUMNS = ("item_id", "item_name", "brand", "price", "link")
+# How often catalog_version() re-reads the version (search params follow it, see consulting_service.py)
+CATALOG_VERSION_POLL = float(os.getenv("CATALOG_VERSION_POLL", 5))
+
+
+class ItemMetadataCache:
+    """
+    # Description:
+        Read-through LRU of item_info rows (name, brand, price, link) shared by all requests of the process.
+        Misses of a request are resolved together with one `WHERE item_id IN (...)` query through the pool,
+        which also returns the catalog version (catalog_sync.sql). When the version differs from the one the
+        cache was filled under, the cache is cleared, so entries never outlive a catalog sync. Once the
+        version is older than `version_ttl`, the next page is read from MySQL again to re-check it.
+    """
+
+    def __init__(self, capacity: int = METADATA_CACHE_SIZE, version_ttl: float = CATALOG_VERSION_TTL):
+        self.capacity = capacity
+        self.version_ttl = version_ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.version_checked = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "queries": 0, "invalidations": 0}
+
+    def _set_version(self, version):
+        """Caller holds the lock."""
+        if self.version is not None and version != self.version:
+            self.entries.clear()
+            self.stats["invalidations"] += 1
+        self.version = version
+        self.version_checked = time.monotonic()
+
+    @staticmethod
+    def _read_version():
+        rows = execute_query("SELECT version FROM catalog_sync WHERE id = 1")
+        return rows[0]["version"] if rows else 0
+
+    def lookup(self, item_ids: Iterable[int]) -> Dict[int, dict]:
+        """
+        #* @param item_ids: Item ids of one response page
+        #* @return: {item_id: {'item_name', 'brand', 'price', 'link'}}, unknown ids are left out
+        """
+        item_ids = list(dict.fromkeys(int(i) for i in item_ids))
+        with self.lock:
+            found = {i: self.entries[i] for i in item_ids if i in self.entries}
+            for i in found:
+                self.entries.move_to_end(i)
+            # An unverified version re-reads every id of the page, with the version, in the same query
+            if self.version is None or time.monotonic() - self.version_checked > self.version_ttl:
+                found = {}
+            self.stats["hits"] += len(found)
+        missing = [i for i in item_ids if i not in found]
+        if not missing:
+            return found
+
+        placeholders = ", ".join(["%s"] * len(missing))
+        sql = (f"SELECT {', '.join(METADATA_COLUMNS)}, "
+               f"(SELECT version FROM catalog_sync WHERE id = 1) AS catalog_version "
+               f"FROM item_info WHERE item_id IN ({placeholders})")
+        rows = execute_query(sql, missing)
+        # No row carries the version when none of the ids exists, read it on its own so the page is verified
+        version = rows[0]["catalog_version"] if rows else self._read_version()
+        note_catalog_version(version or 0)
+
+        with self.lock:
+            self.stats["queries"] += 1 if rows else 2
+            self.stats["misses"] += len(missing)
+            self._set_version(version or 0)
+            for row in rows:
+                entry = {column: row[column] for column in METADATA_COLUMNS[1:]}
+                if entry["price"] is not None:
+                    entry["price"] = float(entry["price"])
+                self.entries[row["item_id"]] = entry
+                self.entries.move_to_end(row["item_id"])
+                found[row["item_id"]] = entry
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return found
+
+
+_catalog_version = (None, 0.0)  # (version, monotonic time it was read)
+_catalog_version_lock = threading.Lock()
+_catalog_version_refreshing = False
+
+
+def _refresh_catalog_version():
+    global _catalog_version, _catalog_version_refreshing
+    version = None
+    try:
+        rows = execute_query("SELECT version FROM catalog_sync WHERE id = 1")
+        version = rows[0]["version"] if rows else 0
+    except Exception as e:
+        print(f"Error reading the catalog version: {e}")
+    finally:
+        with _catalog_version_lock:
+            # On errors the last known version is kept until the next poll
+            _catalog_version = (_catalog_version[0] if version is None else version, time.monotonic())
+            _catalog_version_refreshing = False
+
+
+def catalog_version(max_age: float = CATALOG_VERSION_POLL):
+    """
+    #* @return: The last known catalog_sync version (None before the first read completed)
+    # Description:
+        db_initialize/milvus.py and rebuild.py bump the version after every sync / alias swap.
+        Never waits on MySQL, it is called on the search path: once the version is older than `max_age`
+        seconds, one background thread re-reads it and the callers keep the last known version meanwhile.
+        The metadata lookups also record the version they read (note_catalog_version).
+    """
+    global _catalog_version_refreshing
+    with _catalog_version_lock:
+        version, read_at = _catalog_version
+        if _catalog_version_refreshing or (read_at and time.monotonic() - read_at < max_age):
+            return version
+        _catalog_version_refreshing = True
+    threading.Thread(target=_refresh_catalog_version, name="catalog-version", daemon=True).start()
+    return version
+
+
+def note_catalog_version(version) -> None:
+    """Version read by another query (metadata lookup), it counts as a fresh poll."""
+    global _catalog_version
+    with _catalog_version_lock:
+        _catalog_version = (version, time.monotonic())
+
+
+_metadata_cache = None
+
+
+def get_item_metadata(item_ids: Iterable[int]) -> Dict[int, dict]:
+    """
+    #* @param item_ids: All item ids of the retriever's results
+    #* @return: {item_id: metadata}, at most one round-trip to MySQL per call
+    """
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = ItemMetadataCache()
+    return _metadata_cache.lookup(item_ids)
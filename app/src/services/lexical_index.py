@@ -0,0 +1,126 @@
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.services.generation import current_generation
+
+load_dotenv()
+
+# Directory written by db_initialize/lexical_index.py (its CURRENT generation is loaded), hybrid retrieval is
+# off when it is not set
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH")
+LEXICAL_POOL = int(os.getenv("LEXICAL_POOL", 50))    # ranked depth of each side of the fusion
+RRF_K = int(os.getenv("RRF_K", 60))
+CATEGORY_ARRAYS = ("item_ids", "offsets", "postings", "weights", "filters")
+
+
+class LexicalIndex:
+    """
+    # Description:
+        BM25 over the item descriptions with one inverted index per category collection.
+        Posting weights are precomputed offline, so a query only gathers the postings of its terms,
+        sums them per document (one bincount), drops the documents outside the gender/season filter
+        (packed bitsets, only the candidates' bits are read) and keeps the top documents.
+        All arrays are memory-mapped, workers forked from a preloading master share the pages.
+    """
+
+    def __init__(self, path: str):
+        path = current_generation(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        # Same tokenizer as the build
+        self.pattern = re.compile(meta["token_pattern"])
+        self.stopwords = frozenset(meta["stopwords"])
+        self.filter_rows = {name: i for i, name in enumerate(meta["filter_rows"])}
+        self.categories = {
+            category: {name: np.load(os.path.join(path, category, f"{name}.npy"), mmap_mode="r")
+                       for name in CATEGORY_ARRAYS}
+            for category in meta["categories"]
+        }
+
+    def query_terms(self, text: str) -> List[int]:
+        tokens = (token for token in self.pattern.findall(text.lower()) if token not in self.stopwords)
+        return sorted({self.term_ids[token] for token in tokens if token in self.term_ids})
+
+    def filter_mask(self, filters: np.ndarray, docs: np.ndarray, filter_dict: dict) -> np.ndarray:
+        """
+        #* @return: Which of `docs` pass the same gender/season conditions as build_filter_expr
+        """
+        def bits(row: str) -> np.ndarray:
+            packed = filters[self.filter_rows[row]][docs >> 3]
+            return ((packed >> (7 - (docs & 7))) & 1).astype(bool)
+
+        mask = np.ones(len(docs), dtype=bool)
+        genders = {'1': ["gender_1", "gender_3"], '2': ["gender_2", "gender_3"], '3': ["gender_3"]}
+        rows = genders.get(filter_dict.get('gender'))
+        if rows:
+            allowed = np.zeros(len(docs), dtype=bool)
+            for row in rows:
+                allowed |= bits(row)
+            mask &= allowed
+        for season in filter_dict.get('season') or []:
+            if season in self.filter_rows:
+                mask &= bits(season)
+        return mask
+
+    def search(self, category: str, text: str, filter_dict: dict = None,
+               limit: int = LEXICAL_POOL) -> Tuple[List[int], np.ndarray]:
+        """
+        #* @param category: Collection name (tops, pants, outerwear, dress_skirt)
+        #* @param text: Part summary
+        #* @param filter_dict: {'gender': '1', 'season': ['winter']}, as for the Milvus filter
+        #* @return: Item ids by descending BM25 score, and the scores
+        """
+        arrays = self.categories.get(category)
+        terms = self.query_terms(text)
+        if arrays is None or not terms:
+            return [], np.zeros(0, dtype=np.float32)
+        offsets, postings, weights = arrays["offsets"], arrays["postings"], arrays["weights"]
+        docs = np.concatenate([postings[offsets[t]:offsets[t + 1]] for t in terms])
+        if not len(docs):
+            return [], np.zeros(0, dtype=np.float32)
+        term_weights = np.concatenate([weights[offsets[t]:offsets[t + 1]] for t in terms])
+        # Dense accumulator over the category, cheaper than sorting the postings for frequent terms
+        scores = np.bincount(docs, weights=term_weights, minlength=len(arrays["item_ids"]))
+        docs = np.flatnonzero(scores)
+        scores = scores[docs].astype(np.float32)
+
+        if filter_dict:
+            mask = self.filter_mask(arrays["filters"], docs, filter_dict)
+            docs, scores = docs[mask], scores[mask]
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return arrays["item_ids"][docs[top]].tolist(), scores[top]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> Tuple[List[int], List[float]]:
+    """
+    #* @param rankings: Ranked id lists (best first) of the retrievers
+    #* @return: Ids by descending sum of 1 / (k + rank), ties keep the order of first appearance, and the sums
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    ids = sorted(scores, key=lambda item_id: -scores[item_id])
+    return ids, [scores[item_id] for item_id in ids]
+
+
+_index = None
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """
+    #* @return: The configured LexicalIndex, or None when LEXICAL_INDEX_PATH is not set
+    """
+    global _index
+    if _index is None and LEXICAL_INDEX_PATH:
+        _index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return _index
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable, List
+
+import numpy as np
+
+# Collect requests for up to MICRO_BATCH_WINDOW_MS after the first one of a batch (0 disables batching),
+# a batch is sent as soon as it holds MICRO_BATCH_MAX_SIZE requests.
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", 0))
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", 32))
+MICRO_BATCH_WORKERS = int(os.getenv("MICRO_BATCH_WORKERS", 4))
+
+
+class MicroBatcher:
+    """
+    # Description:
+        Collects requests of concurrent users and hands them to `handler` as one batch.
+        Requests are grouped by key (only requests with the same key can share a call), a group is
+        dispatched when it reaches `max_batch` or when its oldest request has waited `window_ms`.
+        `handler(key, items)` returns one result per item, an exception fails the whole batch.
+        The dispatcher thread starts on first use in each process, so it is safe to create before a fork.
+    """
+
+    def __init__(self, name: str, handler: Callable, window_ms: float = MICRO_BATCH_WINDOW_MS,
+                 max_batch: int = MICRO_BATCH_MAX_SIZE, workers: int = MICRO_BATCH_WORKERS):
+        self.name = name
+        self.handler = handler
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.workers = workers
+        self.groups = {}
+        self.condition = threading.Condition()
+        self._pid = None
+        self._executor = None
+        self.batch_sizes = deque(maxlen=1000)
+        self.waits_ms = deque(maxlen=1000)
+        self.counters = {"requests": 0, "batches": 0, "errors": 0}
+
+    def _ensure_started(self):
+        """Caller holds the condition."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.groups = {}
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-batch")
+            threading.Thread(target=self._loop, name=f"{self.name}-batcher", daemon=True).start()
+
+    def submit(self, item, key: Hashable = None):
+        """
+        #* @param item: One request
+        #* @param key: Requests are only batched with requests of the same key
+        #* @return: The handler's result for this item (blocks until its batch finished)
+        """
+        future = Future()
+        with self.condition:
+            self._ensure_started()
+            group = self.groups.setdefault(key, [])
+            group.append((item, future, time.monotonic()))
+            self.counters["requests"] += 1
+            self.condition.notify()
+        return future.result()
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = [key for key, group in self.groups.items()
+                       if len(group) >= self.max_batch or now - group[0][2] >= self.window]
+                if not due:
+                    deadlines = [group[0][2] + self.window for group in self.groups.values()]
+                    self.condition.wait(timeout=max(min(deadlines) - now, 0) if deadlines else None)
+                    continue
+                batches = []
+                for key in due:
+                    group = self.groups.pop(key)
+                    batches.append((key, group[:self.max_batch]))
+                    if len(group) > self.max_batch:
+                        self.groups[key] = group[self.max_batch:]
+            for key, batch in batches:
+                self._executor.submit(self._run, key, batch)
+
+    def _run(self, key, batch):
+        started = time.monotonic()
+        with self.condition:
+            self.counters["batches"] += 1
+            self.batch_sizes.append(len(batch))
+            self.waits_ms.extend((started - submitted) * 1000 for _, _, submitted in batch)
+        try:
+            results = list(self.handler(key, [item for item, _, _ in batch]))
+            if len(results) != len(batch):
+                # zip() would leave the unmatched callers waiting forever, fail the whole batch instead
+                raise RuntimeError(f"Batch handler returned {len(results)} results for {len(batch)} inputs")
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            with self.condition:
+                self.counters["errors"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+
+    def stats(self) -> dict:
+        """Counters, batch size and added wait (time queued before dispatch) over the last 1000 batches/requests."""
+        with self.condition:
+            sizes, waits, counters = list(self.batch_sizes), list(self.waits_ms), dict(self.counters)
+        return {
+            **counters,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batch_size_mean": round(float(np.mean(sizes)), 2) if sizes else 0.0,
+            "batch_size_max": max(sizes, default=0),
+            "added_wait_ms_p50": round(float(np.percentile(waits, 50)), 2) if waits else 0.0,
+            "added_wait_ms_p95": round(float(np.percentile(waits, 95)), 2) if waits else 0.0,
+        }
+
+
+_batchers = {}
+_lock = threading.Lock()
+
+
+def get_batcher(name: str, handler: Callable) -> MicroBatcher:
+    """
+    #* @return: The process-wide batcher called `name`, None when MICRO_BATCH_WINDOW_MS is 0
+    """
+    if MICRO_BATCH_WINDOW_MS <= 0:
+        return None
+    if name not in _batchers:
+        with _lock:
+            _batchers.setdefault(name, MicroBatcher(name, handler))
+    return _batchers[name]
+
+
+def batcher_stats() -> List[dict]:
+    return [{"name": name, **batcher.stats()} for name, batcher in _batchers.items()]
@@ -0,0 +1,97 @@
+import os
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+
+# Outfit selection over the per-part candidates (OUTFIT_SELECTION=0 keeps each part's top hit)
+OUTFIT_SELECTION = os.getenv("OUTFIT_SELECTION", "1") == "1"
+OUTFIT_POOL = int(os.getenv("OUTFIT_POOL", 5))                          # candidates retrieved per part
+OUTFIT_COHERENCE_WEIGHT = float(os.getenv("OUTFIT_COHERENCE_WEIGHT", 0.5))
+# Combinations scored at most: pools are pruned to their most relevant items so the score tensor stays
+# this small (e.g. 20 per part over 3 parts is 8000 combinations, over 4 parts it is pruned to 11 per part).
+OUTFIT_MAX_COMBINATIONS = int(os.getenv("OUTFIT_MAX_COMBINATIONS", 20000))
+
+Candidates = Tuple[List[int], np.ndarray, np.ndarray]  # (item ids, query relevance (K,), vectors (K, D))
+
+
+def decode_vector(value) -> np.ndarray:
+    """Milvus returns FLOAT16_VECTOR fields as raw bytes (sometimes wrapped in a list)."""
+    if isinstance(value, list) and value and isinstance(value[0], (bytes, bytearray)):
+        value = value[0]
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=np.float16).astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def scaled_relevance(scores) -> np.ndarray:
+    """
+    # * @param scores: Final ranking scores of one part's pool (rerank blend or fused RRF), best first
+    # * @return: Scores min-max scaled to 0..1 within the pool, so every part's ranking weighs the same
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    return (scores - low) / (high - low) if high > low else np.ones_like(scores)
+
+
+def prune(candidates: Candidates, keep: int) -> Candidates:
+    ids, relevance, vectors = candidates
+    order = np.argsort(-relevance, kind="stable")[:keep]
+    return [ids[i] for i in order], relevance[order], vectors[order]
+
+
+def select_outfit(candidates: Dict[str, Candidates], coherence_weight: float = OUTFIT_COHERENCE_WEIGHT,
+                  max_combinations: int = OUTFIT_MAX_COMBINATIONS) -> Dict[str, int]:
+    """
+    # * @param candidates: {part: (item ids, relevance to the part query, item vectors)}
+    # * @return: {part: chosen item id}
+    # Description:
+        Scores every cross-part combination at once: the (K1 x K2 x ... x Kp) tensor is the mean query
+        relevance of the chosen items plus `coherence_weight` times their mean pairwise cosine similarity,
+        built by broadcasting one relevance vector per part and one similarity matrix per pair of parts.
+        Pools are first pruned to their floor(max_combinations ** (1 / parts)) most relevant items.
+    """
+    parts = [part for part, (ids, _, _) in candidates.items() if len(ids)]
+    if len(parts) < 2:
+        return {part: candidates[part][0][int(np.argmax(candidates[part][1]))] for part in parts}
+
+    keep = max(1, int(max_combinations ** (1 / len(parts))))
+    pools = [prune(candidates[part], keep) for part in parts]
+    vectors = []
+    for _, _, part_vectors in pools:
+        norms = np.linalg.norm(part_vectors, axis=1, keepdims=True)
+        vectors.append(part_vectors / np.where(norms > 0, norms, 1))
+
+    n = len(parts)
+    score = np.zeros([len(ids) for ids, _, _ in pools], dtype=np.float32)
+    for a, (_, relevance, _) in enumerate(pools):
+        shape = [1] * n
+        shape[a] = -1
+        score += relevance.astype(np.float32).reshape(shape) / n
+    pair_weight = coherence_weight / (n * (n - 1) / 2)
+    for a in range(n):
+        for b in range(a + 1, n):
+            shape = [1] * n
+            shape[a], shape[b] = len(vectors[a]), len(vectors[b])
+            score += pair_weight * (vectors[a] @ vectors[b].T).reshape(shape)
+
+    best = np.unravel_index(int(np.argmax(score)), score.shape)
+    return {part: pools[i][0][best[i]] for i, part in enumerate(parts)}
+
+
+def arrange_outfit(part_img_ids: Dict[str, List[int]], candidates: Dict[str, Candidates]) -> Dict[str, List[int]]:
+    """
+    # * @return: part_img_ids with the chosen outfit moved to the front of every part (value[0] is the pick)
+    """
+    started = time.perf_counter()
+    chosen = select_outfit(candidates)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > 5:
+        print(f"Outfit selection took {elapsed_ms:.1f} ms for pools {[len(c[0]) for c in candidates.values()]}")
+    arranged = {}
+    for part, ids in part_img_ids.items():
+        if part in chosen:
+            ids = [chosen[part]] + [item_id for item_id in ids if item_id != chosen[part]]
+        arranged[part] = ids
+    return arranged
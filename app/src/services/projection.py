@@ -0,0 +1,52 @@
+import os
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Projection file selected by db_initialize/dim_reduction.py. It must be the same file the collections
+# were ingested with, the collection schema records the resulting dimension.
+PROJECTION_PATH = os.getenv("EMBEDDING_PROJECTION_PATH")
+
+
+class Projection:
+    """
+    # Description:
+        Reduces a text-embedding-004 vector the same way ingestion did.
+        kind == 'pca':      (vector - mean) @ components.T, then normalized
+        kind == 'truncate': first `dim` values, then normalized (the API can return these directly)
+    """
+
+    def __init__(self, path: str):
+        with np.load(path) as f:
+            self.kind = str(f["kind"])
+            self.dim = int(f["dim"])
+            self.mean = f["mean"].astype(np.float32)
+            self.components = f["components"][:self.dim].astype(np.float32)
+
+    def output_dimensionality(self) -> Optional[int]:
+        """Dimension to request from the embedding API, None when the full vector is needed."""
+        return self.dim if self.kind == "truncate" else None
+
+    def apply(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.kind == "pca":
+            vector = (vector - self.mean) @ self.components.T
+        else:
+            vector = vector[:self.dim]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+_projection = None
+
+
+def get_projection() -> Optional[Projection]:
+    """
+    #* @return: The configured Projection, or None when EMBEDDING_PROJECTION_PATH is not set
+    """
+    global _projection
+    if _projection is None and PROJECTION_PATH:
+        _projection = Projection(PROJECTION_PATH)
+    return _projection
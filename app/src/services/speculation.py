@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Embed the raw prompt and search every category while the LLM analyses it (off by default: it adds one
+# embed call and four searches per consultation, see speculation_stats() for what it pays back).
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "0") == "1"
+# A part takes the speculative results when its summary and the raw prompt are this similar (Dice on content words)
+SPECULATION_MIN_SIMILARITY = float(os.getenv("SPECULATION_MIN_SIMILARITY", 0.7))
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", 8))
+CATEGORIES = ["tops", "pants", "outerwear", "dress_skirt"]
+
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "but", "by", "can", "could", "do", "for", "from", "get",
+    "give", "have", "i", "i'd", "i'm", "im", "in", "is", "it", "like", "looking", "me", "my", "need", "of",
+    "on", "or", "please", "some", "something", "that", "the", "this", "to", "want", "wanna", "with", "would", "you",
+}
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+_stats = {"requests": 0, "parts": 0, "hits": 0, "misses": 0, "embed_calls": 0, "searches": 0,
+          "searches_used": 0, "search_errors": 0, "search_seconds": 0.0}
+_stats_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def content_tokens(text: str) -> set:
+    return {token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS}
+
+
+def lexical_similarity(prompt: str, summary: str) -> float:
+    """Dice coefficient of the content words, 1.0 when the summary just restates the prompt."""
+    prompt_tokens, summary_tokens = content_tokens(prompt), content_tokens(summary)
+    if not prompt_tokens or not summary_tokens:
+        return 0.0
+    return 2 * len(prompt_tokens & summary_tokens) / (len(prompt_tokens) + len(summary_tokens))
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Process-wide pool of the speculative calls, created on first use in each (forked) process."""
+    global _executor, _executor_pid
+    with _stats_lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculation")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+class Speculation:
+    """
+    # Description:
+        Speculative retrieval of one consultation: the raw prompt is embedded once and every category
+        collection is searched with it in parallel, all on the shared pool.
+        `take(part)` hands out the running search of the part when the analysed summary is close enough
+        to the raw prompt. Searches nobody takes run to the end, they are the extra load in the stats.
+    """
+
+    def __init__(self, prompt: str, embed: Callable, search: Callable, categories=CATEGORIES):
+        """
+        #* @param embed: text -> query vector
+        #* @param search: (category, query vector) -> retrieval result of the category
+        """
+        self.prompt = prompt
+        self.search = search
+        self.executor = get_executor()
+        self.futures = {category: Future() for category in categories}
+        self.taken = set()
+        self.lock = threading.Lock()
+        _count(requests=1, embed_calls=1, searches=len(self.futures))
+        self.executor.submit(embed, prompt).add_done_callback(self._search_all)
+
+    def _search_all(self, embedding: Future):
+        # Chained through callbacks: no pool thread ever blocks on another task of the pool
+        error = embedding.exception()
+        for category, future in self.futures.items():
+            if error is not None:
+                future.set_exception(error)
+                continue
+            self.executor.submit(self._timed_search, category, embedding.result()).add_done_callback(
+                lambda search, future=future: self._forward(search, future))
+
+    def _timed_search(self, category: str, vector):
+        started = time.perf_counter()
+        try:
+            return self.search(category, vector)
+        finally:
+            _count(search_seconds=time.perf_counter() - started)
+
+    @staticmethod
+    def _forward(search: Future, future: Future):
+        if search.exception() is not None:
+            _count(search_errors=1)
+            future.set_exception(search.exception())
+        else:
+            future.set_result(search.result())
+
+    def take(self, part: dict) -> Optional[Future]:
+        """
+        #* @param part: Analysed {'part': ..., 'summary': ...}
+        #* @return: Future of the speculative result of the part, None when it has to be retrieved normally
+        """
+        future = self.futures.get(part['part'])
+        with self.lock:
+            close = (future is not None and part['part'] not in self.taken
+                     and lexical_similarity(self.prompt, part['summary']) >= SPECULATION_MIN_SIMILARITY)
+            if close:
+                self.taken.add(part['part'])
+        _count(parts=1, hits=int(close), misses=int(not close), searches_used=int(close))
+        return future if close else None
+
+
+def speculation_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["enabled"] = SPECULATIVE_RETRIEVAL
+    stats["hit_rate"] = round(stats["hits"] / stats["parts"], 3) if stats["parts"] else 0.0
+    # Extra load: every speculative embed call, and the searches whose results were not used
+    stats["wasted_searches"] = stats["searches"] - stats["searches_used"]
+    stats["search_seconds"] = round(stats["search_seconds"], 3)
+    return stats
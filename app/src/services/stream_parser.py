@@ -0,0 +1,73 @@
+import json
+from typing import List
+
+
+class AnalysisStreamParser:
+    """
+    # Description:
+        Incremental scanner for the streamed `prompt_handler` arguments, e.g.
+            {"polite_reply": "Hi!", "analysis": [{"part": "tops", "summary": "..."}, {"part": ...
+        `feed(fragment)` returns the objects of the top-level "analysis" array completed by that fragment,
+        so retrieval of a part can start while the model is still writing the next one.
+        Only strings and nesting are tracked (one pass over each character), every completed item is
+        decoded with json.loads, and `result()` decodes the whole document once the stream has ended.
+    """
+
+    def __init__(self, array_key: str = "analysis"):
+        self.array_key = array_key
+        self.text = ""
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.keys = {}              # nesting level -> key of the value being written at that level
+        self.array_level = None     # nesting level of the "analysis" array while it is open
+        self.item_start = None
+
+    def feed(self, fragment: str) -> List[dict]:
+        """
+        #* @param fragment: Next piece of the arguments string
+        #* @return: The analysis items completed in this fragment
+        """
+        completed = []
+        start = len(self.text)
+        self.text += fragment
+        text = self.text
+        for index in range(start, len(text)):
+            char = text[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = text[self.string_start:index + 1]
+                continue
+            if char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char == ":" and self.stack and self.stack[-1] == "{":
+                self.keys[len(self.stack)] = json.loads(self.last_string)
+            elif char in "{[":
+                self.stack.append(char)
+                level = len(self.stack)
+                if char == "[" and level == 2 and self.keys.get(1) == self.array_key:
+                    self.array_level = level
+                elif char == "{" and self.array_level is not None and level == self.array_level + 1:
+                    self.item_start = index
+            elif char in "}]":
+                level = len(self.stack)
+                if char == "}" and self.array_level is not None and level == self.array_level + 1:
+                    completed.append(json.loads(text[self.item_start:index + 1]))
+                    self.item_start = None
+                elif char == "]" and level == self.array_level:
+                    self.array_level = None
+                self.keys.pop(level, None)
+                self.stack.pop()
+        return completed
+
+    def result(self) -> dict:
+        """The complete arguments, call after the stream has ended."""
+        return json.loads(self.text)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app imports its modules as `src.…` from the app directory (see wsgi.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
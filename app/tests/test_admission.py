@@ -0,0 +1,82 @@
+import pytest
+
+from src.services.admission import AdmissionController
+
+
+def controller(**overrides):
+    options = dict(min_limit=1, max_limit=4, queue_size=0, queue_wait=0.05,
+                   client_rate_per_min=600, client_burst=100)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_full_queue_is_rejected_with_503():
+    admission = controller(max_limit=1, queue_size=0)
+    assert admission.acquire("a") is None
+    rejection = admission.acquire("b")
+    assert rejection.status == 503 and rejection.retry_after >= 1
+    assert admission.stats()["rejected_queue_full"] == 1
+    admission.release(0.1)
+    assert admission.acquire("b") is None
+
+
+def test_queued_request_waiting_too_long_is_rejected_with_503():
+    admission = controller(max_limit=1, queue_size=1, queue_wait=0.05)
+    assert admission.acquire("a") is None
+    assert admission.acquire("b").status == 503
+    assert admission.stats()["rejected_wait"] == 1
+
+
+def test_empty_client_bucket_is_rejected_with_429():
+    admission = controller(client_rate_per_min=1, client_burst=2)
+    for _ in range(2):
+        assert admission.acquire("a") is None
+        admission.release(0.1)
+    rejection = admission.acquire("a")
+    assert rejection.status == 429 and rejection.retry_after >= 1
+    # Other clients have their own bucket
+    assert admission.acquire("b") is None
+
+
+def test_limit_shrinks_when_latency_inflates_and_grows_back():
+    admission = controller(max_limit=20, client_burst=1000)
+    for latency in [0.2] * 50:
+        assert admission.acquire("a") is None
+        admission.release(latency)
+    assert admission.limit == 20
+    for latency in [2.0] * 10:
+        assert admission.acquire("a") is None
+        admission.release(latency)
+    shrunk = admission.limit
+    assert shrunk < 10
+    for latency in [0.2] * 50:
+        assert admission.acquire("a") is None
+        admission.release(latency)
+    assert admission.limit > shrunk
+
+
+@pytest.fixture
+def flask_app(monkeypatch):
+    pytest.importorskip("flask", reason="the app's dependencies are not installed")
+    import app as app_module
+
+    def make(hops):
+        monkeypatch.setattr(app_module, "TRUSTED_PROXY_HOPS", hops)
+        application = app_module.create_app(connect=False)
+        application.add_url_rule("/client-id", "client_id", app_module.client_id)
+        return application.test_client()
+    return make
+
+
+def test_client_id_ignores_forwarded_for_without_trusted_proxies(flask_app):
+    client = flask_app(0)
+    response = client.get("/client-id", headers={"X-Forwarded-For": "6.6.6.6"},
+                          environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert response.get_data(as_text=True) == "10.0.0.1"
+
+
+def test_client_id_takes_the_address_seen_by_the_trusted_proxy(flask_app):
+    client = flask_app(1)
+    response = client.get("/client-id", headers={"X-Forwarded-For": "6.6.6.6, 203.0.113.7"},
+                          environ_base={"REMOTE_ADDR": "10.0.0.1"})
+    assert response.get_data(as_text=True) == "203.0.113.7"
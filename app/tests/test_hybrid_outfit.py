@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.services.lexical_index import reciprocal_rank_fusion
+from src.services.outfit import scaled_relevance, select_outfit
+
+POOL = 5
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def part_candidates(ids, relevance, vectors):
+    return ids, np.asarray(relevance, dtype=np.float32), np.stack([vectors[i] for i in ids])
+
+
+def test_lexical_only_hit_at_top_of_fusion_survives_outfit_selection():
+    # Vector side: 10..14 close to the query. BM25: item 99 (exact brand match) first, unseen by the vector side
+    vector_ids = [10, 11, 12, 13, 14]
+    cosine = {10: 0.82, 11: 0.81, 12: 0.80, 13: 0.79, 14: 0.78, 99: 0.35}
+    lexical_ids = [99]
+    vectors = {10: unit(1, 0, 0), 11: unit(1, 0.1, 0), 12: unit(1, 0.2, 0), 13: unit(1, 0.3, 0),
+               14: unit(1, 0.4, 0), 99: unit(0.8, 0, 0.6)}
+    other = ([7], np.ones(1, dtype=np.float32), np.stack([unit(0.7, 0, 0.7)]))
+
+    fused_ids, fused = reciprocal_rank_fusion([vector_ids, lexical_ids])
+    ids, scores = fused_ids[:POOL], fused[:POOL]
+    assert 99 in ids and scores[ids.index(99)] == max(scores)
+
+    # Relevance from the fused ranking: the brand match is shown
+    chosen = select_outfit({"tops": part_candidates(ids, scaled_relevance(scores), vectors), "pants": other})
+    assert chosen["tops"] == 99
+
+    # Raw vector similarity would re-sort the pool and bury it
+    chosen = select_outfit({"tops": part_candidates(ids, [cosine[i] for i in ids], vectors), "pants": other})
+    assert chosen["tops"] != 99
+
+
+def test_scaled_relevance_keeps_the_ranking():
+    relevance = scaled_relevance([0.0328, 0.0164, 0.0161, 0.0159])
+    assert relevance[0] == 1.0 and relevance[-1] == 0.0
+    assert np.all(np.diff(relevance) < 0)
+    assert scaled_relevance([0.02]).tolist() == [1.0]
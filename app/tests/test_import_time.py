@@ -0,0 +1,27 @@
+import os
+import statistics
+
+import pytest
+
+from import_bench import IMPORT_BUDGET_MS, lazy_violations, measure_import
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 3
+
+pytest.importorskip("flask", reason="the app's dependencies are not installed")
+
+
+@pytest.fixture(scope="module")
+def import_runs():
+    # Fresh interpreter per run (-X importtime), nothing is imported from this process' module cache
+    return [measure_import("app", APP_DIR) for _ in range(RUNS)]
+
+
+def test_heavy_clients_load_on_first_use(import_runs):
+    for _, modules in import_runs:
+        assert lazy_violations(modules) == []
+
+
+def test_import_time_within_budget(import_runs):
+    median_ms = statistics.median(total for total, _ in import_runs) / 1000
+    assert median_ms < IMPORT_BUDGET_MS, f"import app took {median_ms:.1f} ms, budget {IMPORT_BUDGET_MS:.0f} ms"
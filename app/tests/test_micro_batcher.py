@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.services.micro_batcher import MicroBatcher
+
+
+def submit_all(batcher, items, key=None):
+    """Submit every item from its own thread at once, returns each caller's result or exception."""
+    barrier = threading.Barrier(len(items))
+
+    def call(item):
+        barrier.wait()
+        try:
+            return batcher.submit(item, key=key)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return list(executor.map(call, items))
+
+
+def recording_handler(batches):
+    def handler(key, items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+    return handler
+
+
+def test_full_batches_are_sent_without_waiting_for_the_window():
+    batches = []
+    batcher = MicroBatcher("full", recording_handler(batches), window_ms=5000, max_batch=4)
+    started = time.monotonic()
+    results = submit_all(batcher, list(range(8)))
+    assert time.monotonic() - started < 2.5
+    assert results == [item * 2 for item in range(8)]
+    assert sorted(len(batch) for batch in batches) == [4, 4]
+
+
+def test_partial_batch_is_sent_when_the_window_expires():
+    batches = []
+    batcher = MicroBatcher("window", recording_handler(batches), window_ms=200, max_batch=32)
+    started = time.monotonic()
+    results = submit_all(batcher, [1, 2, 3])
+    assert time.monotonic() - started >= 0.15
+    assert results == [2, 4, 6]
+    assert len(batches) == 1 and sorted(batches[0]) == [1, 2, 3]
+
+
+def test_wrong_result_count_fails_every_caller():
+    batcher = MicroBatcher("short", lambda key, items: items[:1], window_ms=100, max_batch=3)
+    results = submit_all(batcher, [1, 2, 3])
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert "1 results for 3 inputs" in str(results[0])
+
+
+def test_handler_exception_reaches_every_caller():
+    def handler(key, items):
+        raise ValueError("backend down")
+
+    batcher = MicroBatcher("failing", handler, window_ms=100, max_batch=3)
+    results = submit_all(batcher, [1, 2, 3])
+    assert [str(result) for result in results] == ["backend down"] * 3
+    assert batcher.stats()["errors"] == 1
+
+
+def test_requests_are_only_batched_with_the_same_key():
+    batches = []
+    batcher = MicroBatcher("keys", recording_handler(batches), window_ms=100, max_batch=32)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(batcher.submit, item, key) for key in ("a", "b") for item in (1, 2)]
+        assert [future.result() for future in futures] == [2, 4, 2, 4]
+    assert all(len(batch) <= 2 for batch in batches)
@@ -0,0 +1,77 @@
+import json
+import random
+
+import pytest
+
+from src.services.stream_parser import AnalysisStreamParser
+
+ARGUMENTS = json.dumps({
+    "polite_reply": "Hi! \"Cozy\" {winter} [looks] \\ coming up, café style.",
+    "analysis": [
+        {"part": "tops", "summary": "cream knit sweater with a \"North Face\" logo, {crew} neck"},
+        {"part": "pants", "summary": "black pants \\ slim fit, élégant, \\\"quoted\\\" ] }"},
+        {"part": "outerwear", "summary": "parka, \"analysis\": [not a key], tag 🧥", "extra": {"a": [1, {"b": 2}]}},
+    ],
+}, ensure_ascii=True)
+
+
+def emitted(fragments):
+    parser = AnalysisStreamParser()
+    items = []
+    for fragment in fragments:
+        items.extend(parser.feed(fragment))
+    return items, parser.result()
+
+
+def split(text, cuts):
+    cuts = sorted(set(cuts))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_arguments_exercise_every_escape():
+    assert '\\"' in ARGUMENTS and '\\\\' in ARGUMENTS and '\\u00e9' in ARGUMENTS
+
+
+def test_any_two_fragments():
+    for cut in range(1, len(ARGUMENTS)):
+        items, result = emitted(split(ARGUMENTS, [cut]))
+        assert items == json.loads(ARGUMENTS)["analysis"], f"split at {cut}: {ARGUMENTS[cut - 5:cut + 5]!r}"
+        assert result == json.loads(ARGUMENTS)
+
+
+def test_one_character_per_fragment():
+    items, _ = emitted(list(ARGUMENTS))
+    assert items == json.loads(ARGUMENTS)["analysis"]
+
+
+@pytest.mark.parametrize("token", ['\\"', '\\\\', '\\u00e9', '\\ud83e'])
+def test_fragments_split_inside_escape_sequences(token):
+    cuts = []
+    start = ARGUMENTS.find(token)
+    while start != -1:
+        cuts.extend(range(start + 1, start + len(token)))
+        start = ARGUMENTS.find(token, start + 1)
+    assert cuts
+    items, _ = emitted(split(ARGUMENTS, cuts))
+    assert items == json.loads(ARGUMENTS)["analysis"]
+
+
+def test_each_part_is_emitted_once_when_it_completes():
+    parts = json.loads(ARGUMENTS)["analysis"]
+    parser = AnalysisStreamParser()
+    seen = []
+    for index, char in enumerate(ARGUMENTS):
+        for item in parser.feed(char):
+            seen.append(item)
+            # Emitted on the closing brace of the item, not earlier
+            assert json.loads(ARGUMENTS[:index + 1] + "]}")["analysis"][-1] == item
+    assert seen == parts
+
+
+def test_random_fragmentation():
+    rng = random.Random(0)
+    expected = json.loads(ARGUMENTS)["analysis"]
+    for _ in range(200):
+        cuts = rng.sample(range(1, len(ARGUMENTS)), rng.randint(1, 40))
+        items, _ = emitted(split(ARGUMENTS, cuts))
+        assert items == expected
@@ -0,0 +1,10 @@
+"""Production entry point: `gunicorn -c gunicorn.conf.py wsgi:app` (see gunicorn.conf.py).
+
+Imported once by the master with preload_app: the serving code and the memory-mapped projection / rerank
+files are shared copy-on-write by the workers, and no connection is opened before the fork.
+"""
+from app import create_app
+from src.extensions.warmup import preload
+
+preload()
+app = create_app(connect=False)
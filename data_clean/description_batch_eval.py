@@ -0,0 +1,139 @@
+"""Quality/cost comparison of description request layouts on a sample of items.
+
+Every configuration `<items_per_request>x<max_side>` (max_side 0 = original image) describes the same sample.
+The first configuration is the baseline (default `1x0`, the original one-item full-size request).
+Reported per configuration:
+    requests, prompt/output tokens per item, estimated cost per 1k items, uploaded image bytes per item,
+    seconds per item, coverage (items answered), and quality as the cosine similarity between the
+    text-embedding-004 embeddings of its descriptions and the baseline descriptions of the same items.
+
+Example:
+    python description_batch_eval.py --sample 40 --configs 1x0 1x512 4x512 8x384 --output batch_eval.json
+"""
+import argparse
+import io
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from gemini_description_generator import (genai, model, generator_prompt, batch_prompt, batch_response_schema,
+                                          image_folder, load_image, clean_description, parse_batch_response,
+                                          create_pool)
+
+
+def sample_ids(pool, n):
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            cursor.execute("SELECT goodsNo AS item_id FROM musina_info ORDER BY RAND() LIMIT %s", (n * 2,))
+            ids = [row["item_id"] for row in cursor.fetchall()]
+    finally:
+        con.close()
+    return [i for i in ids if os.path.exists(os.path.join(image_folder, f"{i}.jpg"))][:n]
+
+
+def image_bytes(image):
+    if isinstance(image, dict):
+        return len(image["data"])
+    buffer = io.BytesIO()
+    image.save(buffer, format=image.format or "JPEG")
+    return buffer.tell()
+
+
+def run_config(ids, items_per_request, max_side, quality):
+    descriptions, stats = {}, {"requests": 0, "prompt_tokens": 0, "output_tokens": 0, "upload_bytes": 0}
+    started = perf_counter()
+    for i in range(0, len(ids), items_per_request):
+        group = ids[i:i + items_per_request]
+        images = [load_image(item_id, max_side, quality) for item_id in group]
+        stats["upload_bytes"] += sum(image_bytes(image) for image in images)
+        try:
+            if items_per_request == 1:
+                response = model.generate_content([generator_prompt, images[0]])
+                answered = {group[0]: clean_description(response.text)}
+            else:
+                contents = [batch_prompt]
+                for item_id, image in zip(group, images):
+                    contents += [f"Item id: {item_id}", image]
+                response = model.generate_content(contents, generation_config={
+                    "response_mime_type": "application/json", "response_schema": batch_response_schema})
+                answered = parse_batch_response(response.text, group)
+        except Exception as e:
+            print(f"Request for {group} failed: {e}")
+            continue
+        stats["requests"] += 1
+        stats["prompt_tokens"] += response.usage_metadata.prompt_token_count
+        stats["output_tokens"] += response.usage_metadata.candidates_token_count
+        descriptions.update(answered)
+    stats["seconds"] = perf_counter() - started
+    return descriptions, stats
+
+
+def embed(texts):
+    vectors = []
+    for i in range(0, len(texts), 100):
+        result = genai.embed_content(model="models/text-embedding-004", content=texts[i:i + 100])
+        vectors.extend(result["embedding"])
+    vectors = np.array(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def parse_config(value):
+    items, side = value.lower().split("x")
+    return int(items), int(side)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare description request layouts on a sample.")
+    parser.add_argument("--sample", type=int, default=40)
+    parser.add_argument("--configs", nargs="+", type=parse_config, default=[(1, 0), (1, 512), (4, 512), (8, 384)],
+                        help="<items_per_request>x<max_side>, the first one is the baseline")
+    parser.add_argument("--jpeg-quality", type=int, default=85)
+    parser.add_argument("--input-price", type=float, default=0.075, help="USD per 1M input tokens")
+    parser.add_argument("--output-price", type=float, default=0.30, help="USD per 1M output tokens")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ids = sample_ids(create_pool(max_connections=1), args.sample)
+    print(f"Evaluating {len(ids)} items")
+
+    runs = [(config, *run_config(ids, *config, args.jpeg_quality)) for config in args.configs]
+    baseline = runs[0][1]
+    report = []
+    for (items_per_request, max_side), descriptions, stats in runs:
+        common = [i for i in ids if i in descriptions and i in baseline]
+        similarity = float("nan")
+        if common:
+            a = embed([baseline[i] for i in common])
+            b = embed([descriptions[i] for i in common])
+            similarity = float((a * b).sum(axis=1).mean())
+        answered = max(len(descriptions), 1)
+        cost = (stats["prompt_tokens"] * args.input_price + stats["output_tokens"] * args.output_price) / 1e6
+        report.append({
+            "config": f"{items_per_request}x{max_side}",
+            "requests": stats["requests"],
+            "coverage": round(len(descriptions) / max(len(ids), 1), 3),
+            "prompt_tokens_per_item": round(stats["prompt_tokens"] / answered, 1),
+            "output_tokens_per_item": round(stats["output_tokens"] / answered, 1),
+            "usd_per_1k_items": round(cost / answered * 1000, 4),
+            "upload_kb_per_item": round(stats["upload_bytes"] / max(len(ids), 1) / 1024, 1),
+            "seconds_per_item": round(stats["seconds"] / max(len(ids), 1), 3),
+            "similarity_to_baseline": round(similarity, 4),
+        })
+
+    header = list(report[0])
+    print("  ".join(f"{h:>22}" for h in header))
+    for row in report:
+        print("  ".join(f"{str(row[h]):>22}" for h in header))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"ids": ids, "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 from dotenv import load_dotenv
 import os
+import io
+import json
+import random
+import asyncio
+import argparse
+from collections import deque
+from time import monotonic
 import google.generativeai as genai
 import PIL.Image
 import pymysql
-from time import sleep
-from multiprocessing import Process, Queue
-import multiprocessing
+from dbutils.pooled_db import PooledDB
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -45,125 +50,380 @@ Example Output:
 > A white cotton T-shirt with a soft ribbed texture, short sleeves, a round neck, casual style, slim fit, suitable for everyday wear in spring or summer, and a subtle crown print.
 """
 
+# Multi-item mode: several images share one copy of the prompt, the answer is JSON keyed by item id.
+batch_prompt = generator_prompt + """
+You will receive several clothing images, each preceded by a line "Item id: <id>".
+Describe every image independently following the steps above, and answer ONLY with a JSON array of
+{"item_id": <id>, "description": "<description>"} objects, one per image, using the ids exactly as given.
+"""
+
+batch_response_schema = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "item_id": {"type": "integer"},
+            "description": {"type": "string"},
+        },
+        "required": ["item_id", "description"],
+    },
+}
+
 image_folder = r"imgs_path"
 
 # ----------------- Database Functions -----------------
 
-def connect_to_db():
-    try:
-        load_dotenv()  # Load environment variables
-        connection = pymysql.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            db=os.getenv("DB_NAME"),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        # print("Connection successful!")
-        return connection
-    except Exception as e:
-        print(f"Error connecting to the database: {e}")
-        return None
-    
-
-def get_data_from_db_using_sql(connection, sql):
+def create_pool(max_connections=4):
+    """One small pool shared by the id query and the batched writes."""
+    load_dotenv()
+    return PooledDB(
+        creator=pymysql,
+        maxconnections=max_connections,
+        blocking=True,
+        ping=1,
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        database=os.getenv("DB_NAME"),
+        port=int(os.getenv("DB_PORT", 3306)),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def get_pending_ids(pool, after_id=0, exclude=()):
+    """Ids still missing a description, in goodsNo order, skipping everything up to the checkpoint watermark."""
+    # sql = 'SELECT item_id FROM classify_amazon WHERE item_label <> 0 AND img_text_prob < 30 AND generate_description IS NULL'
+    # Near duplicates (item_canonical, see image_dedup.py) are not described, they copy their canonical item's text
+    sql = """SELECT goodsNo as item_id FROM musina_info
+             WHERE generate_description IS NULL AND goodsNo > %s
+             AND NOT EXISTS (SELECT 1 FROM item_canonical
+                             WHERE item_canonical.item_id = musina_info.goodsNo
+                             AND item_canonical.canonical_id <> item_canonical.item_id)
+             ORDER BY goodsNo"""
+    con = pool.connection()
     try:
-        with connection.cursor() as cursor:
-            # Example SQL query to fetch data
-            sql_query = f"{sql}"
-            cursor.execute(sql_query)
-            result = cursor.fetchall()  # Fetch all rows
-            return result
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return None
-    
-
-def update_data_in_db_using_sql(connection, sql):
+        with con.cursor() as cursor:
+            cursor.execute(sql, (after_id,))
+            excluded = set(exclude)
+            return [row['item_id'] for row in cursor.fetchall() if row['item_id'] not in excluded]
+    finally:
+        con.close()
+
+
+def write_descriptions(pool, rows):
+    """rows: [(generate_description, item_id), ...] written with one parameterized executemany."""
+    sql = "UPDATE musina_info SET generate_description = %s WHERE goodsNo = %s"
+    con = pool.connection()
     try:
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
-            connection.commit()
-            return True
-    except Exception as e:
-        print(f"Error updating data: {e}")
-        return False
-
-def close_connection(connection):
+        with con.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+def copy_canonical_descriptions(pool):
+    """Give near-duplicate items the description generated for their canonical item, returns rows updated."""
+    sql = """UPDATE musina_info
+             INNER JOIN item_canonical ON item_canonical.item_id = musina_info.goodsNo
+             INNER JOIN musina_info AS canonical ON canonical.goodsNo = item_canonical.canonical_id
+             SET musina_info.generate_description = canonical.generate_description
+             WHERE item_canonical.canonical_id <> item_canonical.item_id
+             AND musina_info.generate_description IS NULL
+             AND canonical.generate_description IS NOT NULL"""
+    con = pool.connection()
     try:
-        if connection:
-            connection.close()
-    except Exception as e:
-        print(f"Error closing the connection: {e}")
+        with con.cursor() as cursor:
+            updated = cursor.execute(sql)
+        con.commit()
+        return updated
+    finally:
+        con.close()
+
+# ----------------- Rate Limiting & Checkpointing -----------------
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1.0):
+        async with self.lock:
+            while True:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class Checkpoint:
+    """
+    Resume state persisted after every committed write batch:
+      watermark: every id <= watermark is committed or permanently failed,
+      failed:    ids that exhausted their retries (skipped on resume unless --retry-failed).
+    Ids above the watermark that were already committed are skipped by `generate_description IS NULL`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.watermark = 0
+        self.failed = set()
+        self.order = deque()
+        self.resolved = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.watermark = state.get("watermark", 0)
+            self.failed = set(state.get("failed", []))
+
+    def track(self, ids):
+        self.order.extend(ids)
+
+    def resolve(self, item_id, failed=False):
+        self.resolved.add(item_id)
+        if failed:
+            self.failed.add(item_id)
+
+    def save(self):
+        while self.order and self.order[0] in self.resolved:
+            self.resolved.discard(self.order[0])
+            self.watermark = self.order.popleft()
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"watermark": self.watermark, "failed": sorted(self.failed)}, f)
+        os.replace(tmp_path, self.path)
 
 # ----------------- Main Functions -----------------
 
-def get_all_ids():
-    con = connect_to_db()
-    # sql = 'SELECT item_id FROM classify_amazon WHERE item_label <> 0 AND img_text_prob < 30 AND generate_description IS NULL'
-    sql = 'SELECT goodsNo as item_id FROM musina_info WHERE generate_description IS NULL'
-    result = get_data_from_db_using_sql(con, sql)
-    con.close()
-    return result
+def clean_description(text: str) -> str:
+    # remove the /n at the end of the sentence
+    return text.replace("\n", "").strip()
 
-def update_one_id(id:int):
-    try:
-        con = connect_to_db()
-        item_id = id
-        image_path = os.path.join(image_folder, f"{item_id}.jpg")
-        upload_image = PIL.Image.open(image_path)
-        response = model.generate_content([generator_prompt, upload_image])
-        generate_description = response.text
-        # remove the /n at the end of the sentence
-        generate_description = response.text.replace("\n", "").replace('"', "").replace("'", "")
-        update_sql = f"UPDATE musina_info SET generate_description = '{generate_description}' WHERE goodsNo = {item_id}"
-        update_data_in_db_using_sql(con, update_sql)
-        print(generate_description)
-        close_connection(con)
-    except Exception as e:
-        print(f"Error: {e}")
-        sleep(10)
-
-def get_an_id(q: Queue) -> int:
-    try:
-        item = q.get_nowait()
-        return item['item_id']
-    except Exception as e:
-        raise e
 
+def load_image(item_id: int, max_side: int = 0, quality: int = 85):
+    """
+    Full-size PIL image when max_side is 0, otherwise a JPEG blob downscaled so its longest side is max_side.
+    Gemini bills an image at a fixed token count, so downscaling mainly saves upload bandwidth and latency.
+    """
+    image_path = os.path.join(image_folder, f"{item_id}.jpg")
+    image = PIL.Image.open(image_path)
+    image.load()
+    if not max_side:
+        return image
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), PIL.Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
 
-def worker(shared_queue):
-    while True:
-        try:
-            id = get_an_id(shared_queue)
-            update_one_id(id)
-        except multiprocessing.queues.Empty:
-            break  # Exit the loop if the queue is empty
-        except Exception as e:
-            print(f"Worker encountered an error: {e}")
-            break  # Optionally handle or log the exception
 
+async def describe_item(item_id: int, max_side: int = 0, quality: int = 85) -> str:
+    image = await asyncio.to_thread(load_image, item_id, max_side, quality)
+    response = await model.generate_content_async([generator_prompt, image])
+    return clean_description(response.text)
 
 
-if __name__ == "__main__":
+def parse_batch_response(text: str, item_ids: list) -> dict:
+    """Validate a multi-item answer, returns {item_id: description} for the ids answered exactly once."""
+    answers = json.loads(text)
+    if not isinstance(answers, list):
+        raise ValueError("batch response is not a JSON array")
+    requested = set(item_ids)
+    descriptions, seen = {}, set()
+    for answer in answers:
+        item_id = answer.get("item_id") if isinstance(answer, dict) else None
+        description = answer.get("description") if isinstance(answer, dict) else None
+        if item_id not in requested or not isinstance(description, str) or not description.strip():
+            continue
+        if item_id in seen:
+            descriptions.pop(item_id, None)  # ambiguous, let the item be retried on its own
+            continue
+        seen.add(item_id)
+        descriptions[item_id] = clean_description(description)
+    return descriptions
+
+
+async def describe_batch(item_ids: list, max_side: int = 0, quality: int = 85) -> dict:
+    """Describe several items with one generate_content call, returns {item_id: description}."""
+    images = await asyncio.gather(*(asyncio.to_thread(load_image, item_id, max_side, quality) for item_id in item_ids))
+    contents = [batch_prompt]
+    for item_id, image in zip(item_ids, images):
+        contents += [f"Item id: {item_id}", image]
+    response = await model.generate_content_async(
+        contents,
+        generation_config={"response_mime_type": "application/json", "response_schema": batch_response_schema},
+    )
+    return parse_batch_response(response.text, item_ids)
+
+
+class DescriptionGenerator:
+    """
+    Single-process asyncio generator:
+      feeder -> bounded work queue -> `concurrency` workers (token bucket + backoff) -> batched writer.
+    Failed requests are re-queued after an exponential backoff with jitter, up to `max_retries` attempts.
+    A failed write is retried with the same backoff, keeping the generated descriptions.
+    With items_per_request > 1 a worker packs up to that many queued items into one request; items missing
+    from a batched answer are retried like failed requests.
+    """
+
+    def __init__(self, pool, checkpoint, rpm=1000, concurrency=32, batch_size=50, flush_interval=5.0,
+                 max_retries=5, base_delay=2.0, items_per_request=1, max_side=0, quality=85):
+        self.pool = pool
+        self.items_per_request = items_per_request
+        self.max_side = max_side
+        self.quality = quality
+        self.checkpoint = checkpoint
+        self.bucket = TokenBucket(rpm / 60.0, capacity=max(1, concurrency))
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.queue = asyncio.Queue(maxsize=concurrency * 4)
+        self.results = []
+        self.outstanding = 0
+        self.all_done = asyncio.Event()
+        self.stats = {"done": 0, "retried": 0, "failed": 0}
+
+    async def worker(self):
+        while True:
+            items = [await self.queue.get()]
+            while len(items) < self.items_per_request and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            try:
+                await self.bucket.acquire()
+                if len(items) == 1:
+                    item_id, attempt = items[0]
+                    answered = {item_id: await describe_item(item_id, self.max_side, self.quality)}
+                else:
+                    answered = await describe_batch([item_id for item_id, _ in items], self.max_side, self.quality)
+                for item_id, attempt in items:
+                    if item_id in answered:
+                        self.results.append((answered[item_id], item_id))
+                    else:
+                        await self.retry_or_fail(item_id, attempt, "missing from the batched answer")
+                if len(self.results) >= self.batch_size:
+                    await self.flush()
+            except Exception as e:
+                for item_id, attempt in items:
+                    await self.retry_or_fail(item_id, attempt, e)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    async def retry_or_fail(self, item_id, attempt, error):
+        if attempt + 1 >= self.max_retries:
+            print(f"Giving up on {item_id} after {attempt + 1} attempts: {error}")
+            self.stats["failed"] += 1
+            self.checkpoint.resolve(item_id, failed=True)
+            self._finish_one()
+            return
+        delay = self.base_delay * 2 ** attempt + random.uniform(0, self.base_delay)
+        print(f"Error on {item_id} (attempt {attempt + 1}): {error}, retrying in {delay:.1f}s")
+        self.stats["retried"] += 1
+        asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(self.queue.put((item_id, attempt + 1))))
 
-    multiprocessing.set_start_method('spawn')
-    result = get_all_ids()
-    
-    shared_queue = Queue()
-
-    for item in result:
-        shared_queue.put(item)
-
-    # Create a pool of worker processes
-    num_workers = 60
-    processes = []
-    for _ in range(num_workers):
-        p = Process(target=worker, args=(shared_queue,))
-        processes.append(p)
-        p.start()
-    
-    # Wait for all processes to finish
-    for p in processes:
-        p.join()
\ No newline at end of file
+    def _finish_one(self):
+        self.outstanding -= 1
+        if self.outstanding == 0:
+            self.all_done.set()
+
+    async def flush(self):
+        if not self.results:
+            return
+        rows, self.results = self.results, []
+        # The descriptions are already paid for: only the write is retried, they are never regenerated
+        for attempt in range(self.max_retries):
+            try:
+                await asyncio.to_thread(write_descriptions, self.pool, rows)
+                break
+            except Exception as e:
+                if attempt + 1 >= self.max_retries:
+                    print(f"Giving up on writing {len(rows)} descriptions after {attempt + 1} attempts: {e}")
+                    for _, item_id in rows:
+                        self.stats["failed"] += 1
+                        self.checkpoint.resolve(item_id, failed=True)
+                        self._finish_one()
+                    self.checkpoint.save()
+                    return
+                delay = self.base_delay * 2 ** attempt + random.uniform(0, self.base_delay)
+                print(f"Error writing {len(rows)} descriptions (attempt {attempt + 1}): {e}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        for _, item_id in rows:
+            self.checkpoint.resolve(item_id)
+            self.stats["done"] += 1
+            self._finish_one()
+        self.checkpoint.save()
+        print(f"Committed {len(rows)} descriptions ({self.stats})")
+
+    async def periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def run(self, ids):
+        if not ids:
+            return self.stats
+        self.outstanding = len(ids)
+        self.checkpoint.track(ids)
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+        flusher = asyncio.create_task(self.periodic_flush())
+        for item_id in ids:
+            await self.queue.put((item_id, 0))
+        while not self.all_done.is_set():
+            await self.queue.join()
+            await self.flush()
+            if not self.all_done.is_set():
+                await asyncio.sleep(self.base_delay)  # retries are still waiting for their backoff
+        for task in workers + [flusher]:
+            task.cancel()
+        self.checkpoint.save()
+        return self.stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate item descriptions with Gemini.")
+    parser.add_argument("--rpm", type=float, default=1000, help="Requests per minute allowed by the Gemini quota")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight")
+    parser.add_argument("--batch-size", type=int, default=50, help="Descriptions per executemany write")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--checkpoint", default="description_checkpoint.json")
+    parser.add_argument("--retry-failed", action="store_true", help="Include ids that failed in previous runs")
+    parser.add_argument("--items-per-request", type=int, default=1, help="Images packed into one generate_content call")
+    parser.add_argument("--max-side", type=int, default=0, help="Downscale images to this longest side (0 = original)")
+    parser.add_argument("--jpeg-quality", type=int, default=85, help="JPEG quality of downscaled images")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    pool = create_pool()
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.retry_failed:
+        checkpoint.watermark, checkpoint.failed = 0, set()
+    ids = get_pending_ids(pool, after_id=checkpoint.watermark, exclude=checkpoint.failed)
+    print(f"{len(ids)} items to describe, resuming after id {checkpoint.watermark}")
+    generator = DescriptionGenerator(pool, checkpoint, rpm=args.rpm, concurrency=args.concurrency,
+                                     batch_size=args.batch_size, max_retries=args.max_retries,
+                                     items_per_request=args.items_per_request, max_side=args.max_side,
+                                     quality=args.jpeg_quality)
+    stats = await generator.run(ids)
+    copied = await asyncio.to_thread(copy_canonical_descriptions, pool)
+    print(f"Finished: {stats}, {copied} near duplicates copied their canonical description")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,246 @@
+"""Fill `embeddings.embedding_f16` with text-embedding-004 vectors of the item descriptions.
+
+This is the bridge between the generated descriptions and the Milvus ingestion (db_initialize/milvus.py),
+which reads the binary column and falls back to the legacy JSON `description_embeddings`.
+
+- Reads rows whose description is new or changed (no vector yet, or `description_hash` differs from
+  SHA2(description)) in keyset-paginated chunks, so memory is bounded by one chunk.
+- Deduplicates identical texts by SHA-256: within a chunk, against an in-process LRU of recent vectors,
+  and against vectors already stored in MySQL for the same hash. Only unseen texts reach the API.
+- Calls the batch embedding endpoint with up to 100 texts per request, with bounded concurrency and a
+  token bucket matched to the quota (default 1500 requests per minute).
+- Writes float16 vectors (768 x 2 bytes) and hashes back with one executemany per chunk.
+- Resumable: the last committed item_id is checkpointed, and rows already up to date never match the query.
+- Rows that only have a legacy JSON vector and no hash are converted to binary without an API call,
+  unless --reembed-existing is given.
+
+Example:
+    python gemini_embedding_generator.py --chunk-size 2000 --concurrency 8 --rpm 1500
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+import google.generativeai as genai
+
+from gemini_description_generator import create_pool, TokenBucket
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+MAX_BATCH = 100  # batchEmbedContents limit
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def to_binary(vector) -> bytes:
+    return np.asarray(vector, dtype="<f2").tobytes()
+
+
+class VectorCache:
+    """Bounded LRU of hash -> binary vector shared across chunks."""
+
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+# ----------------- Database Functions -----------------
+
+def fetch_chunk(pool, after_id, chunk_size, reembed_existing=False):
+    """Next chunk of rows whose vector is missing or stale, in item_id order."""
+    sql = """SELECT item_id, description, description_hash,
+                    CASE WHEN description_hash IS NULL AND embedding_f16 IS NULL
+                         THEN description_embeddings END AS legacy_embedding
+             FROM embeddings
+             WHERE item_id > %s AND description IS NOT NULL AND description <> ''
+             AND (embedding_f16 IS NULL OR description_hash IS NULL OR description_hash <> SHA2(description, 256))
+             ORDER BY item_id
+             LIMIT %s"""
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            cursor.execute(sql, (after_id, chunk_size))
+            rows = cursor.fetchall()
+    finally:
+        con.close()
+    if reembed_existing:
+        for row in rows:
+            row["legacy_embedding"] = None
+    return rows
+
+
+def fetch_stored(pool, hashes):
+    """Vectors already stored for any of these description hashes."""
+    if not hashes:
+        return {}
+    placeholders = ", ".join(["%s"] * len(hashes))
+    sql = f"""SELECT description_hash, ANY_VALUE(embedding_f16) AS embedding_f16 FROM embeddings
+              WHERE description_hash IN ({placeholders}) AND embedding_f16 IS NOT NULL
+              GROUP BY description_hash"""
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            cursor.execute(sql, list(hashes))
+            return {row["description_hash"]: row["embedding_f16"] for row in cursor.fetchall()}
+    finally:
+        con.close()
+
+
+def write_vectors(pool, rows):
+    """rows: [(embedding_f16, description_hash, item_id), ...]"""
+    sql = "UPDATE embeddings SET embedding_f16 = %s, description_hash = %s WHERE item_id = %s"
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+
+# ----------------- Embedding -----------------
+
+class EmbeddingJob:
+    def __init__(self, pool, rpm=1500, concurrency=8, max_retries=5, base_delay=2.0, cache_size=50000):
+        self.pool = pool
+        self.bucket = TokenBucket(rpm / 60.0, capacity=max(1, concurrency))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.cache = VectorCache(cache_size)
+        self.stats = {"items": 0, "unique_texts": 0, "api_calls": 0, "embedded_texts": 0,
+                      "dedup_hits": 0, "legacy_converted": 0, "calls_without_dedup": 0}
+
+    async def embed_batch(self, texts):
+        for attempt in range(self.max_retries):
+            async with self.semaphore:
+                await self.bucket.acquire()
+                try:
+                    result = await asyncio.to_thread(genai.embed_content, model=EMBEDDING_MODEL, content=texts)
+                    self.stats["api_calls"] += 1
+                    return result["embedding"]
+                except Exception as e:
+                    if attempt + 1 == self.max_retries:
+                        raise
+                    delay = self.base_delay * 2 ** attempt
+                    print(f"Embedding batch failed (attempt {attempt + 1}): {e}, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    async def process_chunk(self, rows):
+        """Resolve a vector for every row, returns rows for write_vectors."""
+        vectors, pending = {}, {}
+        for row in rows:
+            key = text_hash(row["description"])
+            row["hash"] = key
+            if key in vectors or key in pending:
+                continue
+            if row["legacy_embedding"]:
+                vectors[key] = to_binary(json.loads(row["legacy_embedding"]))
+                self.stats["legacy_converted"] += 1
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                pending[key] = row["description"]
+
+        stored = await asyncio.to_thread(fetch_stored, self.pool, list(pending))
+        for key, value in stored.items():
+            vectors[key] = value
+            pending.pop(key, None)
+
+        keys = list(pending)
+        batches = [keys[i:i + MAX_BATCH] for i in range(0, len(keys), MAX_BATCH)]
+        results = await asyncio.gather(*(self.embed_batch([pending[k] for k in batch]) for batch in batches))
+        for batch, embeddings in zip(batches, results):
+            for key, embedding in zip(batch, embeddings):
+                vectors[key] = to_binary(embedding)
+                self.cache.put(key, vectors[key])
+
+        self.stats["items"] += len(rows)
+        self.stats["unique_texts"] += len({row["hash"] for row in rows})
+        self.stats["embedded_texts"] += len(keys)
+        legacy_rows = sum(1 for row in rows if row["legacy_embedding"])
+        self.stats["dedup_hits"] += len(rows) - len(keys) - legacy_rows
+        self.stats["calls_without_dedup"] += -(-(len(rows) - legacy_rows) // MAX_BATCH)
+        return [(vectors[row["hash"]], row["hash"], row["item_id"]) for row in rows]
+
+    def report(self, elapsed):
+        saved = max(self.stats["calls_without_dedup"] - self.stats["api_calls"], 0)
+        rate = self.stats["items"] / elapsed if elapsed > 0 else 0.0
+        return f"{self.stats}, {rate:.1f} items/s, {saved} API calls saved by dedup"
+
+
+def load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f).get("last_item_id", 0)
+    return 0
+
+
+def save_checkpoint(path, last_item_id):
+    if not path:
+        return
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"last_item_id": last_item_id}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed new or changed item descriptions.")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--rpm", type=float, default=1500, help="Embedding requests per minute allowed by the quota")
+    parser.add_argument("--concurrency", type=int, default=8, help="Embedding requests in flight")
+    parser.add_argument("--cache-size", type=int, default=50000, help="Vectors kept in the in-process dedup LRU")
+    parser.add_argument("--checkpoint", default="embedding_checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and scan from the start")
+    parser.add_argument("--reembed-existing", action="store_true",
+                        help="Call the API for rows that only have a legacy JSON vector")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    pool = create_pool()
+    job = EmbeddingJob(pool, rpm=args.rpm, concurrency=args.concurrency, cache_size=args.cache_size)
+    last_item_id = 0 if args.restart else load_checkpoint(args.checkpoint)
+    print(f"Embedding descriptions after item_id {last_item_id}")
+
+    started = perf_counter()
+    while True:
+        rows = await asyncio.to_thread(fetch_chunk, pool, last_item_id, args.chunk_size, args.reembed_existing)
+        if not rows:
+            break
+        updates = await job.process_chunk(rows)
+        await asyncio.to_thread(write_vectors, pool, updates)
+        last_item_id = rows[-1]["item_id"]
+        save_checkpoint(args.checkpoint, last_item_id)
+        print(f"Committed through item_id {last_item_id}: {job.report(perf_counter() - started)}")
+
+    save_checkpoint(args.checkpoint, 0)  # a finished scan starts from the beginning next time
+    print(f"Finished: {job.report(perf_counter() - started)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
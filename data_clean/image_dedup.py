@@ -0,0 +1,205 @@
+"""Near-duplicate detection over the catalog images with perceptual hashes.
+
+Musinsa and Amazon list many identical product photos. Every image gets a 64-bit pHash and dHash
+(computed in parallel, cached in `item_canonical` so re-runs only hash new items). Near duplicates are
+found with a multi-index hash: each pHash is split into 4 blocks of 16 bits, and by the pigeonhole principle
+two hashes within Hamming distance <= 3 share at least one identical block. Only items sharing a block
+bucket are compared, and a pair is a duplicate when both pHash and dHash distances are within threshold.
+Groups are merged with union-find and the smallest item id becomes the canonical item.
+
+The `item_canonical` table (db_initialize/item_canonical.sql) maps every item to its canonical item:
+    - gemini_description_generator.py only describes canonical items and copies their descriptions,
+    - db_initialize/milvus.py only ingests canonical items,
+    - `--prune-milvus` deletes non-canonical items from already built collections, so retrieval
+      stops returning duplicates without a rebuild.
+
+Example:
+    python image_dedup.py --workers 16 --max-distance 3 --prune-milvus
+"""
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import PIL.Image
+
+from gemini_description_generator import create_pool, image_folder
+
+HASH_BITS = 64
+BLOCKS = 4
+BLOCK_BITS = HASH_BITS // BLOCKS
+PAIRS_PER_SLICE = 4_000_000  # bounds the distance matrix of one bucket slice (~32 MB per hash)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image):
+    pixels = np.asarray(image.convert("L").resize((9, 8), PIL.Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image):
+    pixels = np.asarray(image.convert("L").resize((32, 32), PIL.Image.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def hash_image(item_id):
+    """Runs in a worker process, returns (item_id, phash, dhash) or (item_id, None, None) if unreadable."""
+    try:
+        with PIL.Image.open(os.path.join(image_folder, f"{item_id}.jpg")) as image:
+            image.draft("L", (64, 64))  # let the JPEG decoder downscale, hashes only need a thumbnail
+            return item_id, phash(image), dhash(image)
+    except Exception as e:
+        print(f"Error hashing {item_id}: {e}")
+        return item_id, None, None
+
+
+def hamming(a, b):
+    """Pairwise Hamming distances between two uint64 arrays (broadcasting)."""
+    xor = np.bitwise_xor(a, b)
+    return _POPCOUNT[xor.view(np.uint8).reshape(*xor.shape, 8)].sum(axis=-1)
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def find_duplicates(item_ids, phashes, dhashes, max_distance=3, max_dhash_distance=6):
+    """Returns the canonical item id for every item (itself when it has no near duplicate)."""
+    order = np.argsort(item_ids)  # union-find keeps the smallest index, so sort to keep the smallest id
+    item_ids, phashes, dhashes = item_ids[order], phashes[order], dhashes[order]
+    uf = UnionFind(len(item_ids))
+    for block in range(BLOCKS):
+        keys = (phashes >> np.uint64(block * BLOCK_BITS)) & np.uint64((1 << BLOCK_BITS) - 1)
+        buckets = defaultdict(list)
+        for index, key in enumerate(keys.tolist()):
+            buckets[key].append(index)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            members = np.array(members)
+            step = max(1, PAIRS_PER_SLICE // len(members))  # large buckets are mostly blank/placeholder images
+            for start in range(0, len(members), step):
+                rows = members[start:start + step]
+                close = ((hamming(phashes[rows][:, None], phashes[members][None, :]) <= max_distance) &
+                         (hamming(dhashes[rows][:, None], dhashes[members][None, :]) <= max_dhash_distance))
+                for i, j in zip(*np.nonzero(close)):
+                    if rows[i] < members[j]:
+                        uf.union(rows[i], members[j])
+    roots = np.array([uf.find(i) for i in range(len(item_ids))])
+    return dict(zip(item_ids.tolist(), item_ids[roots].tolist()))
+
+
+# ----------------- Database -----------------
+
+def load_items(pool):
+    """All catalog items with their cached hashes (None when not hashed yet)."""
+    sql = """SELECT item_info.item_id, item_canonical.phash, item_canonical.dhash
+             FROM item_info LEFT JOIN item_canonical ON item_canonical.item_id = item_info.item_id
+             WHERE item_info.exist_flag = 1"""
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchall()
+    finally:
+        con.close()
+
+
+def write_mapping(pool, rows, batch_size=5000):
+    sql = "REPLACE INTO item_canonical (item_id, canonical_id, phash, dhash) VALUES (%s, %s, %s, %s)"
+    con = pool.connection()
+    try:
+        with con.cursor() as cursor:
+            for i in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[i:i + batch_size])
+                con.commit()
+    finally:
+        con.close()
+
+
+def prune_milvus(duplicate_ids, collections=("tops", "pants", "outerwear", "dress_skirt"), batch_size=1000):
+    from pymilvus import connections, Collection
+    connections.connect(host=os.getenv("MILVUS_HOST", "standalone"), port=os.getenv("MILVUS_PORT", "19530"))
+    for name in collections:
+        collection = Collection(name=name)
+        for i in range(0, len(duplicate_ids), batch_size):
+            collection.delete(expr=f"item_id in {duplicate_ids[i:i + batch_size]}")
+        collection.flush()
+        print(f"Pruned duplicates from '{name}'")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Group near-duplicate catalog images by perceptual hash.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-distance", type=int, default=3, choices=range(0, BLOCKS),
+                        help="pHash Hamming distance, < 4 so the multi-index lookup is exact")
+    parser.add_argument("--max-dhash-distance", type=int, default=6)
+    parser.add_argument("--prune-milvus", action="store_true", help="Delete non-canonical items from the collections")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    pool = create_pool()
+    items = load_items(pool)
+    hashes = {row["item_id"]: (row["phash"], row["dhash"]) for row in items if row["phash"] is not None}
+    missing = [row["item_id"] for row in items if row["phash"] is None]
+    print(f"{len(items)} items, {len(missing)} to hash")
+
+    started = perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for item_id, p, d in executor.map(hash_image, missing, chunksize=256):
+            if p is not None:
+                hashes[item_id] = (p, d)
+    print(f"Hashed {len(missing)} images in {perf_counter() - started:.1f}s")
+
+    item_ids = np.fromiter(hashes.keys(), dtype=np.int64, count=len(hashes))
+    phashes = np.array([h[0] for h in hashes.values()], dtype=np.uint64)
+    dhashes = np.array([h[1] for h in hashes.values()], dtype=np.uint64)
+    started = perf_counter()
+    canonical = find_duplicates(item_ids, phashes, dhashes, args.max_distance, args.max_dhash_distance)
+    duplicates = sorted(i for i, c in canonical.items() if i != c)
+    print(f"{len(duplicates)} near duplicates in {len(set(canonical[i] for i in duplicates))} groups "
+          f"found in {perf_counter() - started:.1f}s")
+
+    write_mapping(pool, [(i, canonical[i], *hashes[i]) for i in canonical])
+    if args.prune_milvus and duplicates:
+        prune_milvus(duplicates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Bulk-build path for Milvus: snapshot export -> bulk insert -> deferred index build.
+
+1. `export`: stream each category join from MySQL once into partitioned NumPy snapshot files
+   (<snapshot_dir>/<collection>/part-00000/<field>.npy + manifest.json).
+2. `load`: upload the snapshot parts to the Milvus MinIO bucket, import them with bulk insert
+   into an index-less collection, flush, then build the index once the data has landed.
+3. `reindex`: drop and rebuild the index of an already loaded collection with new parameters.
+
+Snapshots are reusable, so a parameter sweep only repeats step 2 or 3 and never hits MySQL again.
+
+Example:
+    python bulk_load.py export --snapshot-dir snapshots
+    python bulk_load.py load --snapshot-dir snapshots --recreate
+    python bulk_load.py reindex --collections tops --index-params '{"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 48, "efConstruction": 360}}'
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from time import sleep, perf_counter
+
+import numpy as np
+from pymilvus import connections, utility, Collection
+
+from milvus import (collections_info, schema, create_collection, stream_data, decode_rows, normalize_block,
+                    needs_normalized_vectors, project_block, PROJECTION)
+
+FLAG_FIELDS = ["gender", "spring", "summer", "autumn", "winter"]
+
+
+# ----------------- Snapshot export -----------------
+
+def export_snapshot(name, sql, snapshot_dir, rows_per_part=100000):
+    """Stream one category into partitioned .npy files, returns the manifest.
+
+    Snapshots always keep the raw vectors, so projections and index variants can be swept over the same files.
+    """
+    target = os.path.join(snapshot_dir, name)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    os.makedirs(target)
+
+    started = perf_counter()
+    parts, rows_total, dim = [], 0, None
+    for rows in stream_data(sql, chunk_size=rows_per_part):
+        item_ids, vectors, flags = decode_rows(rows, project=False)
+        if len(item_ids) == 0:
+            continue
+        part = f"part-{len(parts):05d}"
+        part_dir = os.path.join(target, part)
+        os.makedirs(part_dir)
+        np.save(os.path.join(part_dir, "item_id.npy"), item_ids)
+        np.save(os.path.join(part_dir, "embedding.npy"), vectors)
+        for i, field in enumerate(FLAG_FIELDS):
+            np.save(os.path.join(part_dir, f"{field}.npy"), np.ascontiguousarray(flags[:, i]))
+        parts.append({"name": part, "rows": int(len(item_ids))})
+        rows_total += len(item_ids)
+        dim = vectors.shape[1]
+        logging.info(f"[{name}] exported {part} with {len(item_ids)} rows.")
+
+    manifest = {
+        "collection": name,
+        "rows": rows_total,
+        "dim": dim,
+        "parts": parts,
+        "sql_sha256": hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(target, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    message = f"[{name}] snapshot of {rows_total} rows in {len(parts)} parts written in {perf_counter() - started:.1f}s."
+    logging.info(message)
+    print(message)
+    return manifest
+
+
+def read_manifest(snapshot_dir, name):
+    with open(os.path.join(snapshot_dir, name, "manifest.json")) as f:
+        return json.load(f)
+
+
+def iter_snapshot(snapshot_dir, name):
+    """Yield (item_ids, vectors, flags) per part, vectors are memory-mapped float16."""
+    manifest = read_manifest(snapshot_dir, name)
+    for part in manifest["parts"]:
+        part_dir = os.path.join(snapshot_dir, name, part["name"])
+        item_ids = np.load(os.path.join(part_dir, "item_id.npy"))
+        vectors = np.load(os.path.join(part_dir, "embedding.npy"), mmap_mode="r")
+        flags = np.stack([np.load(os.path.join(part_dir, f"{field}.npy")) for field in FLAG_FIELDS], axis=1)
+        yield item_ids, vectors, flags
+
+
+# ----------------- Bulk insert -----------------
+
+def minio_client():
+    from minio import Minio
+    return Minio(
+        os.getenv("MINIO_ADDRESS", "minio:9000"),
+        access_key=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+        secret_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+        secure=os.getenv("MINIO_SECURE", "0") == "1",
+    )
+
+
+def _put_npy(client, bucket, key, array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    size = buffer.tell()
+    buffer.seek(0)
+    client.put_object(bucket, key, buffer, size)
+
+
+def upload_part(client, bucket, prefix, part_dir, normalize=False):
+    """Upload one snapshot part in the layout Milvus' NumPy import expects, returns the object keys.
+
+    Snapshots keep the raw vectors, projection and normalization for IP indexes are applied on the way out.
+    """
+    keys = []
+    for field in ["item_id", "embedding", *FLAG_FIELDS]:
+        array = np.load(os.path.join(part_dir, f"{field}.npy"))
+        if field == "embedding":
+            if PROJECTION:
+                array = project_block(array, PROJECTION)
+            elif normalize:
+                array = normalize_block(array)
+            # NumPy import reads FLOAT16_VECTOR as raw bytes: uint8 with shape (n, dim * 2)
+            array = np.ascontiguousarray(array).view(np.uint8)
+        key = f"{prefix}/{field}.npy"
+        _put_npy(client, bucket, key, array)
+        keys.append(key)
+    return keys
+
+
+def wait_bulk_insert(task_ids, poll=2.0):
+    pending = set(task_ids)
+    failed = 0
+    while pending:
+        for task_id in list(pending):
+            state = utility.get_bulk_insert_state(task_id=task_id)
+            if state.state_name in ("Completed", "Failed", "Failed and cleaned"):
+                pending.discard(task_id)
+                if state.state_name != "Completed":
+                    failed += 1
+                    logging.error(f"Bulk insert task {task_id} failed: {state.failed_reason}")
+                else:
+                    logging.info(f"Bulk insert task {task_id} imported {state.row_count} rows.")
+        if pending:
+            sleep(poll)
+    return failed
+
+
+def build_index(collection, index_params):
+    started = perf_counter()
+    collection.create_index(field_name="embedding", index_params=index_params)
+    utility.wait_for_index_building_complete(collection.name)
+    elapsed = perf_counter() - started
+    message = f"[{collection.name}] index {index_params} built in {elapsed:.1f}s."
+    logging.info(message)
+    print(message)
+    return elapsed
+
+
+def bulk_load_collection(name, snapshot_dir, index_params, target_name=None, recreate=False, build=True):
+    """Import a snapshot into `target_name` (defaults to `name`) and build the index after the data landed.
+
+    With `build=False` the caller builds the index itself (e.g. to time it).
+    """
+    target_name = target_name or name
+    if recreate and utility.has_collection(target_name):
+        utility.drop_collection(target_name)
+    collection = create_collection(target_name, schema)
+    if collection.num_entities > 0:
+        raise RuntimeError(f"Collection '{target_name}' is not empty, use --recreate to rebuild it from the snapshot.")
+    if collection.has_index():
+        collection.drop_index()
+
+    client = minio_client()
+    bucket = os.getenv("MILVUS_BUCKET", "a-bucket")
+    manifest = read_manifest(snapshot_dir, name)
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+
+    started = perf_counter()
+    task_ids = []
+    for part in manifest["parts"]:
+        keys = upload_part(client, bucket, f"bulk_load/{target_name}/{run_id}/{part['name']}",
+                           os.path.join(snapshot_dir, name, part["name"]),
+                           normalize=needs_normalized_vectors(index_params))
+        task_ids.append(utility.do_bulk_insert(collection_name=target_name, files=keys))
+    failed = wait_bulk_insert(task_ids)
+    if failed:
+        # A partial collection must never be indexed and served (rebuild.py would swap its alias onto it)
+        message = f"[{target_name}] {failed} of {len(task_ids)} bulk insert tasks failed, collection is incomplete."
+        logging.error(message)
+        raise RuntimeError(message)
+    collection.flush()
+    message = (f"[{target_name}] bulk inserted {manifest['rows']} rows from {len(task_ids)} parts "
+               f"in {perf_counter() - started:.1f}s.")
+    logging.info(message)
+    print(message)
+
+    if build:
+        build_index(collection, index_params)
+    return collection
+
+
+def reindex_collection(name, index_params):
+    """Rebuild the index in place. Switching between COSINE and IP needs a reload, the stored vectors stay as they are."""
+    collection = Collection(name=name)
+    collection.release()
+    if collection.has_index():
+        collection.drop_index()
+    build_index(collection, index_params)
+    return collection
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Snapshot export and bulk load for the Milvus collections.")
+    parser.add_argument("command", choices=["export", "load", "build", "reindex"],
+                        help="build = export followed by load")
+    parser.add_argument("--snapshot-dir", default="snapshots")
+    parser.add_argument("--collections", nargs="+", default=list(collections_info), choices=list(collections_info))
+    parser.add_argument("--rows-per-part", type=int, default=100000)
+    parser.add_argument("--index-params", type=json.loads, default=None,
+                        help="JSON index params overriding collections_info for load/reindex")
+    parser.add_argument("--recreate", action="store_true", help="Drop the target collection before loading")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command in ("export", "build"):
+        for name in args.collections:
+            export_snapshot(name, collections_info[name]["sql"], args.snapshot_dir, rows_per_part=args.rows_per_part)
+    if args.command == "export":
+        return
+
+    connections.connect(host=os.getenv("MILVUS_HOST", "standalone"), port=os.getenv("MILVUS_PORT", "19530"))
+    for name in args.collections:
+        index_params = args.index_params or collections_info[name]["index_params"]
+        if args.command == "reindex":
+            reindex_collection(name, index_params)
+        else:
+            bulk_load_collection(name, args.snapshot_dir, index_params, recreate=args.recreate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+/*
+ Catalog version bumped by every catalog sync (db_initialize/milvus.py ingestion, rebuild.py alias swap).
+
+ The app's item metadata cache (app/src/services/item_metadata.py) drops its entries when the
+ version changes, so names, brands, prices and links never outlive a sync.
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for catalog_sync
+-- ----------------------------
+DROP TABLE IF EXISTS `catalog_sync`;
+CREATE TABLE `catalog_sync`  (
+  `id` tinyint NOT NULL,
+  `version` bigint NOT NULL DEFAULT 0,
+  `synced_at` datetime NULL DEFAULT NULL,
+  PRIMARY KEY (`id`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = DYNAMIC;
+
+INSERT INTO `catalog_sync` VALUES (1, 0, NULL);
+
+SET FOREIGN_KEY_CHECKS = 1;
@@ -0,0 +1,33 @@
+/*
+ CLIP features written by CLIP_baseline_model/clip_embed.py and exported for the app's rerank stage by
+ CLIP_baseline_model/export_image_features.py.
+
+ image_feature and text_feature hold the clip-vit-large-patch14 projections as 768 little-endian float16
+ (1536 bytes). Rows written before the binary format hold JSON arrays of floats instead, the export reads
+ both (a JSON row starts with '['). Existing tables are migrated in place with the ALTER below, which keeps
+ those rows readable since BLOB stores the JSON text unchanged.
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for clip_embeddings
+-- ----------------------------
+DROP TABLE IF EXISTS `clip_embeddings`;
+CREATE TABLE `clip_embeddings`  (
+  `item_id` int NOT NULL,
+  `image_feature` blob NULL COMMENT 'CLIP image projection as 768 little-endian float16 (JSON array in legacy rows)',
+  `text_feature` blob NULL COMMENT 'CLIP text projection as 768 little-endian float16 (JSON array in legacy rows)',
+  `similarity` float NULL DEFAULT NULL,
+  PRIMARY KEY (`item_id`) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = DYNAMIC;
+
+-- ----------------------------
+-- Migration of a table holding JSON text features
+-- ----------------------------
+-- ALTER TABLE `clip_embeddings`
+--   MODIFY `image_feature` blob NULL COMMENT 'CLIP image projection as 768 little-endian float16 (JSON array in legacy rows)',
+--   MODIFY `text_feature` blob NULL COMMENT 'CLIP text projection as 768 little-endian float16 (JSON array in legacy rows)';
+
+SET FOREIGN_KEY_CHECKS = 1;
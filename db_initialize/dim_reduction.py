@@ -0,0 +1,135 @@
+"""Fit and select a reduced embedding dimension for the Milvus collections.
+
+Two reductions are supported, both stored in one .npz projection file (kind, dim, mean, components):
+    - pca:      a PCA projection fitted on the catalog vectors of the snapshots,
+    - truncate: the first `dim` components re-normalized, which is what text-embedding-004 returns
+                natively with `output_dimensionality`, so query embeddings also get cheaper.
+
+Commands:
+    fit       stream the snapshots once and write the full PCA basis (second moment accumulated per part).
+    evaluate  for every candidate dimension, compare exact top-5 search in the reduced space against exact
+              top-5 search at full dimension, then write the smallest dimension meeting `--target`.
+
+Point both ingestion (db_initialize) and the app at the selected file with EMBEDDING_PROJECTION_PATH,
+and rebuild the collections (rebuild.py) since the collection schema records the dimension.
+
+Example:
+    python dim_reduction.py fit --snapshot-dir snapshots --output pca_basis.npz
+    python dim_reduction.py evaluate --basis pca_basis.npz --target 0.95 --output projection.npz
+"""
+import argparse
+import json
+
+import numpy as np
+
+from bulk_load import iter_snapshot
+from milvus import collections_info, project_block
+from evaluation import sample_queries, exact_topk, recall_at_k
+
+CANDIDATE_DIMS = [64, 96, 128, 192, 256, 384, 512, 768]
+
+
+def fit_pca(snapshot_dir, names):
+    """Accumulate the second moment part by part, returns (mean, components sorted by energy, explained ratio).
+
+    The basis is fitted without centering (mean is all zeros): at full dimension the projection is then a
+    pure rotation, so cosine similarities are preserved exactly and truncating it only drops the weakest axes.
+    """
+    dim = None
+    count = 0
+    scatter = None
+    for name in names:
+        for _, vectors, _ in iter_snapshot(snapshot_dir, name):
+            block = np.asarray(vectors, dtype=np.float64)
+            if scatter is None:
+                dim = block.shape[1]
+                scatter = np.zeros((dim, dim))
+            count += len(block)
+            scatter += block.T @ block
+    mean = np.zeros(dim)
+    eigenvalues, eigenvectors = np.linalg.eigh(scatter / count)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues = np.clip(eigenvalues[order], 0, None)
+    return mean, eigenvectors[:, order].T, eigenvalues / eigenvalues.sum()
+
+
+def save_projection(path, kind, dim, mean, components, explained=None):
+    np.savez(path, kind=kind, dim=dim, mean=mean.astype(np.float32), components=components.astype(np.float32),
+             explained=np.zeros(0) if explained is None else explained)
+
+
+def evaluate(snapshot_dir, names, basis, dims, queries_per_collection=200, k=5):
+    """Recall@k of exact search in the reduced space against exact search at full dimension."""
+    with np.load(basis) as f:
+        mean, components = f["mean"], f["components"]
+    invalid = [dim for dim in dims if not 0 < dim <= components.shape[0]]
+    if invalid:
+        raise ValueError(f"Dimensions {invalid} outside 1..{components.shape[0]} of the basis {basis}")
+    # Queries and full-dimension ground truth do not depend on the reduction, one brute-force scan per collection
+    ground = {}
+    for name in names:
+        _, queries = sample_queries(snapshot_dir, name, n=queries_per_collection)
+        ground[name] = (queries, exact_topk(snapshot_dir, name, queries, k=k, metric="COSINE"))
+    results = []
+    for kind in ("pca", "truncate"):
+        for dim in dims:
+            projection = (kind, dim, mean, components[:dim])
+            recalls = []
+            for name in names:
+                queries, truth = ground[name]
+                reduced_queries = project_block(queries, projection).astype(np.float32)
+                found = exact_topk(snapshot_dir, name, reduced_queries, k=k, metric="IP",
+                                   transform=lambda block: project_block(block, projection).astype(np.float32))
+                recalls.append(recall_at_k(found, truth))
+            results.append({"kind": kind, "dim": dim, f"recall@{k}": round(float(np.mean(recalls)), 4),
+                            "compression": round(components.shape[1] / dim, 2)})
+            print(results[-1])
+    return results
+
+
+def select(results, target, k=5):
+    """Smallest dimension meeting the target, preferring truncation on ties (no projection at query time)."""
+    passing = [r for r in results if r[f"recall@{k}"] >= target]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["dim"], r["kind"] != "truncate"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fit and select a reduced embedding dimension.")
+    parser.add_argument("command", choices=["fit", "evaluate"])
+    parser.add_argument("--snapshot-dir", default="snapshots")
+    parser.add_argument("--collections", nargs="+", default=list(collections_info), choices=list(collections_info))
+    parser.add_argument("--basis", default="pca_basis.npz", help="PCA basis written by `fit`")
+    parser.add_argument("--dims", nargs="+", type=int, default=CANDIDATE_DIMS)
+    parser.add_argument("--target", type=float, default=0.95, help="Minimum recall@5 against full dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled queries per collection")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "fit":
+        mean, components, explained = fit_pca(args.snapshot_dir, args.collections)
+        output = args.output or args.basis
+        save_projection(output, "pca", components.shape[0], mean, components, explained)
+        for dim in args.dims:
+            print(f"pca-{dim}: {explained[:dim].sum():.4f} of the variance")
+        print(f"PCA basis written to {output}")
+        return
+
+    results = evaluate(args.snapshot_dir, args.collections, args.basis, args.dims, queries_per_collection=args.queries)
+    choice = select(results, args.target)
+    print(json.dumps({"target": args.target, "selected": choice, "results": results}, indent=2))
+    if choice is None:
+        print(f"No candidate dimension reaches recall@5 >= {args.target}, keep the full 768 dimensions.")
+        return
+    output = args.output or f"projection_{choice['kind']}_{choice['dim']}.npz"
+    with np.load(args.basis) as f:
+        save_projection(output, choice["kind"], choice["dim"], f["mean"], f["components"][:choice["dim"]])
+    print(f"Projection {choice['kind']}-{choice['dim']} written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,10 @@ CREATE TABLE `embeddings`  (
   `item_id` int NOT NULL,
   `description` varchar(1500) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
   `description_embeddings` json NULL,
-  PRIMARY KEY (`item_id`) USING BTREE
+  `description_hash` char(64) CHARACTER SET ascii COLLATE ascii_bin NULL DEFAULT NULL COMMENT 'SHA-256 of the embedded description',
+  `embedding_f16` varbinary(1536) NULL DEFAULT NULL COMMENT 'text-embedding-004 vector as 768 little-endian float16',
+  PRIMARY KEY (`item_id`) USING BTREE,
+  INDEX `index_description_hash`(`description_hash` ASC) USING BTREE
 ) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = DYNAMIC;
 
 SET FOREIGN_KEY_CHECKS = 1;
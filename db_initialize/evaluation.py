@@ -0,0 +1,97 @@
+"""Recall/latency helpers shared by the rebuild and index benchmark tools.
+
+Ground truth is an exact search over the NumPy snapshots written by bulk_load.py, scanned part by part
+so memory stays bounded by one part.
+"""
+from time import perf_counter
+
+import numpy as np
+
+from bulk_load import iter_snapshot
+from milvus import PROJECTION, project_block
+
+
+def search_params_for(index_params, limit=5):
+    """Search params matching an index definition (metric and the index type's own knob)."""
+    index_type = index_params["index_type"]
+    params = {}
+    if index_type.startswith("HNSW"):
+        params["ef"] = max(16, limit)
+    elif index_type.startswith("IVF"):
+        params["nprobe"] = 16
+    return {"metric_type": index_params["metric_type"], "params": params}
+
+
+def _normalize(block):
+    block = np.asarray(block, dtype=np.float32)
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return block / norms
+
+
+def sample_queries(snapshot_dir, name, n=100, seed=0):
+    """Pick `n` catalog vectors as query vectors, returns (item_ids, float32 vectors)."""
+    rng = np.random.default_rng(seed)
+    parts = list(iter_snapshot(snapshot_dir, name))
+    sizes = np.array([len(ids) for ids, _, _ in parts])
+    picks = rng.choice(sizes.sum(), size=min(n, int(sizes.sum())), replace=False)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    ids, vectors = [], []
+    for pick in np.sort(picks):
+        p = int(np.searchsorted(offsets, pick, side="right") - 1)
+        row = int(pick - offsets[p])
+        ids.append(parts[p][0][row])
+        vectors.append(np.asarray(parts[p][1][row], dtype=np.float32))
+    return np.array(ids), np.stack(vectors)
+
+
+def exact_topk(snapshot_dir, name, queries, k=5, metric="COSINE", transform=None):
+    """Brute-force top-k item ids for every query, shape (len(queries), k).
+
+    `transform` is applied to every snapshot block before scoring (e.g. a dimension reduction),
+    the queries are expected to be transformed already.
+    """
+    queries = _normalize(queries) if metric in ("COSINE", "IP") else np.asarray(queries, dtype=np.float32)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for item_ids, vectors, _ in iter_snapshot(snapshot_dir, name):
+        if transform is not None:
+            vectors = transform(vectors)
+        if metric == "COSINE":
+            scores = queries @ _normalize(vectors).T
+        elif metric == "IP":
+            scores = queries @ np.asarray(vectors, dtype=np.float32).T
+        else:
+            block = np.asarray(vectors, dtype=np.float32)
+            scores = -((queries ** 2).sum(1, keepdims=True) - 2 * queries @ block.T + (block ** 2).sum(1))
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_ids = np.concatenate([best_ids, np.broadcast_to(item_ids, scores.shape)], axis=1)
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_ids = np.take_along_axis(all_ids, top, axis=1)
+    return best_ids
+
+
+def recall_at_k(found_ids, true_ids):
+    hits = [len(set(found) & set(truth)) / len(truth) for found, truth in zip(found_ids, true_ids)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def measure_search(collection, queries, search_params, k=5):
+    """Run one search per query, returns (found ids per query, latency percentiles in ms).
+
+    `queries` are raw snapshot vectors, they get the same projection as the stored vectors.
+    """
+    if PROJECTION:
+        queries = project_block(queries, PROJECTION).astype(np.float32)
+    elif search_params["metric_type"] == "IP":
+        queries = _normalize(queries)
+    found, latencies = [], []
+    for query in queries:
+        started = perf_counter()
+        results = collection.search(data=[query.astype(np.float16)], anns_field="embedding", param=search_params, limit=k)
+        latencies.append((perf_counter() - started) * 1000)
+        found.append([hit.id for hit in results[0]])
+    latencies = np.array(latencies)
+    return found, {"p50": float(np.percentile(latencies, 50)), "p95": float(np.percentile(latencies, 95)),
+                   "mean": float(latencies.mean())}
@@ -0,0 +1,90 @@
+"""Build every index variant from the same snapshot and compare memory, build time, latency and recall@5.
+
+Each variant is bulk loaded from the NumPy snapshot (bulk_load.py export) into a scratch collection
+`bench_<collection>_<variant>`, loaded, and queried with catalog vectors sampled from the snapshot.
+Recall@5 is measured against exact COSINE search over the snapshot.
+
+Example:
+    python index_bench.py --collection tops --variants HNSW HNSW_SQ8 IVF_SQ8 IVF_PQ HNSW_IP --output index_report.json
+"""
+import argparse
+import json
+import os
+
+from pymilvus import connections, utility
+
+from milvus import INDEX_VARIANTS, collections_info
+from bulk_load import bulk_load_collection, build_index, read_manifest
+from evaluation import search_params_for, sample_queries, exact_topk, recall_at_k, measure_search
+
+
+def loaded_memory_mb(collection_name):
+    """Resident memory of the loaded segments as reported by the query nodes."""
+    segments = utility.get_query_segment_info(collection_name)
+    return sum(segment.mem_size for segment in segments) / (1024 * 1024)
+
+
+def bench_variant(name, variant, snapshot_dir, queries, truth, keep=False):
+    index_params = INDEX_VARIANTS[variant]
+    target = f"bench_{name}_{variant.lower()}"
+    collection = bulk_load_collection(name, snapshot_dir, index_params, target_name=target, recreate=True, build=False)
+    build_seconds = build_index(collection, index_params)
+    collection.load()
+    utility.wait_for_loading_complete(target)
+
+    search_params = search_params_for(index_params)
+    measure_search(collection, queries[:10], search_params)  # warm-up
+    found, latency = measure_search(collection, queries, search_params)
+    result = {
+        "variant": variant,
+        "index_params": index_params,
+        "memory_mb": round(loaded_memory_mb(target), 1),
+        "build_seconds": round(build_seconds, 1),
+        "latency_ms_p50": round(latency["p50"], 2),
+        "latency_ms_p95": round(latency["p95"], 2),
+        "recall@5": round(recall_at_k(found, truth), 4),
+    }
+    if not keep:
+        utility.drop_collection(target)
+    return result
+
+
+def print_table(name, rows, manifest):
+    print(f"\n{name}: {manifest['rows']} vectors, dim {manifest['dim']}")
+    header = f"{'variant':<12}{'memory MB':>11}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@5':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['variant']:<12}{row['memory_mb']:>11}{row['build_seconds']:>9}"
+              f"{row['latency_ms_p50']:>9}{row['latency_ms_p95']:>9}{row['recall@5']:>10}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare Milvus index variants on the same snapshot.")
+    parser.add_argument("--collection", default="tops", choices=list(collections_info))
+    parser.add_argument("--variants", nargs="+", default=list(INDEX_VARIANTS), choices=list(INDEX_VARIANTS))
+    parser.add_argument("--snapshot-dir", default="snapshots")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="Keep the bench collections after measuring")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    connections.connect(host=os.getenv("MILVUS_HOST", "standalone"), port=os.getenv("MILVUS_PORT", "19530"))
+
+    manifest = read_manifest(args.snapshot_dir, args.collection)
+    _, queries = sample_queries(args.snapshot_dir, args.collection, n=args.queries)
+    truth = exact_topk(args.snapshot_dir, args.collection, queries, k=5, metric="COSINE")
+
+    rows = [bench_variant(args.collection, variant, args.snapshot_dir, queries, truth, keep=args.keep)
+            for variant in args.variants]
+    print_table(args.collection, rows, manifest)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"collection": args.collection, "rows": manifest["rows"], "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
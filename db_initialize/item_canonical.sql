@@ -0,0 +1,25 @@
+/*
+ Canonical item mapping written by data_clean/image_dedup.py
+
+ Every catalog item maps to the canonical item of its near-duplicate image group
+ (canonical_id = item_id when the item has no duplicate). phash/dhash cache the
+ 64-bit perceptual hashes so re-runs only hash new images.
+*/
+
+SET NAMES utf8mb4;
+SET FOREIGN_KEY_CHECKS = 0;
+
+-- ----------------------------
+-- Table structure for item_canonical
+-- ----------------------------
+DROP TABLE IF EXISTS `item_canonical`;
+CREATE TABLE `item_canonical`  (
+  `item_id` int NOT NULL,
+  `canonical_id` int NOT NULL,
+  `phash` bigint UNSIGNED NULL DEFAULT NULL,
+  `dhash` bigint UNSIGNED NULL DEFAULT NULL,
+  PRIMARY KEY (`item_id`) USING BTREE,
+  INDEX `index_canonical_id`(`canonical_id` ASC) USING BTREE
+) ENGINE = InnoDB CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = DYNAMIC;
+
+SET FOREIGN_KEY_CHECKS = 1;
@@ -0,0 +1,264 @@
+"""Build the BM25 inverted index over the item descriptions for the app's hybrid retrieval.
+
+Exact tokens such as brand or character names ("North Face", "Genshin Impact") are blurred by the dense
+embeddings, the app fuses the results of this index with the Milvus results (reciprocal-rank fusion,
+app/src/services/lexical_index.py, LEXICAL_INDEX_PATH).
+
+Layout of a generation <output>/<timestamp>_<random>/ (plain .npy files, memory-mapped by the app):
+    meta.json                       BM25 parameters, tokenizer, filter rows, per-category statistics
+    terms.json                      vocabulary, term id = position (order of first appearance)
+    <category>/item_ids.npy         int64, document i is item_ids[i] (sorted)
+    <category>/offsets.npy          int64 (terms + 1), postings of term t are [offsets[t], offsets[t + 1])
+    <category>/postings.npy         int32 document numbers, ascending within a term
+    <category>/weights.npy          float32 BM25 term weight of each posting (idf and length norm included)
+    <category>/filters.npy          uint8 (8, ceil(docs / 8)) packed bitsets, rows in meta["filter_rows"]
+The items are those ingested into Milvus (same canonical and exist_flag conditions as milvus.py), so both
+sides of the fusion rank the same catalog. Every build writes a new generation, then atomically replaces
+<output>/CURRENT with its name, so a worker loading LEXICAL_INDEX_PATH=<output> during a build sees either the
+previous index or the new one. The previous generation is kept for workers that still have it mapped.
+Rows are tokenized chunk by chunk and their postings spilled to scratch files in the generation directory,
+then written into memory-mapped arrays, so the build's memory does not grow with the catalog's text.
+
+Example:
+    python lexical_index.py --output lexical_index
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+import pymysql
+from dotenv import load_dotenv
+from numpy.lib.format import open_memmap
+
+CATEGORIES = {"Tops": "tops", "Pants": "pants", "Outerwear": "outerwear", "Dresses & Skirts": "dress_skirt"}
+TOKEN_PATTERN = r"[a-z0-9]+"
+STOPWORDS = [
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it", "its",
+    "of", "on", "or", "that", "the", "this", "to", "with",
+]
+# Milvus gender codes 1-4 (see milvus.py), then the season flags
+FILTER_ROWS = ["gender_1", "gender_2", "gender_3", "gender_4", "spring", "summer", "autumn", "winter"]
+POINTER = "CURRENT"  # file naming the published generation, read by app/src/services/generation.py
+GENERATION_NAME = re.compile(r"\d{14}(_[0-9a-f]{8})?")  # new_generation_name(), older builds had no suffix
+
+SQL = f"""SELECT
+            embeddings.item_id,
+            embeddings.description,
+            item_info.mastertype,
+            CASE
+                WHEN item_info.gender IN ('MEN', 'BOYS') THEN 1
+                WHEN item_info.gender IN ('WOMEN', 'GIRLS') THEN 2
+                WHEN item_info.gender = 'UNISEX' THEN 3
+                ELSE 4
+            END AS gender,
+            item_info.spring,
+            item_info.summer,
+            item_info.autumn,
+            item_info.winter
+        FROM embeddings
+        INNER JOIN item_info ON embeddings.item_id = item_info.item_id
+        LEFT JOIN item_canonical ON item_canonical.item_id = embeddings.item_id
+        WHERE (item_canonical.canonical_id IS NULL OR item_canonical.canonical_id = embeddings.item_id)
+        AND item_info.exist_flag = 1 AND embeddings.description IS NOT NULL
+        AND item_info.mastertype IN ({", ".join(repr(name) for name in CATEGORIES)})
+        ORDER BY embeddings.item_id"""
+
+
+def connect_to_db():
+    load_dotenv()
+    return pymysql.connect(
+        host=os.getenv("DB_HOST"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        db=os.getenv("DB_NAME"),
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def tokenize(text, pattern=re.compile(TOKEN_PATTERN), stopwords=frozenset(STOPWORDS)):
+    return [token for token in pattern.findall(text.lower()) if token not in stopwords]
+
+
+class CategorySpill:
+    """
+    # Description:
+        Postings of one category as they stream in: per chunk of rows, the (term, document, tf) triples are
+        written to a scratch .npy file, only compact per-document arrays (item id, length, filter flags) stay
+        in memory. Documents are numbered in item_id order, so chunk k only holds documents after chunk k - 1.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory)
+        self.chunks = []
+        self.item_ids, self.lengths, self.flags = [], [], []
+        self.docs = 0
+
+    def add_chunk(self, rows, vocabulary):
+        """
+        # *@param rows: Rows of this category from one fetch, in item_id order
+        # *@param vocabulary: {term: id}, extended with the unseen terms
+        """
+        terms, docs, tfs, lengths, flags = [], [], [], [], []
+        for row in rows:
+            counts = Counter(tokenize(row["description"]))
+            terms.extend(vocabulary.setdefault(term, len(vocabulary)) for term in counts)
+            tfs.extend(counts.values())
+            docs.extend([self.docs] * len(counts))
+            lengths.append(sum(counts.values()))
+            flags.append([int(row["gender"]) == code for code in (1, 2, 3, 4)]
+                         + [bool(row[season]) for season in ("spring", "summer", "autumn", "winter")])
+            self.docs += 1
+        self.item_ids.append(np.array([row["item_id"] for row in rows], dtype=np.int64))
+        self.lengths.append(np.array(lengths, dtype=np.int32))
+        self.flags.append(np.array(flags, dtype=bool).reshape(len(rows), len(FILTER_ROWS)))
+        path = os.path.join(self.directory, f"{len(self.chunks)}.npy")
+        np.save(path, np.array([terms, docs, tfs], dtype=np.int64).reshape(3, -1))
+        self.chunks.append(path)
+
+    def iter_chunks(self):
+        for path in self.chunks:
+            terms, docs, tfs = np.load(path)
+            yield terms, docs, tfs
+
+
+def spill_documents(connection, spill_dir, chunk_size=10000):
+    """
+    # *@return: ({category: CategorySpill}, {term: id}), memory bounded by one chunk plus the vocabulary
+    """
+    spills = {category: CategorySpill(os.path.join(spill_dir, category)) for category in CATEGORIES.values()}
+    vocabulary = {}
+    with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
+        cursor.execute(SQL)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            by_category = {}
+            for row in rows:
+                by_category.setdefault(CATEGORIES[row["mastertype"]], []).append(row)
+            for category, category_rows in by_category.items():
+                spills[category].add_chunk(category_rows, vocabulary)
+    return spills, vocabulary
+
+
+def build_category(spill, n_terms, output, k1, b):
+    """
+    # *@param spill: CategorySpill of the category
+    # *@param n_terms: Size of the whole vocabulary
+    # *@param output: Directory of the category's arrays (see the module docstring)
+    # *@return: Statistics of the category
+    # Description:
+        Two passes over the spilled chunks: document frequencies first (offsets and idf), then every chunk
+        is sorted by (term, document) and scattered into the memory-mapped postings / weights right after
+        what the previous chunks wrote for each term, which keeps the documents ascending within a term.
+    """
+    n = spill.docs
+    doc_lengths = np.concatenate(spill.lengths or [np.zeros(0, dtype=np.int32)]).astype(np.float64)
+    avgdl = float(doc_lengths.mean()) if n else 0.0
+
+    df = np.zeros(n_terms, dtype=np.int64)
+    for terms, _, _ in spill.iter_chunks():
+        df += np.bincount(terms, minlength=n_terms)
+    idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+    offsets = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(df, out=offsets[1:])
+
+    os.makedirs(output)
+    postings = open_memmap(os.path.join(output, "postings.npy"), mode="w+", dtype=np.int32, shape=(int(offsets[-1]),))
+    weights = open_memmap(os.path.join(output, "weights.npy"), mode="w+", dtype=np.float32, shape=(int(offsets[-1]),))
+    filled = np.zeros(n_terms, dtype=np.int64)
+    for terms, docs, tfs in spill.iter_chunks():
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order].astype(np.float64)
+        within = np.arange(len(terms)) - np.searchsorted(terms, terms, side="left")  # rank inside its term
+        positions = offsets[terms] + filled[terms] + within
+        norm = k1 * (1 - b + b * doc_lengths[docs] / (avgdl or 1.0))
+        postings[positions] = docs
+        weights[positions] = idf[terms] * tfs * (k1 + 1) / (tfs + norm)
+        filled += np.bincount(terms, minlength=n_terms)
+    postings.flush()
+    weights.flush()
+    del postings, weights
+
+    flags = np.concatenate(spill.flags or [np.zeros((0, len(FILTER_ROWS)), dtype=bool)])
+    np.save(os.path.join(output, "item_ids.npy"), np.concatenate(spill.item_ids or [np.zeros(0, dtype=np.int64)]))
+    np.save(os.path.join(output, "offsets.npy"), offsets)
+    np.save(os.path.join(output, "filters.npy"), np.packbits(flags.T, axis=1))
+    return {"docs": n, "postings": int(offsets[-1]), "avgdl": round(avgdl, 3)}
+
+
+def new_generation_name():
+    """Timestamp (sorts by age) plus a random suffix, so two builds started in the same second never collide."""
+    return f"{time.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def publish(output, generation, keep=2):
+    """Atomically point `<output>/CURRENT` at `generation`, then remove all but the `keep` newest generations."""
+    pointer = os.path.join(output, POINTER)
+    with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{pointer}.tmp", pointer)
+    generations = sorted((name for name in os.listdir(output)
+                          if name != generation and GENERATION_NAME.fullmatch(name)
+                          and os.path.isdir(os.path.join(output, name))),
+                         key=lambda name: (name[:14], os.path.getmtime(os.path.join(output, name))))
+    for name in generations[:max(0, len(generations) - (keep - 1))]:
+        shutil.rmtree(os.path.join(output, name), ignore_errors=True)
+
+
+def build(connection, output, k1=1.2, b=0.75, chunk_size=10000):
+    generation = new_generation_name()
+    tmp = os.path.join(output, f"{generation}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    spill_dir = os.path.join(tmp, "spill")
+    spills, vocabulary = spill_documents(connection, spill_dir, chunk_size=chunk_size)
+
+    meta = {"k1": k1, "b": b, "token_pattern": TOKEN_PATTERN, "stopwords": STOPWORDS,
+            "filter_rows": FILTER_ROWS, "terms": len(vocabulary), "categories": {}}
+    for category, spill in spills.items():
+        stats = build_category(spill, len(vocabulary), os.path.join(tmp, category), k1, b)
+        meta["categories"][category] = stats
+        print(f"{category}: {stats['docs']} items, {stats['postings']} postings")
+    shutil.rmtree(spill_dir)
+    with open(os.path.join(tmp, "terms.json"), "w", encoding="utf-8") as f:
+        json.dump(list(vocabulary), f, ensure_ascii=False)  # insertion order = term id
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    os.replace(tmp, os.path.join(output, generation))
+    publish(output, generation)
+    return meta
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the BM25 index over item descriptions.")
+    parser.add_argument("--output", default="lexical_index")
+    parser.add_argument("--k1", type=float, default=1.2)
+    parser.add_argument("--b", type=float, default=0.75)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Rows fetched and spilled at a time")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    connection = connect_to_db()
+    try:
+        meta = build(connection, args.output, k1=args.k1, b=args.b, chunk_size=args.chunk_size)
+    finally:
+        connection.close()
+    print(f"{meta['terms']} terms written to {args.output}, set LEXICAL_INDEX_PATH={os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
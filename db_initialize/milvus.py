@@ -1,11 +1,12 @@
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
 from dotenv import load_dotenv
 import os
+import argparse
 import pymysql
 import json
 import numpy as np
 import logging
-from time import sleep
+from time import sleep, perf_counter
 
 # Configure logging
 logging.basicConfig(filename='data_ingestion.log', level=logging.INFO,
@@ -30,46 +31,161 @@ def connect_to_db():
         logging.error(f"Error connecting to the database: {e}")
         return None
 
-# Fetch data with retries
-def fetch_data(sql, retries=3, delay=5):
+def bump_catalog_version():
+    """Tell the app's item metadata cache that the catalog changed (catalog_sync.sql)."""
+    connection = connect_to_db()
+    if connection is None:
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE catalog_sync SET version = version + 1, synced_at = NOW() WHERE id = 1")
+        connection.commit()
+        logging.info("Catalog version bumped.")
+    except Exception as e:
+        logging.error(f"Error bumping the catalog version: {e}")
+    finally:
+        connection.close()
+
+# Optional dimension reduction fitted offline by dim_reduction.py (EMBEDDING_PROJECTION_PATH).
+# The app applies the same file to query embeddings, see app/src/services/projection.py.
+def load_projection(path):
+    """Return (kind, dim, mean, components) from a projection file, or None when no file is configured."""
+    if not path:
+        return None
+    with np.load(path) as f:
+        kind, dim = str(f["kind"]), int(f["dim"])
+        return kind, dim, f["mean"].astype(np.float32), f["components"][:dim].astype(np.float32)
+
+def project_block(vectors, projection):
+    """Project (pca) or truncate (truncate) raw 768-d vectors, returns unit-length float16 vectors."""
+    kind, dim, mean, components = projection
+    block = np.asarray(vectors, dtype=np.float32)
+    if kind == "pca":
+        block = (block - mean) @ components.T
+    else:
+        block = block[:, :dim]
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (block / norms).astype(np.float16)
+
+PROJECTION = load_projection(os.getenv("EMBEDDING_PROJECTION_PATH"))
+EMBEDDING_DIM = PROJECTION[1] if PROJECTION else 768
+EMBEDDING_DESCRIPTION = (f"text-embedding-004, {PROJECTION[0]} to {EMBEDDING_DIM} dims" if PROJECTION
+                         else "text-embedding-004, 768 dims")
+
+# Stream data in chunks through a server-side cursor
+def stream_data(sql, chunk_size=5000, retries=3, delay=5):
+    """Yield lists of at most `chunk_size` rows without materializing the result set.
+
+    SSDictCursor keeps the result on the MySQL server, so client memory is bounded by one chunk.
+    A retry is only attempted if the failure happens before the first chunk was yielded,
+    otherwise rows would be delivered twice.
+    """
     for attempt in range(retries):
         connection = connect_to_db()
         if not connection:
             logging.error("Database connection failed.")
             sleep(delay)
             continue
+        yielded = False
         try:
-            with connection.cursor() as cursor:
+            with connection.cursor(pymysql.cursors.SSDictCursor) as cursor:
                 cursor.execute(sql)
-                result = cursor.fetchall()
-                return result
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return
+                    yielded = True
+                    yield rows
         except pymysql.MySQLError as e:
-            logging.error(f"MySQL error on attempt {attempt+1}: {e}")
+            logging.error(f"MySQL error while streaming on attempt {attempt+1}: {e}")
+            if yielded:
+                raise
             sleep(delay)
         finally:
             connection.close()
-    logging.error("All retries failed for fetching data.")
-    return []
-
-# Process embeddings efficiently
-def process_embeddings(data, embedding_field='embeddings'):
-    embeddings = []
-    cleaned_data = []
-    for record in data:
+    logging.error("All retries failed for streaming data.")
+
+# Decode one chunk of rows into columnar, preallocated NumPy blocks
+def decode_rows(rows, dim=768, embedding_field='embeddings', normalize=False, project=True):
+    """Return (item_ids, vectors, flags) blocks, flags columns are gender, spring, summer, autumn, winter.
+
+    Vectors are written straight into one (n, dim) float16 block instead of one array per record.
+    The binary `embedding_f16` column (data_clean/gemini_embedding_generator.py) is preferred over the JSON one.
+    Rows whose embedding cannot be decoded are logged and dropped.
+    With `normalize`, vectors are scaled to unit length (for IP indexes standing in for COSINE).
+    With `project` and a configured PROJECTION, vectors are reduced to EMBEDDING_DIM (already unit length).
+    """
+    n = len(rows)
+    item_ids = np.empty(n, dtype=np.int64)
+    vectors = np.empty((n, dim), dtype=np.float16)
+    flags = np.empty((n, 5), dtype=np.int32)
+    kept = 0
+    for record in rows:
         try:
-            embedding = json.loads(record[embedding_field])
-            embeddings.append(np.array(embedding, dtype=np.float16))
-            # Prepare cleaned record without 'embeddings'
-            cleaned_record = {k: v for k, v in record.items() if k != embedding_field}
-            cleaned_record['embedding'] = embeddings[-1]
-            cleaned_data.append(cleaned_record)
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            binary = record.get('embedding_f16')
+            vector = np.frombuffer(binary, dtype=np.float16) if binary else json.loads(record[embedding_field])
+            if len(vector) != dim:
+                raise ValueError(f"expected {dim} dimensions, got {len(vector)}")
+            vectors[kept] = vector
+            item_ids[kept] = record['item_id']
+            flags[kept] = (record['gender'], record['spring'] or 0, record['summer'] or 0,
+                           record['autumn'] or 0, record['winter'] or 0)
+            kept += 1
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
             logging.error(f"Error processing embedding for item_id {record.get('item_id')}: {e}")
-    return cleaned_data
+    vectors = vectors[:kept]
+    if project and PROJECTION:
+        vectors = project_block(vectors, PROJECTION)
+    elif normalize:
+        normalize_block(vectors)
+    return item_ids[:kept], vectors, flags[:kept]
+
+def normalize_block(vectors):
+    """Scale float16 vectors to unit length in place."""
+    norms = np.linalg.norm(vectors.astype(np.float32), axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors[:] = vectors / norms
+    return vectors
+
+def decode_chunk(rows, dim=768, embedding_field='embeddings', normalize=False):
+    """Return the chunk as columns in schema order: [item_id, embedding, gender, spring, summer, autumn, winter]."""
+    return columns_from_block(*decode_rows(rows, dim=dim, embedding_field=embedding_field, normalize=normalize))
+
+def columns_from_block(item_ids, vectors, flags):
+    """Convert decoded blocks into the column list expected by `collection.insert`."""
+    return [item_ids.tolist(), list(vectors), *(flags[:, i].tolist() for i in range(flags.shape[1]))]
+
+class ThroughputReport:
+    """Log progress and rows/sec every `every` seconds and once at the end."""
+
+    def __init__(self, name, every=10.0):
+        self.name = name
+        self.every = every
+        self.fetched = 0
+        self.inserted = 0
+        self.started = perf_counter()
+        self.last_report = self.started
+
+    def update(self, fetched=0, inserted=0):
+        self.fetched += fetched
+        self.inserted += inserted
+        now = perf_counter()
+        if now - self.last_report >= self.every:
+            self.last_report = now
+            self.log()
+
+    def log(self, final=False):
+        elapsed = max(perf_counter() - self.started, 1e-9)
+        message = (f"[{self.name}] {'done: ' if final else ''}fetched {self.fetched} rows, inserted {self.inserted} rows "
+                   f"in {elapsed:.1f}s ({self.fetched/elapsed:.0f} rows/s fetched, {self.inserted/elapsed:.0f} rows/s inserted)")
+        logging.info(message)
+        print(message)
 
 # Create or get collection
 def create_collection(name, schema):
-    if name not in utility.list_collections():
+    # has_collection also resolves aliases created by rebuild.py
+    if not utility.has_collection(name):
         collection = Collection(name=name, schema=schema)
         logging.info(f"Collection '{name}' created.")
     else:
@@ -88,40 +204,56 @@ def create_index(collection, field_name, index_params):
     except Exception as e:
         logging.error(f"Error creating index for '{collection.name}': {e}")
 
-# Insert data with retries and duplicate checks
-def insert_data(collection, data, batch_size=1000, retries=3, delay=5):
-    # Fetch existing item_ids to prevent duplicates
-    existing_ids = set()
+# Drop ids that already exist in the collection, one chunk at a time
+def filter_existing(collection, columns):
+    ids = columns[0]
+    if not ids:
+        return columns
     try:
-        results = collection.query(expr="item_id >= 0", output=["item_id"])
+        results = collection.query(expr=f"item_id in {ids}", output_fields=["item_id"], limit=len(ids))
         existing_ids = {item['item_id'] for item in results}
     except Exception as e:
         logging.error(f"Error fetching existing item_ids from '{collection.name}': {e}")
+        return columns
+    if not existing_ids:
+        return columns
+    keep = [i for i, item_id in enumerate(ids) if item_id not in existing_ids]
+    return [[column[i] for i in keep] for column in columns]
 
-    # Filter out existing records
-    new_data = [record for record in data if record['item_id'] not in existing_ids]
-    if not new_data:
-        logging.info(f"No new data to insert into '{collection.name}'.")
-        return
-
-    total_new = len(new_data)
-    for i in range(0, total_new, batch_size):
-        batch = new_data[i:i+batch_size]
+# Insert columnar data with retries
+def insert_columns(collection, columns, batch_size=1000, retries=3, delay=5):
+    """Insert a chunk in column format, returns the number of rows inserted."""
+    total = len(columns[0])
+    inserted = 0
+    for i in range(0, total, batch_size):
+        batch = [column[i:i+batch_size] for column in columns]
         for attempt in range(retries):
             try:
                 collection.insert(batch)
-                logging.info(f"Batch {i//batch_size + 1} ({i+1}-{min(i+batch_size, total_new)}) inserted successfully into '{collection.name}'.")
+                inserted += len(batch[0])
                 break
             except Exception as e:
-                logging.error(f"Error inserting batch {i//batch_size + 1} into '{collection.name}' on attempt {attempt+1}: {e}")
+                logging.error(f"Error inserting rows {i+1}-{min(i+batch_size, total)} into '{collection.name}' on attempt {attempt+1}: {e}")
                 sleep(delay)
         else:
-            logging.error(f"Failed to insert batch {i//batch_size + 1} into '{collection.name}' after {retries} attempts.")
+            logging.error(f"Failed to insert rows {i+1}-{min(i+batch_size, total)} into '{collection.name}' after {retries} attempts.")
+    return inserted
+
+# Stream one category from MySQL into its collection
+def ingest_collection(collection, sql, chunk_size=5000, batch_size=1000, normalize=False):
+    report = ThroughputReport(collection.name)
+    for rows in stream_data(sql, chunk_size=chunk_size):
+        columns = filter_existing(collection, decode_chunk(rows, normalize=normalize))
+        report.update(fetched=len(rows), inserted=insert_columns(collection, columns, batch_size=batch_size))
+    report.log(final=True)
+    if report.fetched == 0:
+        logging.info(f"No data fetched for collection '{collection.name}'.")
+    return report
 
 # Define the common fields
 fields = [
     FieldSchema(name="item_id", dtype=DataType.INT64, is_primary=True, auto_id=False),
-    FieldSchema(name="embedding", dtype=DataType.FLOAT16_VECTOR, dim=768),
+    FieldSchema(name="embedding", dtype=DataType.FLOAT16_VECTOR, dim=EMBEDDING_DIM, description=EMBEDDING_DESCRIPTION),
     FieldSchema(name="gender", dtype=DataType.INT32, description="Gender: MAN=1, WOMEN=2, UNISEX=3"),
     FieldSchema(name="spring", dtype=DataType.INT32, description="Spring season flag: 1=Yes, 0=No"),
     FieldSchema(name="summer", dtype=DataType.INT32, description="Summer season flag: 1=Yes, 0=No"),
@@ -129,17 +261,42 @@ fields = [
     FieldSchema(name="winter", dtype=DataType.INT32, description="Winter season flag: 1=Yes, 0=No")
 ]
 
-schema = CollectionSchema(fields=fields, description="Clothing Items", enable_dynamic_field=False)
+schema = CollectionSchema(fields=fields, description=f"Clothing Items ({EMBEDDING_DESCRIPTION})", enable_dynamic_field=False)
 
-# Connect to Milvus
-connections.connect(host='standalone', port='19530')
+def pq_subquantizers(dim, dims_per_subquantizer=8):
+    """Largest m <= dim / 8 that divides dim (Milvus rejects IVF_PQ when dim % m != 0)."""
+    target = max(1, dim // dims_per_subquantizer)
+    return next(m for m in range(target, 0, -1) if dim % m == 0)
+
+# Index variants selectable per collection. PQ uses about one sub-quantizer per 8 dims, m always divides EMBEDDING_DIM.
+# "IP" variants expect unit-length vectors: ingestion normalizes them, and IP then ranks exactly like COSINE.
+INDEX_VARIANTS = {
+    "HNSW": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 128}},
+    "HNSW_IP": {"metric_type": "IP", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 128}},
+    "HNSW_SQ8": {"metric_type": "COSINE", "index_type": "HNSW_SQ", "params": {"M": 16, "efConstruction": 128, "sq_type": "SQ8"}},
+    "IVF_FLAT": {"metric_type": "COSINE", "index_type": "IVF_FLAT", "params": {"nlist": 1024}},
+    "IVF_SQ8": {"metric_type": "COSINE", "index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+    "IVF_SQ8_IP": {"metric_type": "IP", "index_type": "IVF_SQ8", "params": {"nlist": 1024}},
+    "IVF_PQ": {"metric_type": "COSINE", "index_type": "IVF_PQ", "params": {"nlist": 1024, "m": pq_subquantizers(EMBEDDING_DIM), "nbits": 8}},
+}
+
+def index_variant(variant, metric_type=None, **params):
+    """Index params for a named variant, with its build params overridden by `params`."""
+    base = INDEX_VARIANTS[variant]
+    return {"metric_type": metric_type or base["metric_type"], "index_type": base["index_type"],
+            "params": {**base["params"], **params}}
+
+def needs_normalized_vectors(index_params):
+    return index_params["metric_type"] == "IP"
 
 # Define collections and their specific index parameters
+# Near-duplicate images (data_clean/image_dedup.py) are ingested once, through their canonical item only.
 collections_info = {
     "tops": {
         "sql": """SELECT 
                     embeddings.item_id, 
-                    embeddings.description_embeddings AS embeddings,
+                    embeddings.embedding_f16,
+                    CASE WHEN embeddings.embedding_f16 IS NULL THEN embeddings.description_embeddings END AS embeddings,
                     CASE 
                         WHEN item_info.gender IN ('MEN', 'BOYS') THEN 1
                         WHEN item_info.gender IN ('WOMEN', 'GIRLS') THEN 2
@@ -152,13 +309,16 @@ collections_info = {
                     item_info.winter
                 FROM embeddings 
                 INNER JOIN item_info ON embeddings.item_id = item_info.item_id
-                WHERE item_info.mastertype = 'Tops' AND item_info.exist_flag = 1""",
-        "index_params": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 32, "efConstruction": 256}}
+                LEFT JOIN item_canonical ON item_canonical.item_id = embeddings.item_id
+                WHERE (item_canonical.canonical_id IS NULL OR item_canonical.canonical_id = embeddings.item_id)
+                AND item_info.mastertype = 'Tops' AND item_info.exist_flag = 1""",
+        "index_params": index_variant("HNSW", M=32, efConstruction=256)
     },
     "pants": {
         "sql": """SELECT 
                     embeddings.item_id, 
-                    embeddings.description_embeddings AS embeddings,
+                    embeddings.embedding_f16,
+                    CASE WHEN embeddings.embedding_f16 IS NULL THEN embeddings.description_embeddings END AS embeddings,
                     CASE 
                         WHEN item_info.gender IN ('MEN', 'BOYS') THEN 1
                         WHEN item_info.gender IN ('WOMEN', 'GIRLS') THEN 2
@@ -171,13 +331,16 @@ collections_info = {
                     item_info.winter
                 FROM embeddings 
                 INNER JOIN item_info ON embeddings.item_id = item_info.item_id
-                WHERE item_info.mastertype = 'Pants' AND item_info.exist_flag = 1""",
-        "index_params": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 128}}
+                LEFT JOIN item_canonical ON item_canonical.item_id = embeddings.item_id
+                WHERE (item_canonical.canonical_id IS NULL OR item_canonical.canonical_id = embeddings.item_id)
+                AND item_info.mastertype = 'Pants' AND item_info.exist_flag = 1""",
+        "index_params": index_variant("HNSW")
     },
     "outerwear": {
         "sql": """SELECT 
                     embeddings.item_id, 
-                    embeddings.description_embeddings AS embeddings,
+                    embeddings.embedding_f16,
+                    CASE WHEN embeddings.embedding_f16 IS NULL THEN embeddings.description_embeddings END AS embeddings,
                     CASE 
                         WHEN item_info.gender IN ('MEN', 'BOYS') THEN 1
                         WHEN item_info.gender IN ('WOMEN', 'GIRLS') THEN 2
@@ -190,13 +353,16 @@ collections_info = {
                     item_info.winter
                 FROM embeddings 
                 INNER JOIN item_info ON embeddings.item_id = item_info.item_id
-                WHERE item_info.mastertype = 'Outerwear' AND item_info.exist_flag = 1""",
-        "index_params": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 128}}
+                LEFT JOIN item_canonical ON item_canonical.item_id = embeddings.item_id
+                WHERE (item_canonical.canonical_id IS NULL OR item_canonical.canonical_id = embeddings.item_id)
+                AND item_info.mastertype = 'Outerwear' AND item_info.exist_flag = 1""",
+        "index_params": index_variant("HNSW")
     },
     "dress_skirt": {
         "sql": """SELECT 
                     embeddings.item_id, 
-                    embeddings.description_embeddings AS embeddings,
+                    embeddings.embedding_f16,
+                    CASE WHEN embeddings.embedding_f16 IS NULL THEN embeddings.description_embeddings END AS embeddings,
                     CASE 
                         WHEN item_info.gender IN ('MEN', 'BOYS') THEN 1
                         WHEN item_info.gender IN ('WOMEN', 'GIRLS') THEN 2
@@ -209,27 +375,51 @@ collections_info = {
                     item_info.winter
                 FROM embeddings 
                 INNER JOIN item_info ON embeddings.item_id = item_info.item_id
-                WHERE item_info.mastertype = 'Dresses & Skirts' AND item_info.exist_flag = 1""",
-        "index_params": {"metric_type": "COSINE", "index_type": "HNSW", "params": {"M": 16, "efConstruction": 128}}
+                LEFT JOIN item_canonical ON item_canonical.item_id = embeddings.item_id
+                WHERE (item_canonical.canonical_id IS NULL OR item_canonical.canonical_id = embeddings.item_id)
+                AND item_info.mastertype = 'Dresses & Skirts' AND item_info.exist_flag = 1""",
+        "index_params": index_variant("HNSW")
     }
 }
 
-for name, info in collections_info.items():
-    # Create or get collection
-    collection = create_collection(name, schema)
-    
-    # Create index
-    create_index(collection, 'embedding', info['index_params'])
-    
-    # Fetch and process data
-    data = fetch_data(info['sql'])
-    if not data:
-        logging.info(f"No data fetched for collection '{name}'. Skipping insertion.")
-        continue
-    
-    data = process_embeddings(data)
-    
-    # Insert data
-    insert_data(collection, data)
-    
- 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load item embeddings from MySQL into Milvus.")
+    parser.add_argument("--mode", choices=["stream", "pipeline"], default="stream",
+                        help="stream: one collection after another; pipeline: overlapped fetch/decode/insert stages")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows fetched from MySQL per chunk")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per Milvus insert call")
+    parser.add_argument("--fetchers", type=int, default=len(collections_info), help="Concurrent MySQL fetchers (pipeline mode)")
+    parser.add_argument("--decoders", type=int, default=os.cpu_count() or 2, help="Decoder processes (pipeline mode)")
+    parser.add_argument("--inserters", type=int, default=4, help="Concurrent Milvus insert workers (pipeline mode)")
+    parser.add_argument("--queue-size", type=int, default=8, help="Chunks buffered between two stages (pipeline mode)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Connect to Milvus
+    connections.connect(host='standalone', port='19530')
+
+    targets = {}
+    for name, info in collections_info.items():
+        # Create or get collection
+        collection = create_collection(name, schema)
+
+        # Create index
+        create_index(collection, 'embedding', info['index_params'])
+        targets[name] = (collection, info['sql'], needs_normalized_vectors(info['index_params']))
+
+    if args.mode == "pipeline":
+        from pipeline import run_pipeline
+        run_pipeline(targets, chunk_size=args.chunk_size, batch_size=args.batch_size, fetchers=args.fetchers,
+                     decoders=args.decoders, inserters=args.inserters, queue_size=args.queue_size)
+    else:
+        for collection, sql, normalize in targets.values():
+            # Stream, decode and insert data chunk by chunk
+            ingest_collection(collection, sql, chunk_size=args.chunk_size, batch_size=args.batch_size, normalize=normalize)
+    bump_catalog_version()
+
+
+if __name__ == "__main__":
+    main()
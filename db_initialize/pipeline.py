@@ -0,0 +1,133 @@
+"""Pipelined ingestion: concurrent MySQL fetchers -> decoder process pool -> Milvus insert workers.
+
+Stages are connected by bounded queues, so a slow stage applies backpressure to the one before it
+and memory stays bounded by `queue_size` chunks per stage, whatever the catalog size.
+Run through `python milvus.py --mode pipeline`.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+from milvus import stream_data, decode_rows, columns_from_block, filter_existing, insert_columns
+
+_DONE = object()
+
+
+class StageStats:
+    """Thread-safe row counter and busy time of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.chunks = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, rows, busy):
+        with self._lock:
+            self.rows += rows
+            self.chunks += 1
+            self.busy += busy
+
+    def summary(self, wall):
+        wall_rate = self.rows / wall if wall > 0 else 0.0
+        busy_rate = self.rows / self.busy if self.busy > 0 else 0.0
+        return (f"{self.name:<7} {self.rows:>10} rows  {self.chunks:>6} chunks  "
+                f"{wall_rate:>9.0f} rows/s wall  {busy_rate:>9.0f} rows/s busy  ({self.busy:.1f}s busy)")
+
+
+def _timed_decode(rows, normalize):
+    """Runs in a decoder process: decode one chunk and report how long it took."""
+    started = perf_counter()
+    item_ids, vectors, flags = decode_rows(rows, normalize=normalize)
+    return item_ids, vectors, flags, len(rows), perf_counter() - started
+
+
+def _fetch(name, sql, chunk_size, rows_q, stats):
+    try:
+        started = perf_counter()
+        for rows in stream_data(sql, chunk_size=chunk_size):
+            stats.add(len(rows), perf_counter() - started)
+            rows_q.put((name, rows))
+            started = perf_counter()
+    except Exception as e:
+        logging.error(f"Fetcher for '{name}' failed: {e}")
+
+
+def _dispatch(rows_q, decoded_q, pool, inserters, normalize):
+    """Hand fetched chunks to the decoder pool, keeping at most `decoded_q.maxsize` chunks in flight."""
+    while True:
+        item = rows_q.get()
+        if item is _DONE:
+            break
+        name, rows = item
+        decoded_q.put((name, pool.submit(_timed_decode, rows, normalize[name])))
+    for _ in range(inserters):
+        decoded_q.put(_DONE)
+
+
+def _insert(collections, decoded_q, batch_size, decode_stats, insert_stats):
+    while True:
+        item = decoded_q.get()
+        if item is _DONE:
+            break
+        name, future = item
+        try:
+            item_ids, vectors, flags, fetched, decode_time = future.result()
+        except Exception as e:
+            logging.error(f"Decoding a chunk for '{name}' failed: {e}")
+            continue
+        decode_stats.add(fetched, decode_time)
+        started = perf_counter()
+        collection = collections[name]
+        columns = filter_existing(collection, columns_from_block(item_ids, vectors, flags))
+        inserted = insert_columns(collection, columns, batch_size=batch_size)
+        insert_stats.add(inserted, perf_counter() - started)
+
+
+def run_pipeline(targets, chunk_size=5000, batch_size=1000, fetchers=4, decoders=4, inserters=4, queue_size=8):
+    """Ingest every collection concurrently.
+
+    `targets` maps collection name -> (Collection, sql, normalize). Returns the per-stage StageStats.
+    """
+    collections = {name: collection for name, (collection, _, _) in targets.items()}
+    normalize = {name: flag for name, (_, _, flag) in targets.items()}
+    rows_q = queue.Queue(maxsize=queue_size)
+    decoded_q = queue.Queue(maxsize=queue_size)
+    stats = {stage: StageStats(stage) for stage in ("fetch", "decode", "insert")}
+
+    started = perf_counter()
+    with ProcessPoolExecutor(max_workers=decoders) as pool:
+        dispatcher = threading.Thread(target=_dispatch, args=(rows_q, decoded_q, pool, inserters, normalize),
+                                      daemon=True)
+        dispatcher.start()
+        insert_threads = [
+            threading.Thread(target=_insert, args=(collections, decoded_q, batch_size, stats["decode"], stats["insert"]),
+                             daemon=True)
+            for _ in range(inserters)
+        ]
+        for thread in insert_threads:
+            thread.start()
+
+        with ThreadPoolExecutor(max_workers=fetchers) as fetch_pool:
+            for name, (_, sql, _) in targets.items():
+                fetch_pool.submit(_fetch, name, sql, chunk_size, rows_q, stats["fetch"])
+
+        rows_q.put(_DONE)
+        dispatcher.join()
+        for thread in insert_threads:
+            thread.join()
+
+    for collection in collections.values():
+        collection.flush()
+
+    wall = perf_counter() - started
+    lines = [f"Pipeline finished in {wall:.1f}s "
+             f"(fetchers={fetchers}, decoders={decoders}, inserters={inserters}, queue_size={queue_size})"]
+    lines += [s.summary(wall) for s in stats.values()]
+    for line in lines:
+        logging.info(line)
+        print(line)
+    return stats
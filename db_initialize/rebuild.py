@@ -0,0 +1,145 @@
+"""Blue/green rebuild of a category collection behind a Milvus alias.
+
+The Flask app searches `tops`, `pants`, `outerwear` and `dress_skirt` by name. Each of those names is
+served by an alias pointing at a versioned physical collection (e.g. `tops__g20250115023317`).
+A rebuild:
+    1. bulk loads a new generation from the snapshot and builds its index (bulk_load.py),
+    2. loads it into memory and warms it up, so the first user query after the swap is not a cold load,
+    3. runs a recall@5 / latency smoke check against exact search over the snapshot,
+    4. atomically points the alias at the new generation,
+    5. releases and drops old generations, keeping `--keep` previous ones for rollback.
+Searches keep hitting the old generation until step 4, so they never see a half-built index.
+
+The first rebuild of a name that is still a plain collection needs `--migrate`: the plain collection
+has to be dropped before an alias with the same name can be created, which is the only moment the
+name is briefly unavailable.
+
+Example:
+    python rebuild.py --collections tops pants --snapshot-dir snapshots --export --migrate
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import datetime
+
+from pymilvus import connections, utility, Collection
+
+from milvus import collections_info, bump_catalog_version
+from bulk_load import export_snapshot, bulk_load_collection
+from evaluation import search_params_for, sample_queries, exact_topk, recall_at_k, measure_search
+
+
+def generation_prefix(alias):
+    return f"{alias}__g"
+
+
+def list_generations(alias):
+    prefix = generation_prefix(alias)
+    return sorted(name for name in utility.list_collections() if name.startswith(prefix))
+
+
+def current_target(alias):
+    """Physical collection behind `alias`, or None if the alias does not exist yet."""
+    for name in utility.list_collections():
+        if alias in utility.list_aliases(name):
+            return name
+    return None
+
+
+def warm_up(collection, queries, search_params, rounds=2):
+    collection.load()
+    utility.wait_for_loading_complete(collection.name)
+    for _ in range(rounds):
+        measure_search(collection, queries, search_params)
+
+
+def smoke_check(collection, snapshot_dir, name, index_params, queries, min_recall, max_p95_ms):
+    search_params = search_params_for(index_params)
+    # COSINE over the raw snapshot is the ground truth for both COSINE and IP-on-normalized indexes
+    truth = exact_topk(snapshot_dir, name, queries, k=5, metric="COSINE")
+    found, latency = measure_search(collection, queries, search_params)
+    recall = recall_at_k(found, truth)
+    report = {"collection": collection.name, "recall@5": round(recall, 4), **{k: round(v, 2) for k, v in latency.items()}}
+    logging.info(f"Smoke check: {report}")
+    print(f"Smoke check: {report}")
+    return recall >= min_recall and latency["p95"] <= max_p95_ms, report
+
+
+def swap_alias(alias, generation, migrate=False):
+    previous = current_target(alias)
+    if previous:
+        utility.alter_alias(collection_name=generation, alias=alias)
+    else:
+        if utility.has_collection(alias):
+            if not migrate:
+                raise RuntimeError(f"'{alias}' is a plain collection, rerun with --migrate to replace it with an alias.")
+            utility.drop_collection(alias)
+        utility.create_alias(collection_name=generation, alias=alias)
+    logging.info(f"Alias '{alias}' now points at '{generation}' (was '{previous}').")
+    print(f"Alias '{alias}' now points at '{generation}' (was '{previous}').")
+    return previous
+
+
+def drop_old_generations(alias, keep=1):
+    live = current_target(alias)
+    old = [name for name in list_generations(alias) if name != live]
+    for name in old[:max(len(old) - keep, 0)]:
+        utility.drop_collection(name)
+        logging.info(f"Dropped old generation '{name}'.")
+    # Generations kept for rollback do not need to occupy query node memory
+    for name in old[max(len(old) - keep, 0):]:
+        Collection(name=name).release()
+
+
+def rebuild(alias, snapshot_dir, index_params, sample=100, min_recall=0.9, max_p95_ms=50.0, keep=1, migrate=False):
+    generation = f"{generation_prefix(alias)}{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    try:
+        collection = bulk_load_collection(alias, snapshot_dir, index_params, target_name=generation)
+    except Exception:
+        # Failed bulk insert tasks: drop the partial generation, the alias is left unchanged
+        if utility.has_collection(generation):
+            utility.drop_collection(generation)
+        raise
+
+    _, queries = sample_queries(snapshot_dir, alias, n=sample)
+    warm_up(collection, queries, search_params_for(index_params))
+    passed, report = smoke_check(collection, snapshot_dir, alias, index_params, queries, min_recall, max_p95_ms)
+    if not passed:
+        utility.drop_collection(generation)
+        raise RuntimeError(f"Generation '{generation}' failed the smoke check {report}, alias left unchanged.")
+
+    swap_alias(alias, generation, migrate=migrate)
+    # Right after the swap: app workers re-read the search params (metric, index type) when the version changes
+    bump_catalog_version()
+    drop_old_generations(alias, keep=keep)
+    return generation
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rebuild collections as new generations and swap their aliases.")
+    parser.add_argument("--collections", nargs="+", default=list(collections_info), choices=list(collections_info))
+    parser.add_argument("--snapshot-dir", default="snapshots")
+    parser.add_argument("--export", action="store_true", help="Export a fresh snapshot from MySQL first")
+    parser.add_argument("--index-params", type=json.loads, default=None)
+    parser.add_argument("--sample", type=int, default=100, help="Query vectors used for warm-up and smoke check")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--max-p95-ms", type=float, default=50.0)
+    parser.add_argument("--keep", type=int, default=1, help="Previous generations kept (released) for rollback")
+    parser.add_argument("--migrate", action="store_true", help="Replace a plain collection of the same name by the alias")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    connections.connect(host=os.getenv("MILVUS_HOST", "standalone"), port=os.getenv("MILVUS_PORT", "19530"))
+    for name in args.collections:
+        if args.export:
+            export_snapshot(name, collections_info[name]["sql"], args.snapshot_dir)
+        rebuild(name, args.snapshot_dir, args.index_params or collections_info[name]["index_params"],
+                sample=args.sample, min_recall=args.min_recall, max_p95_ms=args.max_p95_ms,
+                keep=args.keep, migrate=args.migrate)
+
+
+if __name__ == "__main__":
+    main()